@@ -0,0 +1,13 @@
+"""
+Synthetic game-save workloads driven through the daemon.
+
+Every workload runs in a fresh interpreter so peak RSS and thread counts
+are its own. Run all of them with
+
+    python -m benchmarks
+
+or pick some and compare against a previous run to catch regressions
+
+    python -m benchmarks tiny_files burst_autosave --output run.json
+    python -m benchmarks --baseline run.json --tolerance 0.25
+"""
@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from benchmarks.report import compare, format_table
+from benchmarks.workloads import WORKLOADS
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Run synthetic game-save workloads against the daemon",
+    )
+    parser.add_argument(
+        "workloads",
+        nargs="*",
+        help=f"Workloads to run, all by default: {', '.join(WORKLOADS)}",
+    )
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.5,
+        help="Event debounce in seconds, the save cooldown is disabled",
+    )
+    parser.add_argument("--settle-timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--baseline", help="Results JSON to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed relative increase before a metric counts as regressed",
+    )
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    for name in args.workloads:
+        if name not in WORKLOADS:
+            parser.error(f"unknown workload '{name}'")
+    return args
+
+
+def run_child(args) -> None:
+    # Imported here so the parent process never loads the daemon
+    from benchmarks.harness import run_workload
+
+    result = run_workload(
+        args.child,
+        scale=args.scale,
+        debounce=args.debounce,
+        settle_timeout=args.settle_timeout,
+    )
+    with open(args.result_file, "w") as file:
+        json.dump(result, file)
+
+
+def run_isolated(name: str, args) -> dict:
+    """Run a workload in a fresh interpreter so its resources are its own"""
+    with tempfile.TemporaryDirectory() as tmp:
+        result_file = os.path.join(tmp, "result.json")
+        command = [
+            sys.executable,
+            "-m",
+            "benchmarks",
+            "--child",
+            name,
+            "--result-file",
+            result_file,
+            "--scale",
+            str(args.scale),
+            "--debounce",
+            str(args.debounce),
+            "--settle-timeout",
+            str(args.settle_timeout),
+        ]
+        environment = dict(os.environ, LOG_LEVEL="WARNING")
+        subprocess.run(command, check=True, env=environment)
+        with open(result_file, "r") as file:
+            return json.load(file)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.child:
+        run_child(args)
+        return 0
+
+    results = []
+    for name in args.workloads or list(WORKLOADS):
+        print(f"Running {name}: {WORKLOADS[name].description}", flush=True)
+        results.append(run_isolated(name, args))
+
+    print()
+    print(format_table(results))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.report import percentiles
+
+
+# Modules a client command must not import, each costs tens of ms
+HEAVY_MODULES = ("pydantic", "pydantic_settings", "watchdog", "src.settings")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.cli_startup",
+        description="Time CLI client calls against a running daemon",
+    )
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--command", default="status")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=50.0,
+        help="Fail if the median call takes longer",
+    )
+    parser.add_argument("--startup-timeout", type=float, default=30.0)
+    return parser.parse_args(argv)
+
+
+def start_daemon(workdir: str, timeout: float) -> subprocess.Popen:
+    """Daemon with empty metadata, all its files inside workdir"""
+    environment = dict(os.environ, PYTHONPATH=ROOT, LOG_LEVEL="WARNING")
+    daemon = subprocess.Popen(
+        [sys.executable, "-m", "src", "daemon"], cwd=workdir, env=environment
+    )
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(os.path.join(workdir, "daemon.json")):
+        if daemon.poll() is not None or time.monotonic() > deadline:
+            daemon.kill()
+            raise RuntimeError("Daemon did not come up")
+        time.sleep(0.05)
+    return daemon
+
+
+def imported_modules(command, workdir: str, environment) -> set:
+    """Top level modules loaded by one call, from -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "src"] + command,
+        cwd=workdir,
+        env=environment,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    modules = set()
+    for line in result.stderr.decode().splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|", 1)[1].strip())
+    return modules
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    command = args.command.split()
+    with tempfile.TemporaryDirectory() as workdir:
+        daemon = start_daemon(workdir, args.startup_timeout)
+        environment = dict(os.environ, PYTHONPATH=ROOT)
+        try:
+            samples = []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                subprocess.run(
+                    [sys.executable, "-m", "src"] + command,
+                    cwd=workdir,
+                    env=environment,
+                    stdout=subprocess.DEVNULL,
+                    check=True,
+                )
+                samples.append(time.perf_counter() - started)
+            modules = imported_modules(command, workdir, environment)
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+    stats = percentiles(samples)
+    print(
+        f"gamesave {args.command}: "
+        + ", ".join(f"{k} {v * 1000:.1f}ms" for k, v in stats.items())
+    )
+    heavy = sorted(
+        module
+        for module in modules
+        if any(
+            module == name or module.startswith(name + ".")
+            for name in HEAVY_MODULES
+        )
+    )
+    failed = False
+    if heavy:
+        print(f"Imported daemon modules: {', '.join(heavy)}")
+        failed = True
+    if stats["p50"] * 1000 > args.budget_ms:
+        print(f"Median over the {args.budget_ms:.0f}ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from benchmarks.report import percentiles
+from benchmarks.workloads import WORKLOADS, Workload
+from src.core.controller import DirectoryController
+from src.core.event_queue import ChangeSet
+from src.core.snapshot import SnapshotJob
+from src.git_utils import push_branch
+from src.models.tracked_directory import TrackedDirectory
+from src.settings import settings
+
+
+class LatencyRecorder:
+    """
+    Pairs finished writes with the snapshot that picked them up. A write
+    counts as saved by the first snapshot that started after it, since the
+    snapshot diffs the directory as it is when it starts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: List[float] = []
+        self.latencies: List[float] = []
+        self.writes = 0
+
+    def record(self, path: str) -> None:
+        with self._lock:
+            self._pending.append(time.monotonic())
+            self.writes += 1
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def saved(self, started: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            covered = [when for when in self._pending if when <= started]
+            self._pending = [when for when in self._pending if when > started]
+        self.latencies.extend(now - when for when in covered)
+
+
+class ResourceSampler:
+    """Background sampler of the peak thread count"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_threads = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> "ResourceSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            # The sampler itself is not part of the daemon
+            count = threading.active_count() - 1
+            self.peak_threads = max(self.peak_threads, count)
+
+
+def peak_rss_bytes() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def commit_count(path: str) -> int:
+    result = subprocess.run(
+        ["git", "-C", path, "rev-list", "--count", "HEAD"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    return int(result.stdout.strip() or 0)
+
+
+def run_workload(
+    name: str,
+    scale: float = 1.0,
+    debounce: float = 0.5,
+    settle_timeout: float = 60.0,
+) -> Dict[str, Any]:
+    """Drive one workload through a live controller and measure it"""
+    workload: Workload = WORKLOADS[name](scale=scale)
+
+    with tempfile.TemporaryDirectory(prefix=f"gamesave-{name}-") as tmp:
+        root = os.path.join(tmp, "saves")
+        remote = os.path.join(tmp, "remote.git")
+        os.makedirs(root)
+        subprocess.run(
+            ["git", "init", "-q", "--bare", remote],
+            check=True,
+            stdout=subprocess.PIPE,
+        )
+
+        settings.metadata.storage_filepath = os.path.join(tmp, "metadata.json")
+        settings.save_state.event_debounce_sec = debounce
+        settings.save_state.limit_save_intervals = False
+
+        workload.prepare(root)
+        directory = TrackedDirectory(
+            name=name, path=root, **workload.directory_options
+        )
+        controller = DirectoryController(directories=[directory])
+
+        # Import the initial files before measuring anything. The pool is
+        # not started yet, so the job runs here rather than being queued
+        controller._run_snapshot_job(
+            SnapshotJob(directory, ChangeSet(full_rescan=True))
+        )
+        initial_commits = commit_count(root)
+        initial_size = directory_size(os.path.join(root, ".git"))
+        initial_bytes = workload.bytes_written
+
+        recorder = LatencyRecorder()
+        run_job = controller.snapshot_pool.run
+
+        def measured_job(job: SnapshotJob) -> None:
+            # Writes count as saved once the job that picked them up is
+            # committed, not when the handler hands the job off
+            started = time.monotonic()
+            run_job(job)
+            recorder.saved(started)
+
+        controller.snapshot_pool.run = measured_job
+
+        with ResourceSampler() as sampler:
+            controller.start_all()
+            started = time.monotonic()
+            workload.run(root, recorder.record)
+            deadline = time.monotonic() + settle_timeout
+            while recorder.pending() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            duration = time.monotonic() - started
+            controller.stop_all()
+
+        commits = commit_count(root) - initial_commits
+        push_started = time.monotonic()
+        push_branch(root, remote, settings.git.master_branch, name)
+        push_sec = time.monotonic() - push_started
+
+        return {
+            "workload": name,
+            "scale": scale,
+            "writes": recorder.writes,
+            "unsaved_writes": recorder.pending(),
+            "commits": commits,
+            "duration_sec": round(duration, 3),
+            "commits_per_sec": round(commits / duration, 3),
+            "latency_ms": {
+                key: round(value * 1000, 1)
+                for key, value in percentiles(recorder.latencies).items()
+            },
+            "bytes_written": workload.bytes_written - initial_bytes,
+            "repository_bytes": directory_size(os.path.join(root, ".git"))
+            - initial_size,
+            "push_sec": round(push_sec, 3),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "peak_threads": sampler.peak_threads,
+        }
@@ -0,0 +1,121 @@
+from typing import Any, Dict, List
+
+
+# Metrics compared against a baseline, all of them lower is better
+REGRESSION_METRICS = (
+    ("latency_ms", "p95"),
+    ("latency_ms", "max"),
+    ("repository_bytes", None),
+    ("peak_rss_bytes", None),
+    ("peak_threads", None),
+)
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """p50/p90/p95/p99/max of a sample, linearly interpolated"""
+    if not values:
+        return dict()
+    ordered = sorted(values)
+    result = dict()
+    for label, quantile in (
+        ("p50", 0.50),
+        ("p90", 0.90),
+        ("p95", 0.95),
+        ("p99", 0.99),
+    ):
+        position = quantile * (len(ordered) - 1)
+        lower = int(position)
+        upper = min(lower + 1, len(ordered) - 1)
+        weight = position - lower
+        result[label] = ordered[lower] * (1 - weight) + ordered[upper] * weight
+    result["max"] = ordered[-1]
+    return result
+
+
+def _metric(result: Dict[str, Any], key: str, sub_key=None):
+    value = result.get(key)
+    if sub_key is not None and isinstance(value, dict):
+        value = value.get(sub_key)
+    return value
+
+
+def _human_bytes(value) -> str:
+    if value is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB"):
+        if abs(value) < 1024:
+            return f"{value:.0f}{unit}"
+        value /= 1024
+    return f"{value:.1f}GiB"
+
+
+def format_table(results: List[Dict[str, Any]]) -> str:
+    headers = (
+        "workload",
+        "writes",
+        "commits",
+        "commit/s",
+        "p50 ms",
+        "p95 ms",
+        "p99 ms",
+        "written",
+        "repo",
+        "push s",
+        "rss",
+        "threads",
+    )
+    rows = [headers]
+    for result in results:
+        latency = result.get("latency_ms", dict())
+        rows.append(
+            (
+                result["workload"],
+                str(result["writes"]),
+                str(result["commits"]),
+                f"{result['commits_per_sec']:.2f}",
+                f"{latency.get('p50', 0):.0f}",
+                f"{latency.get('p95', 0):.0f}",
+                f"{latency.get('p99', 0):.0f}",
+                _human_bytes(result["bytes_written"]),
+                _human_bytes(result["repository_bytes"]),
+                f"{result['push_sec']:.2f}",
+                _human_bytes(result["peak_rss_bytes"]),
+                str(result["peak_threads"]),
+            )
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(headers))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths))
+        for row in rows
+    )
+
+
+def compare(
+    results: List[Dict[str, Any]],
+    baseline: List[Dict[str, Any]],
+    tolerance: float,
+) -> List[str]:
+    """Human readable regressions of results relative to a baseline"""
+    previous = {result["workload"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        reference = previous.get(result["workload"])
+        if reference is None:
+            continue
+        if result.get("unsaved_writes"):
+            regressions.append(
+                f"{result['workload']}: {result['unsaved_writes']} writes \
+were never saved"
+            )
+        for key, sub_key in REGRESSION_METRICS:
+            current = _metric(result, key, sub_key)
+            before = _metric(reference, key, sub_key)
+            if not current or not before:
+                continue
+            if current > before * (1 + tolerance):
+                label = f"{key}.{sub_key}" if sub_key else key
+                regressions.append(
+                    f"{result['workload']}: {label} {before} -> {current} \
+(+{(current / before - 1) * 100:.0f}%)"
+                )
+    return regressions
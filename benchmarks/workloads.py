@@ -0,0 +1,163 @@
+import json
+import os
+import random
+import time
+from typing import Any, Callable, Dict
+
+
+class Workload:
+    """
+    A synthetic save pattern. prepare() lays down the initial files before
+    the daemon starts, run() then mutates them while it is watching and
+    reports every finished write through record(path).
+    """
+
+    name: str = ""
+    description: str = ""
+    # Extra TrackedDirectory fields for the directory under test
+    directory_options: Dict[str, Any] = dict()
+
+    def __init__(self, scale: float = 1.0, seed: int = 0):
+        self.scale = scale
+        self.random = random.Random(seed)
+        self.bytes_written = 0
+
+    def _count(self, value: int) -> int:
+        return max(1, int(value * self.scale))
+
+    def _write(self, path: str, data: bytes) -> None:
+        with open(path, "wb") as file:
+            file.write(data)
+        self.bytes_written += len(data)
+
+    def prepare(self, root: str) -> None:
+        raise NotImplementedError
+
+    def run(self, root: str, record: Callable[[str], None]) -> None:
+        raise NotImplementedError
+
+
+class TinyFiles(Workload):
+    """Many small JSON/ini files, a few of them rewritten per save"""
+
+    name = "tiny_files"
+    description = "2000 small json/ini files, 40 saves touching 25 each"
+
+    def _files(self):
+        return self._count(2000)
+
+    def _content(self, index: int) -> bytes:
+        if index % 2:
+            state = {
+                "slot": index,
+                "health": self.random.randint(0, 100),
+                "position": [self.random.random() for _ in range(3)],
+            }
+            return json.dumps(state).encode()
+        return (
+            f"[player]\nlevel={self.random.randint(1, 99)}\n"
+            f"gold={self.random.randint(0, 10**6)}\n"
+        ).encode()
+
+    def _path(self, root: str, index: int) -> str:
+        extension = "json" if index % 2 else "ini"
+        return os.path.join(
+            root, f"profile{index % 8}", f"slot{index}.{extension}"
+        )
+
+    def prepare(self, root: str) -> None:
+        for index in range(self._files()):
+            path = self._path(root, index)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._write(path, self._content(index))
+
+    def run(self, root: str, record: Callable[[str], None]) -> None:
+        files = self._files()
+        for _ in range(self._count(40)):
+            for index in self.random.sample(range(files), min(25, files)):
+                path = self._path(root, index)
+                self._write(path, self._content(index))
+                record(path)
+            time.sleep(0.25)
+
+
+class HugeBlobs(Workload):
+    """A few large binary files with small in-place modifications"""
+
+    name = "huge_blobs"
+    description = "3 x 48 MiB binary files, 6 saves patching 64 KiB each"
+    directory_options = {
+        "storage_mode": "chunked",
+        "chunk_threshold_bytes": 16 * 1024 * 1024,
+    }
+
+    def _size(self) -> int:
+        return self._count(48) * 1024 * 1024
+
+    def prepare(self, root: str) -> None:
+        block = self.random.randbytes(1024 * 1024)
+        for index in range(3):
+            path = os.path.join(root, f"world{index}.bin")
+            with open(path, "wb") as file:
+                for _ in range(self._size() // len(block)):
+                    file.write(block)
+            self.bytes_written += self._size()
+
+    def run(self, root: str, record: Callable[[str], None]) -> None:
+        for _ in range(6):
+            for index in range(3):
+                path = os.path.join(root, f"world{index}.bin")
+                patch = self.random.randbytes(64 * 1024)
+                offset = self.random.randrange(0, self._size() - len(patch))
+                with open(path, "r+b") as file:
+                    file.seek(offset)
+                    file.write(patch)
+                self.bytes_written += len(patch)
+                record(path)
+            time.sleep(1.5)
+
+
+class BurstAutosave(Workload):
+    """Rapid consecutive autosaves of the same handful of files"""
+
+    name = "burst_autosave"
+    description = "10 bursts of 50 rewrites of 4 files, 1s apart"
+
+    def prepare(self, root: str) -> None:
+        for index in range(4):
+            self._write(os.path.join(root, f"auto{index}.sav"), b"\0" * 4096)
+
+    def run(self, root: str, record: Callable[[str], None]) -> None:
+        for _ in range(self._count(10)):
+            for _ in range(50):
+                index = self.random.randrange(4)
+                path = os.path.join(root, f"auto{index}.sav")
+                self._write(path, self.random.randbytes(4096))
+                record(path)
+            time.sleep(1.0)
+
+
+class AtomicReplace(Workload):
+    """Saves written to a temporary file and renamed over the original"""
+
+    name = "atomic_replace"
+    description = "200 write-then-rename saves over 10 files"
+
+    def prepare(self, root: str) -> None:
+        for index in range(10):
+            self._write(os.path.join(root, f"save{index}.dat"), b"\0" * 16384)
+
+    def run(self, root: str, record: Callable[[str], None]) -> None:
+        for step in range(self._count(200)):
+            path = os.path.join(root, f"save{step % 10}.dat")
+            temporary = f"{path}.tmp"
+            self._write(temporary, self.random.randbytes(16384))
+            os.replace(temporary, path)
+            record(path)
+            time.sleep(0.02)
+
+
+WORKLOADS: Dict[str, type] = {
+    workload.name: workload
+    for workload in (TinyFiles, HugeBlobs, BurstAutosave, AtomicReplace)
+}
@@ -0,0 +1,272 @@
+import json
+import os
+import sys
+from src.client import request
+from src.exceptions import ControllerCallError, ControlServerError
+
+
+# Commands that only talk to the daemon import nothing beyond the client.
+# Launcher hooks call them in tight loops, interpreter start and imports
+# are most of their cost, see benchmarks/cli_startup.py for the budget.
+# Plain calls do not even load argparse, which alone takes longer than
+# the request itself.
+
+# command -> (control method, help, takes a directory)
+_CALLS = {
+    "status": ("status", "Show the daemon and every tracked directory", False),
+    "list": ("list", "List tracked directories", False),
+    "metrics": ("metrics", "Print metrics in the Prometheus format", False),
+    "remove": ("remove", "Stop tracking a directory", True),
+    "pause": ("pause", "Stop saving a directory until resumed", True),
+    "resume": ("resume", "Resume saving a paused directory", True),
+    "save": ("save", "Save a snapshot right away", True),
+    "compact": ("compact", "Prune snapshots and repack a repository", True),
+}
+
+
+def _directory(value: str) -> dict:
+    """A directory is addressed by its path if one exists, else by name"""
+    if os.path.isdir(value):
+        return {"path": os.path.abspath(value)}
+    return {"name": value}
+
+
+class _Args:
+    def __init__(self, command: str, json: bool = False, **values):
+        self.command = command
+        self.json = json
+        self.__dict__.update(values)
+
+
+def _quick_args(argv):
+    """Arguments of a plain daemon call, None for anything argparse needs"""
+    argv = list(argv)
+    as_json = bool(argv) and argv[0] == "--json"
+    if as_json:
+        argv.pop(0)
+    if not argv or any(arg.startswith("-") for arg in argv):
+        return None
+    command, operands = argv[0], argv[1:]
+    if command in _CALLS:
+        if len(operands) != int(_CALLS[command][2]):
+            return None
+        return _Args(command, as_json, directory=next(iter(operands), None))
+    if command == "restore" and len(operands) == 2:
+        return _Args(
+            command, as_json, directory=operands[0], rev=operands[1]
+        )
+    if command == "sync" and len(operands) == 1:
+        return _Args(command, as_json, directory=operands[0], remote=None)
+    if command == "history" and len(operands) == 1:
+        return _Args(command, as_json, directory=operands[0])
+    if command == "push" and len(operands) <= 1:
+        return _Args(command, as_json, directory=next(iter(operands), None))
+    return None
+
+
+def parse_args(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="gamesave",
+        description="Control the gamesave-cloud daemon",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print raw JSON results"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command, (_, help, directory) in _CALLS.items():
+        sub = commands.add_parser(command, help=help)
+        if directory:
+            sub.add_argument(
+                "directory", help="Tracked directory name or path"
+            )
+
+    add = commands.add_parser("add", help="Start tracking a directory")
+    add.add_argument("path")
+    add.add_argument("--name", help="Defaults to the directory name")
+
+    restore = commands.add_parser(
+        "restore", help="Bring a directory back to a snapshot"
+    )
+    restore.add_argument("directory", help="Tracked directory name or path")
+    restore.add_argument("rev", help="Snapshot commit or revision")
+
+    push = commands.add_parser("push", help="Push unpushed snapshots now")
+    push.add_argument(
+        "directory", nargs="?", help="Only this directory, all by default"
+    )
+
+    sync = commands.add_parser(
+        "sync", help="Bring a directory up to date from a remote"
+    )
+    sync.add_argument("directory", help="Tracked directory name or path")
+    sync.add_argument("--remote", help="Remote url, the first by default")
+    sync.add_argument(
+        "--prefer-remote",
+        action="store_true",
+        help="Replace diverged local snapshots, they are kept under a ref",
+    )
+
+    history = commands.add_parser(
+        "history", help="List the snapshots of a directory, newest first"
+    )
+    history.add_argument("directory", help="Tracked directory name or path")
+    history.add_argument(
+        "--file", help="Only snapshots changing this file, relative path"
+    )
+    history.add_argument("--since", help="ISO 8601 time, UTC by default")
+    history.add_argument("--until", help="ISO 8601 time, UTC by default")
+    history.add_argument("--limit", type=int, help="Snapshots per page")
+    history.add_argument(
+        "--before", type=int, help="Page cursor printed by the previous call"
+    )
+
+    commands.add_parser("daemon", help="Run the daemon in the foreground")
+    return parser.parse_args(argv)
+
+
+def _call(args):
+    if args.command in _CALLS:
+        method, _, directory = _CALLS[args.command]
+        params = _directory(args.directory) if directory else None
+        return request(method, params)
+    if args.command == "add":
+        path = os.path.abspath(args.path)
+        name = args.name or os.path.basename(path.rstrip(os.sep))
+        return request("add", {"path": path, "name": name})
+    if args.command == "restore":
+        params = dict(_directory(args.directory), rev=args.rev)
+        return request("restore", params)
+    if args.command == "sync":
+        params = _directory(args.directory)
+        if args.remote:
+            params["remote"] = args.remote
+        if getattr(args, "prefer_remote", False):
+            params["prefer_remote"] = True
+        return request("sync", params)
+    if args.command == "history":
+        params = _directory(args.directory)
+        for key in ("file", "since", "until", "limit", "before"):
+            if getattr(args, key, None) is not None:
+                params[key] = getattr(args, key)
+        return request("history", params)
+    if args.command == "push":
+        return request(
+            "push", _directory(args.directory) if args.directory else None
+        )
+    raise ValueError(f"Unknown command {args.command}")
+
+
+def _print_status(status: dict) -> None:
+    print(f"gamesave-cloud {status.get('version')}: {status['status']}")
+    for directory in status["directories"]:
+        if directory["paused"]:
+            state = "paused"
+        elif directory["watching"]:
+            state = "watching"
+        else:
+            state = "stopped"
+        line = (
+            f"  {directory['name']}: {state}, "
+            f"{directory['pending']} pending, "
+            f"last saved {directory['last_save_time'] or 'never'}"
+        )
+        if directory.get("push_lag_sec") is not None:
+            line += f", push lag {directory['push_lag_sec']:.0f}s"
+        print(line)
+
+
+def run_daemon() -> int:
+    # Imported here so client commands never load the daemon
+    import signal
+    import threading
+    from src.core.control_server import ControlServer
+    from src.core.controller import DirectoryController
+    from src.models.metadata import Metadata
+    from src.settings import settings
+
+    metadata = Metadata(path=settings.metadata.storage_filepath)
+    controller = DirectoryController(metadata=metadata)
+    server = ControlServer(controller)
+    stopping = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopping.set())
+
+    controller.start_all()
+    server.start()
+    try:
+        # Waking up now and then lets signals through on every platform
+        while not stopping.wait(1.0):
+            pass
+    finally:
+        server.stop()
+        controller.stop_all()
+    return 0
+
+
+def _print_sync(result: dict) -> None:
+    state = result["state"]
+    if "written" in result:
+        state += (
+            f": {result['written']} written, {result['removed']} removed, "
+            f"{result['unchanged']} unchanged"
+        )
+    print(state)
+    if result.get("backup"):
+        print(f"previous snapshots kept at {result['backup']}")
+
+
+def _print_history(page: dict) -> None:
+    for snapshot in page["snapshots"]:
+        line = f"{snapshot['id'][:12]}  {snapshot['time']}  "
+        if snapshot.get("deleted"):
+            line += "deleted"
+        elif "size" in snapshot:
+            line += f"{snapshot['size']} bytes"
+        else:
+            line += (
+                f"{snapshot['files_changed']} files, "
+                f"{snapshot['bytes_added']} bytes"
+            )
+        print(f"{line}  {snapshot['reason'] or ''}".rstrip())
+    if page["next"] is not None:
+        print(f"more: --before {page['next']}")
+
+
+def main(argv=None) -> int:
+    if argv is None:
+        argv = sys.argv[1:]
+    args = _quick_args(argv) or parse_args(argv)
+    if args.command == "daemon":
+        return run_daemon()
+
+    try:
+        result = _call(args)
+    except ControlServerError as ex:
+        print(f"gamesave: {ex}", file=sys.stderr)
+        return 2
+    except ControllerCallError as ex:
+        print(f"gamesave: {ex}", file=sys.stderr)
+        return 1
+    if args.command == "sync" and result["state"] == "diverged":
+        print(
+            "gamesave: local and remote snapshots diverged, "
+            "use --prefer-remote to replace the local ones",
+            file=sys.stderr,
+        )
+        return 3
+
+    if args.json:
+        print(json.dumps(result, indent=4))
+    elif args.command == "status":
+        _print_status(result)
+    elif args.command == "sync":
+        _print_sync(result)
+    elif args.command == "history":
+        _print_history(result)
+    elif isinstance(result, str):
+        print(result, end="")
+    elif result is not None:
+        print(json.dumps(result, indent=4))
+    return 0
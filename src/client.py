@@ -0,0 +1,77 @@
+import json
+import os
+import socket
+from src.constraints import (
+    DAEMON_DISCOVERY_FILEPATH,
+    DEFAULT_DAEMON_REQUEST_TIMEOUT_SEC,
+)
+from src.exceptions import ControllerCallError, ControlServerError
+
+
+# Client side of the control protocol. Only the standard library is used
+# here, so a command line call does not pay for importing pydantic,
+# watchdog or the models before it can talk to the daemon. Even typing
+# is left out, builtin generics cover the annotations.
+
+
+def _setting(name: str, default: object) -> object:
+    """
+    Daemon setting as the settings module would resolve it, from a
+    case-insensitive environment variable or the default
+    """
+    for key, value in os.environ.items():
+        if key.lower() == name:
+            return type(default)(value)
+    return default
+
+
+def request(
+    method: str,
+    params: dict | None = None,
+    discovery_path: str | None = None,
+) -> object:
+    """Call a method of the running daemon and return its result"""
+    discovery_path = discovery_path or _setting(
+        "discovery_filepath", DAEMON_DISCOVERY_FILEPATH
+    )
+    try:
+        with open(discovery_path, "r") as file:
+            discovery = json.load(file)
+    except (OSError, ValueError) as ex:
+        raise ControlServerError(f"Daemon is not running: {ex}")
+
+    if discovery["transport"] == "unix":
+        family, address = socket.AF_UNIX, discovery["path"]
+    else:
+        family, address = socket.AF_INET, (
+            discovery["host"],
+            discovery["port"],
+        )
+
+    message = {
+        "id": 1,
+        "method": method,
+        "params": params or dict(),
+        "token": discovery["token"],
+    }
+    try:
+        with socket.socket(family, socket.SOCK_STREAM) as connection:
+            connection.settimeout(
+                _setting(
+                    "request_timeout_sec", DEFAULT_DAEMON_REQUEST_TIMEOUT_SEC
+                )
+            )
+            connection.connect(address)
+            connection.sendall(json.dumps(message).encode() + b"\n")
+            with connection.makefile("rb") as stream:
+                line = stream.readline()
+    except OSError as ex:
+        raise ControlServerError(f"Failed to reach the daemon: {ex}")
+    if not line:
+        raise ControlServerError("Daemon closed the connection")
+
+    response = json.loads(line)
+    if "error" in response:
+        error = response["error"]
+        raise ControllerCallError(f"{error['type']}: {error['message']}")
+    return response.get("result")
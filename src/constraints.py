@@ -1,8 +1,85 @@
 METADATA_STORAGE_FILEPATH = "./metadata.json"
 DEFAULT_LOG_LEVEL = "INFO"
+DEFAULT_EVENT_LOG_INTERVAL_SEC = 2.0
 DEFAULT_LIMIT_SAVE_INTERVALS = True
 DEFAULT_SAVE_COOLDOWN_SEC = 300
 DEFAULT_MASTER_BRANCH = "master"
 APP_VERSION = "0.1.0"
-DAEMON_PORT_RANGE_MIN = 1024
-DAEMON_PORT_RANGE_MAX = 49151
+DAEMON_SOCKET_FILEPATH = "./gamesave-cloud.sock"
+DAEMON_DISCOVERY_FILEPATH = "./daemon.json"
+DEFAULT_DAEMON_UNIX_SOCKET = True
+DAEMON_TCP_HOST = "127.0.0.1"
+DEFAULT_DAEMON_REQUEST_TIMEOUT_SEC = 30.0
+DEFAULT_EVENT_QUEUE_MAX_PATHS = 10000
+DEFAULT_EVENT_DEBOUNCE_SEC = 2.0
+DEFAULT_SETTLE_SAVES = True
+DEFAULT_SETTLE_GRACE_SEC = 1.0
+DEFAULT_SNAPSHOT_WORKERS = 4
+DEFAULT_SNAPSHOT_QUEUE_MAX = 64
+DEFAULT_SNAPSHOT_RETRY_SEC = 5.0
+DEFAULT_GIT_AUTHOR_NAME = "gamesave-cloud"
+DEFAULT_GIT_AUTHOR_EMAIL = "gamesave-cloud@localhost"
+GIT_DIRECTORY_NAME = ".git"
+DEFAULT_SHARED_OBSERVER = True
+DEFAULT_OBSERVER_POOL_SIZE = 1
+MANIFEST_DIRECTORY = "./manifests"
+MANIFEST_FILE_SUFFIX = ".manifest.sqlite"
+HISTORY_FILE_SUFFIX = ".history.sqlite"
+DEFAULT_GIT_PERSISTENT_BACKEND = True
+CHUNK_STORE_DIRECTORY = ".gamesave-chunks"
+OBJECT_STORE_REF_PREFIX = "refs/directories"
+DEFAULT_CHUNK_THRESHOLD_BYTES = 64 * 1024 * 1024
+DEFAULT_CHUNK_MIN_BYTES = 256 * 1024
+DEFAULT_CHUNK_AVG_BYTES = 1024 * 1024
+DEFAULT_CHUNK_MAX_BYTES = 4 * 1024 * 1024
+DEFAULT_CHUNK_FIXED_ABOVE_BYTES = 256 * 1024 * 1024
+DEFAULT_STREAM_BUFFER_BYTES = 1024 * 1024
+DEFAULT_STREAM_THRESHOLD_BYTES = 16 * 1024 * 1024
+DEFAULT_MAX_LARGE_INGESTS = 2
+METADATA_JOURNAL_SUFFIX = ".journal"
+DEFAULT_JOURNAL_COMPACT_RECORDS = 1000
+DEFAULT_RECONCILE_ON_START = True
+DEFAULT_RECONCILE_WORKERS = 8
+DEFAULT_METRICS_TEXTFILE_INTERVAL_SEC = 15.0
+DEFAULT_EXCLUDE_PATTERNS = [
+    "*.tmp",
+    "*.temp",
+    "*.bak",
+    "*.lock",
+    "*.log",
+    "*~",
+    ".DS_Store",
+    "Thumbs.db",
+    "desktop.ini",
+    "[Ss]hader[Cc]ache/",
+]
+DEFAULT_POLL_MIN_INTERVAL_SEC = 1.0
+DEFAULT_POLL_MAX_INTERVAL_SEC = 30.0
+DEFAULT_POLL_BACKOFF = 2.0
+
+DEFAULT_RESTORE_WORKERS = 8
+DEFAULT_RESTORE_STAGED = True
+
+DEFAULT_RETENTION_KEEP_ALL_HOURS = 6
+DEFAULT_RETENTION_HOURLY_HOURS = 48
+DEFAULT_RETENTION_DAILY_DAYS = 30
+DEFAULT_RETENTION_WEEKLY_WEEKS = 12
+DEFAULT_RETENTION_MONTHLY_MONTHS = 12
+DEFAULT_MAINTENANCE_ENABLED = True
+DEFAULT_MAINTENANCE_INTERVAL_SEC = 3600.0
+DEFAULT_MAINTENANCE_IDLE_SEC = 900.0
+GIT_REWRITE_REF = "refs/gamesave/rewrite"
+GIT_REMOTE_REF_PREFIX = "refs/gamesave/remotes"
+GIT_DIVERGED_REF_PREFIX = "refs/gamesave/diverged"
+DEFAULT_SYNC_STAGED = False
+DEFAULT_SYNC_DEEPEN = 50
+DEFAULT_HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 1000
+
+PUSH_OUTBOX_FILEPATH = "./push-outbox.json"
+DEFAULT_PUSH_ENABLED = True
+DEFAULT_PUSH_BATCH_DELAY_SEC = 30.0
+DEFAULT_PUSH_WORKERS = 4
+DEFAULT_PUSH_REMOTE_CONCURRENCY = 2
+DEFAULT_PUSH_RETRY_MIN_SEC = 10.0
+DEFAULT_PUSH_RETRY_MAX_SEC = 1800.0
@@ -0,0 +1,225 @@
+import hashlib
+import mmap
+import os
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+from src.constraints import CHUNK_STORE_DIRECTORY
+
+
+CHUNK_MANIFEST_MAGIC = b"gamesave-cloud chunked file v1\n"
+
+# Gear rolling hash: each byte shifts the hash left and adds a random
+# value for it, so the top bits depend on the last _WINDOW_SIZE bytes only
+# and boundaries follow the content, surviving insertions and removals.
+# The table is derived from a fixed seed, boundaries must not change
+# between runs or the chunks of unchanged regions would not be shared.
+_WINDOW_SIZE = 32
+_HASH_MASK = (1 << _WINDOW_SIZE) - 1
+_GEAR = tuple(
+    int.from_bytes(hashlib.sha256(b"gear %d" % byte).digest()[:4], "big")
+    for byte in range(256)
+)
+
+
+def _cut_masks(min_size: int, avg_size: int) -> Tuple[int, int]:
+    """
+    Masks of the top hash bits tested before and after the average size.
+    Normalized chunking: one bit more is required before the average and
+    one less after it, which keeps chunk sizes close to the average.
+    """
+    bits = max(2, max(1, avg_size - min_size).bit_length() - 1)
+    bits = min(bits, _WINDOW_SIZE - 1)
+
+    def top(count: int) -> int:
+        return ((1 << count) - 1) << (_WINDOW_SIZE - count)
+
+    return top(bits + 1), top(bits - 1)
+
+
+def _find_cut(data, begin: int, end: int, mask: int, h: int):
+    """First cut point in (begin, end] and the hash there, -1 if none"""
+    gear = _GEAR
+    for offset, byte in enumerate(data[begin:end], begin + 1):
+        h = ((h << 1) + gear[byte]) & _HASH_MASK
+        if not h & mask:
+            return offset, h
+    return -1, h
+
+
+def chunk_boundaries(
+    data, min_size: int, avg_size: int, max_size: int
+) -> Iterator[Tuple[int, int]]:
+    """Yield (offset, length) of content-defined chunks covering data"""
+    length = len(data)
+    strict, loose = _cut_masks(min_size, avg_size)
+    start = 0
+
+    while length - start > min_size:
+        limit = min(start + max_size, length)
+        normal = min(start + avg_size, limit)
+        # Bytes before the minimum size only fill the hash window
+        h = 0
+        warm = max(start, start + min_size - _WINDOW_SIZE)
+        for byte in data[warm : start + min_size]:
+            h = ((h << 1) + _GEAR[byte]) & _HASH_MASK
+        cut, h = _find_cut(data, start + min_size, normal, strict, h)
+        if cut < 0:
+            cut, h = _find_cut(data, normal, limit, loose, h)
+        if cut < 0:
+            cut = limit
+        yield start, cut - start
+        start = cut
+
+    if start < length:
+        yield start, length - start
+
+
+def fixed_boundaries(length: int, size: int) -> Iterator[Tuple[int, int]]:
+    """Yield (offset, length) of chunks of a fixed size covering length"""
+    for start in range(0, length, size):
+        yield start, min(size, length - start)
+
+
+class ChunkingPolicy:
+    """
+    Which files are stored chunked and how they are split.
+
+    The content-defined boundary search hashes every byte from the
+    minimum chunk size on in Python, about 8 MB/s of file content with
+    the default sizes, e.g. close to 30 s for a 256 MB file. Files above
+    fixed_above are cut every avg_size bytes instead, which costs nothing
+    but only shares chunks with versions edited in place, not with ones
+    where data was inserted or removed.
+    """
+
+    threshold: int
+    min_size: int
+    avg_size: int
+    max_size: int
+    fixed_above: Optional[int]
+
+    def __init__(
+        self,
+        threshold: int,
+        min_size: int,
+        avg_size: int,
+        max_size: int,
+        fixed_above: Optional[int] = None,
+    ):
+        if not 0 < min_size <= avg_size <= max_size:
+            raise ValueError("Chunk sizes must satisfy min <= avg <= max")
+        self.threshold = threshold
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        self.fixed_above = fixed_above
+
+    def applies_to(self, size: int) -> bool:
+        return size >= self.threshold
+
+    def bounds(self) -> Tuple[int, int, int]:
+        return (self.min_size, self.avg_size, self.max_size)
+
+
+def blob_id(data: bytes) -> str:
+    digest = hashlib.sha1(b"blob %d\0" % len(data))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def chunk_store_path(relative: str) -> str:
+    """Tree path holding the chunks of a chunked file"""
+    return "/".join([CHUNK_STORE_DIRECTORY, relative.replace(os.sep, "/")])
+
+
+def chunk_entry_path(relative: str, index: int) -> str:
+    return f"{chunk_store_path(relative)}/{index:08d}"
+
+
+class ChunkedFile:
+    """
+    Memory-mapped view of a file split into content-defined chunks.
+    Chunks are sliced from the mapping one at a time, so memory use is
+    bounded by the maximum chunk size rather than the file size.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        min_size: int,
+        avg_size: int,
+        max_size: int,
+        fixed_above: Optional[int] = None,
+    ):
+        self.path = path
+        self._file = open(path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._map: Optional[mmap.mmap] = None
+        if self.size:
+            self._map = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        self._bounds = (min_size, avg_size, max_size)
+        self._fixed = fixed_above is not None and self.size > fixed_above
+
+    def __enter__(self) -> "ChunkedFile":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def chunks(self) -> Iterator[bytes]:
+        if self._map is None:
+            return
+        if self._fixed:
+            boundaries = fixed_boundaries(self.size, self._bounds[1])
+        else:
+            boundaries = chunk_boundaries(self._map, *self._bounds)
+        for offset, length in boundaries:
+            yield self._map[offset : offset + length]
+
+
+def build_chunk_manifest(size: int, chunks: List[Tuple[str, int]]) -> bytes:
+    """Small text blob committed in place of a chunked file"""
+    lines = [f"size {size}"] + [f"{oid} {length}" for oid, length in chunks]
+    return CHUNK_MANIFEST_MAGIC + ("\n".join(lines) + "\n").encode()
+
+
+def is_chunk_manifest(data: bytes) -> bool:
+    return data.startswith(CHUNK_MANIFEST_MAGIC)
+
+
+def parse_chunk_manifest(data: bytes) -> Tuple[int, List[Tuple[str, int]]]:
+    """Total size and (blob id, length) of every chunk"""
+    if not is_chunk_manifest(data):
+        raise ValueError("Not a chunk manifest")
+    lines = data[len(CHUNK_MANIFEST_MAGIC) :].decode().splitlines()
+    size = int(lines[0].split()[1])
+    chunks = []
+    for line in lines[1:]:
+        oid, length = line.split()
+        chunks.append((oid, int(length)))
+    return size, chunks
+
+
+def reassemble(manifest: bytes, read_blob, out: BinaryIO) -> int:
+    """
+    Write the original content described by a chunk manifest to out,
+    fetching chunks through read_blob(oid) -> bytes. Returns bytes written.
+    """
+    size, chunks = parse_chunk_manifest(manifest)
+    written = 0
+    for oid, length in chunks:
+        data = read_blob(oid)
+        if len(data) != length:
+            raise ValueError(f"Chunk {oid} has unexpected length")
+        out.write(data)
+        written += length
+    if written != size:
+        raise ValueError("Reassembled size does not match the manifest")
+    return written
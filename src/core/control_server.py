@@ -0,0 +1,338 @@
+import asyncio
+import hmac
+import json
+import os
+import secrets
+import socket
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Set
+from src.constraints import APP_VERSION, DAEMON_TCP_HOST
+from src.core.controller import DirectoryController, Status
+from src.exceptions import ControllerCallError, ControlServerError
+from src.models.tracked_directory import TrackedDirectory
+from src.settings import settings
+from src.utils import atomic_write
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+class ControlServer:
+    """
+    Control endpoint of the daemon. Clients exchange newline-delimited
+    JSON over a Unix domain socket, or over a loopback TCP socket on an
+    OS-assigned port where Unix sockets are unavailable. Either way the
+    address and an access token are published in a discovery file, so
+    clients connect directly without probing for the daemon.
+
+    Requests are served by an asyncio loop on its own thread, controller
+    calls run on the loop executor and never on the observer threads.
+    """
+
+    def __init__(
+        self,
+        controller: DirectoryController,
+        socket_path: Optional[str] = None,
+        discovery_path: Optional[str] = None,
+    ):
+        self.controller = controller
+        self.socket_path = os.path.abspath(
+            socket_path or settings.daemon.socket_filepath
+        )
+        self.discovery_path = os.path.abspath(
+            discovery_path or settings.daemon.discovery_filepath
+        )
+        self.address: Optional[Dict[str, Any]] = None
+        self._token = secrets.token_hex(16)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._clients: Set[asyncio.StreamWriter] = set()
+        self._methods: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            "status": self._status,
+            "list": self._list,
+            "add": self._add,
+            "remove": self._remove,
+            "pause": self._pause,
+            "resume": self._resume,
+            "save": self._save,
+            "restore": self._restore,
+            "compact": self._compact,
+            "push": self._push,
+            "sync": self._sync,
+            "history": self._history,
+            "metrics": self._metrics,
+        }
+
+    def start(self) -> None:
+        """Start serving, returns once the server accepts connections"""
+        if self._thread is not None:
+            return
+        self._ready.clear()
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._run, name="control-server", daemon=True
+        )
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            self._thread.join()
+            self._thread = None
+            raise ControlServerError(
+                f"Failed to start the control server: {self._error}"
+            )
+        logger.info(f"Control server listening on {self.address}")
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+        self._remove_file(self.discovery_path)
+        if self.address and self.address["transport"] == "unix":
+            self._remove_file(self.socket_path)
+        self.address = None
+        logger.info("Control server stopped")
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        try:
+            try:
+                loop.run_until_complete(self._listen())
+                self._publish()
+            except BaseException as ex:
+                self._error = ex
+                return
+            finally:
+                self._ready.set()
+            loop.run_forever()
+            loop.run_until_complete(self._shutdown())
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+            self._loop = None
+
+    async def _shutdown(self) -> None:
+        """Stop accepting and let attached clients see end of stream"""
+        self._server.close()
+        for writer in list(self._clients):
+            writer.close()
+        tasks = [
+            task
+            for task in asyncio.all_tasks()
+            if task is not asyncio.current_task()
+        ]
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _listen(self) -> None:
+        if settings.daemon.unix_socket and hasattr(socket, "AF_UNIX"):
+            try:
+                self._clear_stale_socket()
+                self._server = await asyncio.start_unix_server(
+                    self._handle_client, path=self.socket_path
+                )
+                os.chmod(self.socket_path, 0o600)
+                self.address = {"transport": "unix", "path": self.socket_path}
+                return
+            except OSError as ex:
+                logger.warning(
+                    f"Failed to listen on {self.socket_path}: {ex}. \
+Falling back to TCP."
+                )
+
+        self._server = await asyncio.start_server(
+            self._handle_client, host=DAEMON_TCP_HOST, port=0
+        )
+        port = self._server.sockets[0].getsockname()[1]
+        self.address = {
+            "transport": "tcp",
+            "host": DAEMON_TCP_HOST,
+            "port": port,
+        }
+
+    def _clear_stale_socket(self) -> None:
+        """Remove a socket left behind by a daemon that did not exit"""
+        if not os.path.exists(self.socket_path):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            if probe.connect_ex(self.socket_path) == 0:
+                raise ControlServerError(
+                    f"Another daemon is listening on {self.socket_path}"
+                )
+        os.remove(self.socket_path)
+
+    def _publish(self) -> None:
+        discovery = dict(self.address, token=self._token, pid=os.getpid())
+        data = json.dumps(discovery, indent=4).encode()
+        atomic_write(self.discovery_path, data)
+        os.chmod(self.discovery_path, 0o600)
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    async def _handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._clients.add(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Line longer than the stream limit
+                    break
+                if not line:
+                    break
+                response = await self._respond(line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _respond(self, line: bytes) -> Dict[str, Any]:
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return _error(None, "BadRequest", "Request is not valid JSON")
+        if not isinstance(request, dict):
+            return _error(None, "BadRequest", "Request must be an object")
+
+        request_id = request.get("id")
+        token = str(request.get("token", ""))
+        if not hmac.compare_digest(token, self._token):
+            return _error(request_id, "Unauthorized", "Invalid token")
+
+        method = self._methods.get(request.get("method"))
+        if method is None:
+            return _error(
+                request_id,
+                "BadRequest",
+                f"Unknown method: {request.get('method')}",
+            )
+
+        params = request.get("params") or dict()
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(None, method, params)
+        except Exception as ex:
+            logger.debug(f"Control request {request_id} failed: {ex}")
+            return _error(request_id, ex.__class__.__name__, str(ex))
+        return {"id": request_id, "result": result}
+
+    def _directory(self, params: Dict[str, Any]) -> TrackedDirectory:
+        """Tracked directory addressed by a 'name' or 'path' parameter"""
+        pair = None
+        if "name" in params:
+            pair = self.controller.directories.get_by_name(params["name"])
+        elif "path" in params:
+            pair = self.controller.directories.get(params["path"])
+        if pair is None:
+            raise ControllerCallError(
+                "Request does not name a tracked directory"
+            )
+        return pair.directory
+
+    def _status(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(self.controller.status_report(), version=APP_VERSION)
+
+    def _metrics(self, params: Dict[str, Any]) -> str:
+        return self.controller.metrics_report()
+
+    def _list(self, params: Dict[str, Any]) -> Any:
+        return [
+            pair.directory.model_dump(mode="json")
+            for pair in self.controller.directories.values()
+        ]
+
+    def _add(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        directory = TrackedDirectory(**params)
+        if directory.path in self.controller.directories:
+            raise ControllerCallError(
+                f"Directory is already tracked: {directory.path}"
+            )
+        self.controller.add_directory(dir=directory)
+        if self.controller.status == Status.STARTED:
+            self.controller.start_watching_directory(dir=directory)
+        return directory.model_dump(mode="json")
+
+    def _remove(self, params: Dict[str, Any]) -> None:
+        self.controller.remove_directory(dir=self._directory(params))
+
+    def _pause(self, params: Dict[str, Any]) -> None:
+        self.controller.pause_directory(dir=self._directory(params))
+
+    def _resume(self, params: Dict[str, Any]) -> None:
+        self.controller.resume_directory(dir=self._directory(params))
+
+    def _save(self, params: Dict[str, Any]) -> None:
+        self.controller.force_save(dir=self._directory(params))
+
+    def _restore(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        if "rev" not in params:
+            raise ControllerCallError("Restore requires a 'rev' parameter")
+        return self.controller.restore_directory(
+            dir=self._directory(params), rev=str(params["rev"])
+        )
+
+    def _compact(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return self.controller.compact_directory(dir=self._directory(params))
+
+    def _push(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        directory = None
+        if "name" in params or "path" in params:
+            directory = self._directory(params)
+        return {"started": self.controller.push_pending(dir=directory)}
+
+    def _sync(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return self.controller.sync_directory(
+            dir=self._directory(params),
+            url=params.get("remote"),
+            prefer_remote=bool(params.get("prefer_remote", False)),
+        )
+
+    def _history(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        before = params.get("before")
+        limit = params.get("limit")
+        return self.controller.snapshot_history(
+            dir=self._directory(params),
+            since=_time(params, "since"),
+            until=_time(params, "until"),
+            limit=int(limit) if limit is not None else None,
+            before=int(before) if before is not None else None,
+            file=params.get("file"),
+        )
+
+
+def _time(params: Dict[str, Any], key: str) -> Optional[datetime]:
+    """ISO 8601 time parameter, UTC unless it names a timezone"""
+    value = params.get(key)
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ControllerCallError(f"Invalid time for '{key}': {value}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _error(request_id: Any, kind: str, message: str) -> Dict[str, Any]:
+    return {"id": request_id, "error": {"type": kind, "message": message}}
@@ -1,12 +1,53 @@
-from typing import List, Dict, Optional
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
 from enum import Enum
-from pydantic import DirectoryPath
 from watchdog.observers import Observer
-from watchdog.observers.api import BaseObserver
-from src.models.tracked_directory import TrackedDirectory
+from watchdog.observers.api import BaseObserver, EventEmitter
+from src.models.tracked_directory import TrackedDirectory, WatchMode
 from src.core.event_handler import TrackedDirectoryHandler
-from src.exceptions import ControllerCallError
+from src.core.event_queue import ChangeSet
+from src.core.history import SnapshotHistory
+from src.core.inotify import InotifyWatcher
+from src.core.maintenance import MaintenanceScheduler, prune_snapshots
+from src.core.manifest import FileManifest
+from src.core.observer_pool import ObserverPool
+from src.core.polling import PollingEngine
+from src.core.push import PushScheduler
+from src.core.reconcile import Reconciler
+from src.core.scheduler import SaveScheduler
+from src.core.snapshot_pool import SnapshotPool
+from src.core.restore import DirectoryRestore
+from src.core.snapshot import (
+    SnapshotJob,
+    SnapshotReason,
+    chunking_policy,
+    take_snapshot,
+)
+from src.core.sync import SyncState, sync_directory
+from src.git_backend import GitBackend
+from src.git_utils import (
+    collect_garbage,
+    dissociate_object_store,
+    share_objects,
+)
+from src.exceptions import ControllerCallError, RestoreError
 from src.models.metadata import Metadata
+from src.models.remote import GitRemote
+from src.models.registry import DirectoryRegistry
+from src.metrics import (
+    MAINTENANCE_SECONDS,
+    SNAPSHOTS,
+    SNAPSHOTS_PRUNED,
+    SNAPSHOT_SECONDS,
+    SYNCS,
+    SYNC_SECONDS,
+    TextfileExporter,
+    registry as metrics,
+)
+from src.constraints import GIT_DIRECTORY_NAME
+from src.settings import settings
 from src.logger import LoggerFactory
 
 
@@ -25,17 +66,65 @@ class Status(Enum):
 class ControlPair:
     directory: TrackedDirectory
     observer: Optional[BaseObserver] = None
+    handler: Optional[TrackedDirectoryHandler] = None
+    manifest: Optional[FileManifest] = None
+    history: Optional[SnapshotHistory] = None
+    lock: threading.RLock
 
     def __init__(
-        self, dir: TrackedDirectory, obs: Optional[BaseObserver] = None
+        self,
+        dir: TrackedDirectory,
+        obs: Optional[BaseObserver] = None,
+        handler: Optional[TrackedDirectoryHandler] = None,
     ):
         self.directory = dir
         self.observer = obs
+        self.handler = handler
+        self.manifest = None
+        self.history = None
+        # Held while the repository or the directory are being written
+        self.lock = threading.RLock()
+
+    def get_manifest(self) -> FileManifest:
+        """Open the file manifest of the directory on first use"""
+        if self.manifest is None:
+            self.manifest = FileManifest.for_directory(self.directory)
+        return self.manifest
+
+    def get_history(self) -> SnapshotHistory:
+        """Open the snapshot history index of the directory on first use"""
+        if self.history is None:
+            self.history = SnapshotHistory.for_directory(self.directory)
+        return self.history
+
+    def get_backend(self) -> Optional[GitBackend]:
+        """Persistent git backend of the directory, if enabled"""
+        if not settings.git.persistent_backend:
+            return None
+        return GitBackend.for_repository(str(self.directory.path))
+
+    def close(self) -> None:
+        """Release the indexes and git processes held for the directory"""
+        if self.manifest:
+            self.manifest.close()
+            self.manifest = None
+        if self.history:
+            self.history.close()
+            self.history = None
+        GitBackend.close_repository(str(self.directory.path))
 
 
 class DirectoryController:
-    directories: Dict[DirectoryPath, ControlPair] = dict()
+    directories: DirectoryRegistry[ControlPair] = DirectoryRegistry()
     metadata: Optional[Metadata] = None
+    observer_pool: Optional[ObserverPool] = None
+    poller: Optional[PollingEngine] = None
+    scheduler: Optional[SaveScheduler] = None
+    snapshot_pool: Optional[SnapshotPool] = None
+    reconciler: Optional[Reconciler] = None
+    exporter: Optional[TextfileExporter] = None
+    maintenance: Optional[MaintenanceScheduler] = None
+    pusher: Optional[PushScheduler] = None
     status: Status = Status.NOT_INITIALIZED
 
     def __new__(cls, *args, **kwargs):
@@ -52,8 +141,82 @@ class DirectoryController:
             logger.warning("Tred to reinitialize the Controller. Skipping.")
             return
 
-        self.directories: Dict[DirectoryPath, ControlPair] = dict()
+        self.directories: DirectoryRegistry[ControlPair] = DirectoryRegistry(
+            directory_of=lambda pair: pair.directory
+        )
         self.metadata = None
+        self.observer_pool = None
+        if settings.watcher.shared_observer:
+            self.observer_pool = ObserverPool(
+                size=settings.watcher.observer_pool_size
+            )
+        self.poller = PollingEngine(
+            min_interval=settings.watcher.poll_min_interval_sec,
+            max_interval=settings.watcher.poll_max_interval_sec,
+            backoff=settings.watcher.poll_backoff,
+        )
+        # Hand-offs only queue a job, they can run on the scheduler thread
+        self.scheduler = SaveScheduler(
+            dispatch=lambda key, callback: callback()
+        )
+        self.snapshot_pool = SnapshotPool(
+            run=self._run_snapshot_job,
+            workers=settings.save_state.snapshot_workers,
+            max_pending=settings.save_state.snapshot_queue_max,
+        )
+        self.reconciler = Reconciler(
+            workers=settings.watcher.reconcile_workers
+        )
+        self.exporter = None
+        if settings.metrics.textfile_path:
+            self.exporter = TextfileExporter(
+                metrics,
+                path=settings.metrics.textfile_path,
+                interval=settings.metrics.textfile_interval_sec,
+            )
+        self.maintenance = None
+        if settings.maintenance.enabled:
+            self.maintenance = MaintenanceScheduler(
+                interval=settings.maintenance.interval_sec,
+                task=self.run_maintenance,
+            )
+        self.pusher = None
+        if settings.push.push_enabled and metadata:
+            self.pusher = PushScheduler(
+                remotes=lambda: self.metadata.remotes,
+                outbox_path=settings.push.outbox_filepath,
+                branch=settings.git.master_branch,
+                batch_delay=settings.push.batch_delay_sec,
+                workers=settings.push.push_workers,
+                remote_concurrency=settings.push.remote_concurrency,
+                retry_min=settings.push.retry_min_sec,
+                retry_max=settings.push.retry_max_sec,
+            )
+            metrics.collector(
+                "gamesave_push_lag_seconds",
+                "Age of the oldest snapshot not yet pushed to a remote",
+                self.pusher.lag,
+            )
+        metrics.collector(
+            "gamesave_event_queue_depth",
+            "Distinct paths waiting for the next snapshot",
+            self._queue_depths,
+        )
+        metrics.collector(
+            "gamesave_snapshot_queue_depth",
+            "Directories waiting for a snapshot worker",
+            lambda: [({}, self.snapshot_pool.pending)],
+        )
+        metrics.collector(
+            "gamesave_observer_threads",
+            "Observer and emitter threads watching the filesystem",
+            lambda: [({}, self._observer_thread_count())],
+        )
+        metrics.collector(
+            "gamesave_threads",
+            "Live threads of the daemon process",
+            lambda: [({}, threading.active_count())],
+        )
 
         if not (metadata or directories):
             raise ValueError(
@@ -84,11 +247,10 @@ class DirectoryController:
             )
             return
 
-        self.directories[dir.path] = ControlPair(dir=dir)
+        self.directories.add(ControlPair(dir=dir))
 
-        if self.metadata:
+        if self.metadata and dir.path not in self.metadata.directories:
             self.metadata.add_directory(dir=dir)
-            self.metadata.save_to_disk()
 
     def start_watching_directory(self, dir: TrackedDirectory) -> None:
         if dir.path not in self.directories:
@@ -98,30 +260,513 @@ class DirectoryController:
             )
             self.add_directory(dir=dir)
 
-        if self.directories[dir.path].observer:
+        pair = self.directories[dir.path]
+        if pair.handler:
             logger.warning(
                 "Controller tried to start watching a directory \
                     with an observer already present. Aborting."
             )
             return
 
-        observer = Observer()
-        event_handler = TrackedDirectoryHandler()
-
-        observer.schedule(event_handler, dir.path, recursive=True)
-        observer.start()
-        self.directories[dir.path].observer = observer
+        self.scheduler.start()
+        self.snapshot_pool.start()
+        event_handler = TrackedDirectoryHandler(
+            directory=pair.directory,
+            scheduler=self.scheduler,
+            on_snapshot=self.run_snapshot,
+        )
+
+        if dir.watch_mode == WatchMode.POLLING:
+            self.poller.start()
+            self.poller.add(event_handler)
+        elif self.observer_pool:
+            self.observer_pool.start()
+            self.observer_pool.add(event_handler)
+        else:
+            observer = Observer()
+            observer.schedule(event_handler, str(dir.path), recursive=True)
+            observer.start()
+            pair.observer = observer
+        pair.handler = event_handler
 
         logger.info(f"Started watching directory: {dir.path}")
 
+    def stop_watching_directory(self, dir: TrackedDirectory) -> None:
+        """Stop watching a directory, leaving all other watches running"""
+        pair = self.directories.get(dir.path)
+        if pair is None:
+            raise ControllerCallError(
+                f"Tried to stop watching an unknown directory: {dir.path}"
+            )
+
+        if pair.handler:
+            pair.handler.cancel()
+            if self.poller.is_polling(dir.path):
+                self.poller.remove(dir.path)
+            elif self.observer_pool:
+                self.observer_pool.remove(dir.path)
+            pair.handler = None
+        if pair.observer:
+            pair.observer.stop()
+            pair.observer.join()
+            pair.observer = None
+
+        logger.debug(f"Stopped watching directory: {dir.path}")
+
+    def remove_directory(self, dir: TrackedDirectory) -> None:
+        """Stop watching a directory and forget about it"""
+        self.stop_watching_directory(dir=dir)
+        pair = self.directories.pop(dir.path)
+        pair.close()
+
+        store = settings.storage.shared_object_store
+        if store and os.path.isdir(os.path.join(dir.path, GIT_DIRECTORY_NAME)):
+            # The repository stays behind and must not depend on the store
+            try:
+                with pair.lock:
+                    dissociate_object_store(str(dir.path), store)
+            except Exception as ex:
+                logger.error(
+                    f"Failed detaching {dir.path} from the object store: {ex}"
+                )
+
+        if self.metadata:
+            self.metadata.delete_directory(name=None, path=dir.path)
+        if self.pusher:
+            self.pusher.forget(str(dir.path))
+        metrics.remove_series(directory=dir.name)
+
+    def _watched_pair(self, dir: TrackedDirectory) -> ControlPair:
+        pair = self.directories.get(dir.path)
+        if pair is None or pair.handler is None:
+            raise ControllerCallError(
+                f"Directory is not being watched: {dir.path}"
+            )
+        return pair
+
+    def pause_directory(self, dir: TrackedDirectory) -> None:
+        """Stop reacting to changes in a directory until resumed"""
+        self._watched_pair(dir).handler.pause()
+        logger.info(f"Paused directory: {dir.path}")
+
+    def resume_directory(self, dir: TrackedDirectory) -> None:
+        self._watched_pair(dir).handler.resume()
+        logger.info(f"Resumed directory: {dir.path}")
+
+    def force_save(self, dir: TrackedDirectory) -> None:
+        """Snapshot a directory right away, ignoring the cooldown"""
+        self._watched_pair(dir).handler.save_now()
+
+    def restore_directory(
+        self, dir: TrackedDirectory, rev: str
+    ) -> Dict[str, Any]:
+        """
+        Bring a directory back to one of its snapshots. Unsaved changes
+        are committed first so the restore can be undone, and the
+        directory is not watched while its files are replaced; the
+        restored state is then saved as a snapshot of its own.
+        """
+        pair = self.directories.get(dir.path)
+        if pair is None:
+            raise ControllerCallError(
+                f"Tried to restore an unknown directory: {dir.path}"
+            )
+        path = str(dir.path)
+        watching = pair.handler is not None
+        if watching:
+            self.stop_watching_directory(dir=dir)
+        try:
+            with pair.lock:
+                backend = GitBackend.for_repository(path)
+                # Resolved up front, the safety save moves relative revisions
+                commit = backend.resolve(rev)
+                if commit is None:
+                    raise RestoreError(f"Unknown snapshot '{rev}' in {path}")
+                manifest = pair.get_manifest()
+                take_snapshot(
+                    SnapshotJob(
+                        dir,
+                        ChangeSet(full_rescan=True),
+                        reason=SnapshotReason.BEFORE_RESTORE,
+                    ),
+                    manifest=manifest,
+                    backend=pair.get_backend(),
+                    history=pair.get_history(),
+                )
+                try:
+                    result = DirectoryRestore(
+                        path,
+                        backend=backend,
+                        manifest=manifest,
+                        chunking=chunking_policy(dir),
+                        workers=settings.restore.workers,
+                        staged=settings.restore.staged,
+                    ).run(commit)
+                finally:
+                    # The git processes may point at the swapped-out tree
+                    GitBackend.close_repository(path)
+                take_snapshot(
+                    SnapshotJob(
+                        dir,
+                        ChangeSet(full_rescan=True),
+                        reason=SnapshotReason.RESTORED,
+                    ),
+                    manifest=manifest,
+                    backend=pair.get_backend(),
+                    history=pair.get_history(),
+                )
+        finally:
+            if watching:
+                self.start_watching_directory(dir=dir)
+
+        if self.metadata:
+            self.metadata.update_save_time(dir=dir)
+        if self.pusher:
+            self.pusher.enqueue(dir)
+        logger.info(
+            f"Restored {path} to {result.commit[:12]}: \
+{result.written} written, {result.removed} removed, \
+{result.unchanged} unchanged"
+        )
+        return result.as_dict()
+
+    def _remote(self, url: Optional[str] = None) -> GitRemote:
+        remotes = self.metadata.remotes if self.metadata else []
+        for remote in remotes:
+            if url is None or str(remote.url) == url:
+                return remote
+        if url is None:
+            raise ControllerCallError("No remotes are configured")
+        raise ControllerCallError(f"Unknown remote: {url}")
+
+    def sync_directory(
+        self,
+        dir: TrackedDirectory,
+        url: Optional[str] = None,
+        prefer_remote: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Bring a directory up to date from a remote, the first one unless
+        url is given. Unsaved changes are saved first, so changes made on
+        both devices show up as diverged histories instead of being
+        overwritten. The directory is not watched meanwhile.
+        """
+        pair = self.directories.get(dir.path)
+        if pair is None:
+            raise ControllerCallError(
+                f"Tried to sync an unknown directory: {dir.path}"
+            )
+        remote = self._remote(url)
+        path = str(dir.path)
+        watching = pair.handler is not None
+        if watching:
+            self.stop_watching_directory(dir=dir)
+        try:
+            with pair.lock, SYNC_SECONDS.time(directory=dir.name):
+                manifest = pair.get_manifest()
+                history = pair.get_history()
+                take_snapshot(
+                    SnapshotJob(
+                        dir,
+                        ChangeSet(full_rescan=True),
+                        reason=SnapshotReason.BEFORE_SYNC,
+                    ),
+                    manifest=manifest,
+                    backend=pair.get_backend(),
+                    history=history,
+                )
+                # fast-import would write back its own branch head on exit
+                GitBackend.close_repository(path)
+                backend = GitBackend(path)
+                try:
+                    result = sync_directory(
+                        dir,
+                        remote,
+                        backend=backend,
+                        manifest=manifest,
+                        branch=settings.git.master_branch,
+                        prefer_remote=prefer_remote,
+                        depth=settings.sync.depth,
+                        deepen=settings.sync.deepen,
+                        staged=settings.sync.sync_staged,
+                        workers=settings.restore.workers,
+                    )
+                    history.refresh(
+                        backend,
+                        branch=settings.git.master_branch,
+                        reason=SnapshotReason.SYNCED,
+                    )
+                finally:
+                    backend.close()
+        finally:
+            if watching:
+                self.start_watching_directory(dir=dir)
+
+        SYNCS.inc(directory=dir.name, result=result.state)
+        if result.state == SyncState.AHEAD and self.pusher:
+            self.pusher.enqueue(dir)
+        if result.state == SyncState.DIVERGED:
+            logger.warning(
+                f"{dir.name} has snapshots missing from {remote.url} and \
+the other way around, left unchanged"
+            )
+        else:
+            logger.info(f"Synced {dir.name} from {remote.url}: {result.state}")
+        return result.as_dict()
+
+    def compact_directory(self, dir: TrackedDirectory) -> Dict[str, Any]:
+        """
+        Drop the snapshots the retention policy of a directory does not
+        keep, then repack its repository. Objects of dropped snapshots are
+        deleted right away, otherwise git decides whether a repack pays.
+        """
+        pair = self.directories.get(dir.path)
+        if pair is None:
+            raise ControllerCallError(
+                f"Tried to compact an unknown directory: {dir.path}"
+            )
+        path = str(dir.path)
+        pruned = 0
+        with pair.lock, MAINTENANCE_SECONDS.time(directory=dir.name):
+            if not os.path.isdir(os.path.join(path, GIT_DIRECTORY_NAME)):
+                return {"pruned": pruned}
+            # Neither pipe may hold on to objects while history is rewritten
+            GitBackend.close_repository(path)
+            backend = GitBackend(path)
+            try:
+                if dir.retention is not None:
+                    pruned = prune_snapshots(
+                        backend,
+                        branch=settings.git.master_branch,
+                        policy=dir.retention,
+                    )
+                # Also indexes older repositories while idle, so the first
+                # history query does not have to
+                pair.get_history().refresh(
+                    backend, branch=settings.git.master_branch
+                )
+            finally:
+                backend.close()
+            collect_garbage(path, prune_now=pruned > 0)
+            if settings.storage.shared_object_store:
+                share_objects(path, settings.storage.shared_object_store)
+
+        if pruned:
+            if self.pusher:
+                # Remotes still hold the dropped snapshots, replace them
+                self.pusher.enqueue(dir, force=True)
+            SNAPSHOTS_PRUNED.inc(pruned, directory=dir.name)
+            logger.info(f"Pruned {pruned} snapshots of {dir.name}")
+        return {"pruned": pruned}
+
+    def run_maintenance(self) -> None:
+        """Compact every directory without pending or recent saves"""
+        now = datetime.now(timezone.utc)
+        for pair in list(self.directories.values()):
+            directory = pair.directory
+            if pair.handler and pair.handler.pending:
+                continue
+            last_save_time = directory.last_save_time
+            if (
+                last_save_time is not None
+                and (now - last_save_time).total_seconds()
+                < settings.maintenance.idle_sec
+            ):
+                continue
+            # A snapshot or restore in progress, try again next time
+            if not pair.lock.acquire(blocking=False):
+                continue
+            try:
+                self.compact_directory(dir=directory)
+            except Exception as ex:
+                logger.error(f"Failed compacting {directory.path}: {ex}")
+            finally:
+                pair.lock.release()
+
+        store = settings.storage.shared_object_store
+        if store and os.path.isdir(store):
+            # Unreachable objects are kept for the usual grace period, a
+            # snapshot may just have reused one of them
+            try:
+                collect_garbage(store)
+            except Exception as ex:
+                logger.error(f"Failed compacting the object store: {ex}")
+
+    def status_report(self) -> Dict[str, Any]:
+        """Summary of the controller and every tracked directory"""
+        directories = []
+        for pair in self.directories.values():
+            directory = pair.directory
+            last_save_time = directory.last_save_time
+            directories.append(
+                {
+                    "name": directory.name,
+                    "path": str(directory.path),
+                    "watching": pair.handler is not None,
+                    "paused": bool(pair.handler and pair.handler.paused),
+                    "pending": pair.handler.pending if pair.handler else 0,
+                    "last_save_time": (
+                        last_save_time.isoformat() if last_save_time else None
+                    ),
+                    "push_lag_sec": (
+                        self.pusher.directory_lag(str(directory.path))
+                        if self.pusher
+                        else None
+                    ),
+                }
+            )
+        return {"status": self.status.value, "directories": directories}
+
+    def _queue_depths(self):
+        return [
+            ({"directory": pair.directory.name}, pair.handler.pending)
+            for pair in self.directories.values()
+            if pair.handler is not None
+        ]
+
+    @staticmethod
+    def _observer_thread_count() -> int:
+        return sum(
+            1
+            for thread in threading.enumerate()
+            if isinstance(
+                thread, (BaseObserver, EventEmitter, InotifyWatcher)
+            )
+        )
+
+    def push_pending(self, dir: Optional[TrackedDirectory] = None) -> int:
+        """Push the unpushed snapshots of one or all directories now"""
+        if self.pusher is None:
+            raise ControllerCallError("Pushing to remotes is not enabled")
+        return self.pusher.flush(str(dir.path) if dir else None)
+
+    def snapshot_history(
+        self,
+        dir: TrackedDirectory,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        before: Optional[int] = None,
+        file: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        One page of the snapshots of a directory, newest first, optionally
+        only those taken in [since, until) or those that changed one file.
+        Served from the history index, which is only caught up from git
+        when the branch moved without it. Pass the returned 'next' as
+        before to get the following page.
+        """
+        pair = self.directories.get(dir.path)
+        if pair is None:
+            raise ControllerCallError(
+                f"Tried to list snapshots of an unknown directory: {dir.path}"
+            )
+        path = str(dir.path)
+        history = pair.get_history()
+        if os.path.isdir(os.path.join(path, GIT_DIRECTORY_NAME)):
+            # Only reads objects, safe next to a snapshot in progress
+            history.refresh(
+                GitBackend.for_repository(path),
+                branch=settings.git.master_branch,
+            )
+        if file is not None and os.path.isabs(file):
+            file = os.path.relpath(file, path)
+        return history.query(
+            since=since,
+            until=until,
+            limit=limit or settings.history.page_size,
+            before=before,
+            path=os.path.normpath(file) if file is not None else None,
+        )
+
+    def metrics_report(self) -> str:
+        """Current metrics in the Prometheus text format"""
+        return metrics.render()
+
+    def find_directory(self, path) -> Optional[TrackedDirectory]:
+        """Innermost tracked directory containing a path"""
+        pair = self.directories.owner_of(path)
+        return pair.directory if pair else None
+
+    def run_snapshot(self, job: SnapshotJob) -> bool:
+        """
+        Queue the changes handed off by a directory handler for a snapshot
+        worker, False if too many directories are waiting already
+        """
+        return self.snapshot_pool.submit(job)
+
+    def _run_snapshot_job(self, job: SnapshotJob) -> None:
+        pair = self.directories.get(job.directory.path)
+        name = job.directory.name
+        saved = False
+        try:
+            with SNAPSHOT_SECONDS.time(directory=name):
+                if pair is None:
+                    committed = take_snapshot(job)
+                else:
+                    with pair.lock:
+                        committed = take_snapshot(
+                            job,
+                            manifest=pair.get_manifest(),
+                            backend=pair.get_backend(),
+                            history=pair.get_history(),
+                        )
+            saved = True
+            # Fails if the directory was removed while the job ran
+            if self.metadata:
+                self.metadata.update_save_time(dir=job.directory)
+            if committed and self.pusher:
+                self.pusher.enqueue(job.directory)
+        except Exception as ex:
+            logger.error(
+                f"Failed saving snapshot of {job.directory.path}: {ex}"
+            )
+            if saved:
+                return
+            SNAPSHOTS.inc(directory=name, result="failed")
+            # The handler drained the changes, nothing else would save them
+            if pair is not None and pair.handler is not None:
+                pair.handler.retry(job)
+
     def start_all(self) -> None:
         self.status = Status.STARTING
 
+        if self.observer_pool:
+            self.observer_pool.start()
+
         for pair in self.directories.values():
             self.start_watching_directory(dir=pair.directory)
 
+        # Watchers are attached first so nothing changing during the scan
+        # is missed, overlapping changes coalesce in the handler queues
+        if settings.watcher.reconcile_on_start:
+            self.reconciler.start(
+                [
+                    (pair.directory, pair.get_manifest())
+                    for pair in self.directories.values()
+                ],
+                on_stale=self._queue_catch_up,
+            )
+
+        if self.exporter:
+            self.exporter.start()
+
+        if self.maintenance:
+            self.maintenance.start()
+
+        if self.pusher:
+            self.pusher.start()
+
         self.status = Status.STARTED
 
+    def _queue_catch_up(
+        self, dir: TrackedDirectory, candidates: List[str], deleted: List[str]
+    ) -> None:
+        pair = self.directories.get(dir.path)
+        if pair is None or pair.handler is None:
+            return
+        pair.handler.catch_up(candidates=candidates, deleted=deleted)
+
     def stop_all(self) -> None:
         if self.status == Status.STOPPING:
             raise ControllerCallError(
@@ -140,12 +785,35 @@ class DirectoryController:
 
         self.status = Status.STOPPING
 
-        while self.directories:
-            dir_path, pair = self.directories.popitem()
+        self.reconciler.shutdown()
+        self.poller.stop()
+        self.scheduler.stop()
+        if self.maintenance:
+            self.maintenance.stop()
+        # Saves already handed off still finish before the repos close
+        self.snapshot_pool.stop()
+        if self.pusher:
+            self.pusher.stop()
+
+        for pair in self.directories.values():
+            dir_path = pair.directory.path
+            if pair.handler:
+                pair.handler.cancel()
             if pair.observer:
                 pair.observer.stop()
                 pair.observer.join()
                 logger.debug(f"Stopped observer for: {dir_path}")
+            pair.close()
+        self.directories.clear()
+
+        if self.observer_pool:
+            self.observer_pool.stop()
+
+        if self.metadata:
+            self.metadata.save_to_disk()
+
+        if self.exporter:
+            self.exporter.stop()
 
         logger.info("All directory watchers have been stopped and removed")
 
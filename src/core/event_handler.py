@@ -1,32 +1,352 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
 from watchdog.events import FileSystemEventHandler
 from src.models.tracked_directory import TrackedDirectory
-from src.logger import LoggerFactory
+from src.core.event_queue import EventQueue, ChangeKind
+from src.core.ignore import IgnoreRules
+from src.core.scheduler import SaveScheduler
+from src.core.settle import SettleDetector
+from src.core.snapshot import SnapshotJob, SnapshotReason
+from src.metrics import EVENTS_DROPPED, EVENTS_RECEIVED
+from src.settings import settings
+from src.logger import EventLogAggregator, LoggerFactory
 
 
 logger = LoggerFactory.getLogger(__name__)
+# Events are logged as per-directory summaries, never one line each
+event_log = EventLogAggregator(
+    logger, interval=settings.logging.event_log_interval_sec
+)
 
 
 class TrackedDirectoryHandler(FileSystemEventHandler):
-    def __init__(self, directory: TrackedDirectory):
+    """
+    Collects events of a tracked directory into a coalescing queue and
+    hands off one snapshot job per save cooldown window. The deadline of
+    the next hand-off lives in a scheduler shared by all directories.
+    """
+
+    def __init__(
+        self,
+        directory: TrackedDirectory,
+        scheduler: SaveScheduler,
+        on_snapshot: Optional[Callable[[SnapshotJob], bool]] = None,
+    ):
         self.tracked_directory = directory
+        self.scheduler = scheduler
+        self.on_snapshot = on_snapshot
+        self._key = str(directory.path)
+        self._settle_key = self._key + "#settle"
+        self.queue = EventQueue(
+            root=str(directory.path),
+            max_paths=settings.save_state.event_queue_max_paths,
+        )
+        self.rules = IgnoreRules.for_directory(directory)
+        self.settle = SettleDetector()
+        self._lock = threading.Lock()
+        # Latest time new events may push the pending deadline back to
+        self._latest_deadline: Optional[float] = None
+        self._last_handoff: Optional[float] = None
+        self._paused = False
+        # Trigger of the next hand-off if not the deadline, e.g. forced
+        self._reason: Optional[str] = None
         super().__init__()
 
     def on_modified(self, event):
         if not event.is_directory:
-            logger.debug(f"Modified: {event.src_path}")
-            # Implement your action here
+            event_log.record(self._key, "modified")
+            self._push(event.src_path, ChangeKind.MODIFIED)
 
     def on_created(self, event):
         if not event.is_directory:
-            logger.debug(f"Created: {event.src_path}")
-            # Implement your action here
+            event_log.record(self._key, "created")
+            self._push(event.src_path, ChangeKind.CREATED)
 
     def on_deleted(self, event):
-        if not event.is_directory:
-            logger.debug(f"Deleted: {event.src_path}")
-            # Implement your action here
+        # Directory removals are queued as a single pathspec
+        event_log.record(self._key, "deleted")
+        self._push(event.src_path, ChangeKind.DELETED, event.is_directory)
+
+    def on_closed(self, event):
+        # Only closes after a write, read-only closes have their own event
+        if event.is_directory:
+            return
+        event_log.record(self._key, "closed")
+        with self._lock:
+            if self._paused:
+                return
+            self.settle.closed(event.src_path)
+            self._arm_settle()
 
     def on_moved(self, event):
-        if not event.is_directory:
-            logger.debug(f"Moved: {event.src_path} to {event.dest_path}")
-            # Implement your action here
+        event_log.record(self._key, "moved")
+        src_path, dest_path = event.src_path, event.dest_path
+        is_dir = event.is_directory
+        with self._lock:
+            if not self._accepting():
+                return
+            # Renaming a temporary file over a save keeps only the write
+            source = self._admits(src_path, is_dir, deleted=True)
+            destination = self._admits(dest_path, is_dir)
+            if source and destination:
+                accepted = self.queue.push_move(src_path, dest_path)
+            elif source:
+                accepted = self.queue.push(src_path, ChangeKind.DELETED)
+            elif destination:
+                accepted = self.queue.push(dest_path, ChangeKind.MODIFIED)
+            else:
+                self._excluded()
+                return
+            self._queued(accepted)
+            if source:
+                self.settle.removed(src_path, is_dir)
+            if destination and not is_dir:
+                # Renaming a file into place is how many games finish a save
+                self.settle.completed(dest_path)
+            self._arm_settle()
+
+    def _push(self, path: str, kind: ChangeKind, is_dir=False) -> None:
+        with self._lock:
+            if not self._accepting():
+                return
+            if not self._admits(path, is_dir, kind == ChangeKind.DELETED):
+                self._excluded()
+                return
+            self._queued(self.queue.push(path, kind))
+            if kind == ChangeKind.DELETED:
+                self.settle.removed(path, is_dir)
+                self._arm_settle()
+            else:
+                self.settle.written(path)
+
+    def _admits(self, path: str, is_dir: bool, deleted=False) -> bool:
+        """Whether the ignore rules of the directory let a path through"""
+        if not self.rules:
+            return True
+        relative = self.queue.relative_path(path)
+        if relative is None:
+            # Rejected by the queue itself
+            return True
+        st = None
+        if self.rules.max_file_size is not None and not (deleted or is_dir):
+            try:
+                st = os.lstat(path)
+            except OSError:
+                pass
+        return not self.rules.ignores(relative, st, is_dir=is_dir)
+
+    def _excluded(self) -> None:
+        EVENTS_DROPPED.inc(
+            directory=self.tracked_directory.name, reason="excluded"
+        )
+
+    def _accepting(self) -> bool:
+        name = self.tracked_directory.name
+        EVENTS_RECEIVED.inc(directory=name)
+        if self._paused:
+            EVENTS_DROPPED.inc(directory=name, reason="paused")
+            return False
+        return True
+
+    def _queued(self, accepted: bool) -> None:
+        name = self.tracked_directory.name
+        if not accepted:
+            EVENTS_DROPPED.inc(directory=name, reason="ignored")
+            return
+        if self.queue.full_rescan:
+            EVENTS_DROPPED.inc(directory=name, reason="rescan")
+        self._arm()
+
+    def catch_up(self, candidates: List[str], deleted: List[str]) -> None:
+        """Queue changes made while nothing was watching the directory"""
+        root = str(self.tracked_directory.path)
+        with self._lock:
+            for relative in candidates:
+                self.queue.push(
+                    os.path.join(root, relative), ChangeKind.MODIFIED
+                )
+            for relative in deleted:
+                self.queue.push(
+                    os.path.join(root, relative), ChangeKind.DELETED
+                )
+            if self.queue:
+                self._reason = self._reason or SnapshotReason.CATCH_UP
+                self._arm()
+
+    def cooldown(self) -> float:
+        """Minimum seconds between snapshots, 0 if saves are not limited"""
+        if not settings.save_state.limit_save_intervals:
+            return 0
+        cooldown = self.tracked_directory.save_cooldown_sec
+        if cooldown is None:
+            cooldown = settings.save_state.save_cooldown_sec
+        return cooldown
+
+    def save_delay(self) -> float:
+        """Seconds until the pending changes may be handed off"""
+        delay = settings.save_state.event_debounce_sec
+
+        cooldown = self.cooldown()
+        if cooldown:
+            if self._last_handoff is not None:
+                elapsed = time.monotonic() - self._last_handoff
+                delay = max(delay, cooldown - elapsed)
+            last_save_time = self.tracked_directory.last_save_time
+            if last_save_time is not None:
+                elapsed = (
+                    datetime.now(timezone.utc) - last_save_time
+                ).total_seconds()
+                delay = max(delay, cooldown - elapsed)
+
+        return delay
+
+    def _arm(self) -> None:
+        """
+        Schedule the hand-off of the queued changes. While a deadline is
+        pending, new events push it back to one debounce interval after
+        them, so a burst is saved once it is over. Continuous writes can
+        delay a hand-off by at most one more cooldown window.
+        """
+        now = time.monotonic()
+        deadline = self.scheduler.deadline(self._key)
+        if deadline is None:
+            deadline = now + self.save_delay()
+            self._latest_deadline = deadline + max(
+                self.cooldown(), settings.save_state.event_debounce_sec
+            )
+            self.scheduler.schedule_at(self._key, deadline, self._fire)
+            return
+        settled = min(
+            now + settings.save_state.event_debounce_sec,
+            self._latest_deadline or deadline,
+        )
+        if settled > deadline:
+            self.scheduler.schedule_at(self._key, settled, self._fire)
+
+    def _arm_settle(self) -> None:
+        """Check for a settled burst shortly, ahead of the regular deadline"""
+        if not (settings.save_state.settle_saves and self.settle.settled()):
+            return
+        grace = settings.save_state.settle_grace_sec
+        deadline = self.scheduler.deadline(self._key)
+        if deadline is None or deadline - time.monotonic() > grace:
+            self.scheduler.schedule(self._settle_key, grace, self._settled)
+
+    def _settled(self) -> None:
+        with self._lock:
+            if not (self.settle.settled() and self.settle.stable()):
+                # Written again since, wait for the next close or deadline
+                return
+        logger.debug(f"Writes settled in {self.tracked_directory.path}")
+        self._fire(SnapshotReason.SETTLED)
+
+    def _fire(self, trigger: str = SnapshotReason.CHANGES) -> None:
+        with self._lock:
+            # Either deadline covers everything drained here
+            self.scheduler.cancel(self._key)
+            self.scheduler.cancel(self._settle_key)
+            self.settle.reset()
+            changes = self.queue.drain()
+            reason, self._reason = self._reason or trigger, None
+
+        if not changes or not self.on_snapshot:
+            return
+
+        logger.debug(
+            f"Handing off {len(changes)} changes from {changes.event_count} \
+events in {self.tracked_directory.path}"
+        )
+        job = SnapshotJob(
+            self.tracked_directory,
+            changes,
+            forced=reason == SnapshotReason.FORCED,
+            reason=reason,
+        )
+        if self.on_snapshot(job):
+            with self._lock:
+                self._last_handoff = time.monotonic()
+            return
+
+        # Refused for now, keep the changes and try again shortly
+        logger.debug(f"Snapshot of {self.tracked_directory.path} deferred")
+        with self._lock:
+            self.queue.restore(changes)
+            self._reason = self._reason or reason
+            self.scheduler.schedule(
+                self._key, settings.save_state.snapshot_retry_sec, self._fire
+            )
+
+    def retry(self, job: SnapshotJob) -> None:
+        """
+        Queue the changes of a failed snapshot again. They are saved with
+        the next snapshot, or on their own once the retry delay and the
+        cooldown have passed.
+        """
+        with self._lock:
+            self.queue.restore(job.changes)
+            self._reason = self._reason or job.reason
+            # Resuming arms the hand-off again
+            if self._paused:
+                return
+            if self.scheduler.deadline(self._key) is None:
+                delay = max(
+                    settings.save_state.snapshot_retry_sec, self.save_delay()
+                )
+                self.scheduler.schedule(self._key, delay, self._fire)
+
+    def cancel(self) -> None:
+        """Drop the pending deadline, queued changes are kept"""
+        with self._lock:
+            self.scheduler.cancel(self._key)
+            self.scheduler.cancel(self._settle_key)
+
+    @property
+    def paused(self) -> bool:
+        return self._paused
+
+    @property
+    def pending(self) -> int:
+        """Number of distinct paths waiting for the next snapshot"""
+        return len(self.queue)
+
+    def pause(self) -> None:
+        """Ignore events until resumed, already queued changes are kept"""
+        with self._lock:
+            self._paused = True
+            self.scheduler.cancel(self._key)
+            self.scheduler.cancel(self._settle_key)
+            self.settle.reset()
+
+    def resume(self, rescan: bool = True) -> None:
+        """
+        Accept events again. Changes made while paused were not seen, so
+        by default the next snapshot rescans the whole directory.
+        """
+        with self._lock:
+            self._paused = False
+            if rescan:
+                self.queue.request_full_rescan()
+            if self.queue:
+                self._arm()
+
+    def events_lost(self) -> None:
+        """The watcher dropped events, rescan the whole directory"""
+        with self._lock:
+            if self._paused:
+                # Resuming rescans anyway
+                return
+            self.queue.request_full_rescan()
+            self._arm()
+
+    def save_now(self) -> None:
+        """Hand off a snapshot immediately, bypassing the cooldown"""
+        with self._lock:
+            if not self.queue:
+                self.queue.request_full_rescan()
+            # Events arriving meanwhile must not push the hand-off back
+            self._latest_deadline = time.monotonic()
+            self._reason = SnapshotReason.FORCED
+            self.scheduler.schedule(self._key, 0, self._fire)
@@ -0,0 +1,195 @@
+import os
+import time
+from enum import Enum
+from typing import Dict, List, Optional
+from src.constraints import GIT_DIRECTORY_NAME
+
+
+class ChangeKind(Enum):
+    CREATED = "created"
+    MODIFIED = "modified"
+    DELETED = "deleted"
+
+
+# Net result of applying a new change on top of an already queued one.
+# None means the two cancel out (file created and removed within a window).
+_MERGE_TABLE: Dict[ChangeKind, Dict[ChangeKind, Optional[ChangeKind]]] = {
+    ChangeKind.CREATED: {
+        ChangeKind.CREATED: ChangeKind.CREATED,
+        ChangeKind.MODIFIED: ChangeKind.CREATED,
+        ChangeKind.DELETED: None,
+    },
+    ChangeKind.MODIFIED: {
+        ChangeKind.CREATED: ChangeKind.MODIFIED,
+        ChangeKind.MODIFIED: ChangeKind.MODIFIED,
+        ChangeKind.DELETED: ChangeKind.DELETED,
+    },
+    ChangeKind.DELETED: {
+        ChangeKind.CREATED: ChangeKind.MODIFIED,
+        ChangeKind.MODIFIED: ChangeKind.MODIFIED,
+        ChangeKind.DELETED: ChangeKind.DELETED,
+    },
+}
+
+
+class ChangeSet:
+    """Net changes of a directory accumulated between two snapshots"""
+
+    changes: Dict[str, ChangeKind]
+    full_rescan: bool
+    event_count: int
+    first_event_time: Optional[float]
+
+    def __init__(
+        self,
+        changes: Optional[Dict[str, ChangeKind]] = None,
+        full_rescan: bool = False,
+        event_count: int = 0,
+        first_event_time: Optional[float] = None,
+    ):
+        self.changes = changes if changes is not None else dict()
+        self.full_rescan = full_rescan
+        self.event_count = event_count
+        self.first_event_time = first_event_time
+
+    def __len__(self) -> int:
+        return len(self.changes)
+
+    def __bool__(self) -> bool:
+        return self.full_rescan or bool(self.changes)
+
+    def merge(self, newer: "ChangeSet") -> None:
+        """Apply the changes of a later change set on top of this one"""
+        self.event_count += newer.event_count
+        if newer.first_event_time is not None and (
+            self.first_event_time is None
+            or newer.first_event_time < self.first_event_time
+        ):
+            self.first_event_time = newer.first_event_time
+        self.full_rescan = self.full_rescan or newer.full_rescan
+        if self.full_rescan:
+            self.changes = dict()
+            return
+        for relative, kind in newer.changes.items():
+            previous = self.changes.get(relative)
+            merged = kind if previous is None else _MERGE_TABLE[previous][kind]
+            if merged is None:
+                del self.changes[relative]
+            else:
+                self.changes[relative] = merged
+
+    def paths(self, kind: Optional[ChangeKind] = None) -> List[str]:
+        """Relative paths of queued changes, optionally of a single kind"""
+        if kind is None:
+            return list(self.changes)
+        return [path for path, value in self.changes.items() if value == kind]
+
+
+class EventQueue:
+    """
+    Bounded, deduplicating queue of filesystem changes for one directory.
+    Paths are stored relative to the directory root. Once more than
+    max_paths distinct paths are pending, the individual entries are
+    dropped and the queue degrades to a single full rescan marker.
+    Not thread-safe, callers are expected to hold their own lock.
+    """
+
+    def __init__(self, root: str, max_paths: int):
+        self.root = os.path.abspath(root)
+        self.max_paths = max_paths
+        self._changes: Dict[str, ChangeKind] = dict()
+        self._full_rescan = False
+        self._event_count = 0
+        self._first_event_time: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._changes)
+
+    def __bool__(self) -> bool:
+        return self._full_rescan or bool(self._changes)
+
+    @property
+    def full_rescan(self) -> bool:
+        return self._full_rescan
+
+    def relative_path(self, path: str) -> Optional[str]:
+        """Path relative to the root, None if outside it or internal"""
+        path = os.path.abspath(os.fsdecode(path))
+        if path == self.root:
+            return None
+        try:
+            relative = os.path.relpath(path, self.root)
+        except ValueError:
+            return None
+        if relative.startswith(os.pardir):
+            return None
+        if GIT_DIRECTORY_NAME in relative.split(os.sep):
+            return None
+        return relative
+
+    def push(self, path: str, kind: ChangeKind) -> bool:
+        """Queue a change, returns False if the path was not accepted"""
+        relative = self.relative_path(path)
+        if relative is None:
+            return False
+
+        self._event_count += 1
+        if self._first_event_time is None:
+            self._first_event_time = time.monotonic()
+
+        if self._full_rescan:
+            return True
+
+        previous = self._changes.get(relative)
+        if previous is None:
+            if len(self._changes) >= self.max_paths:
+                self._changes.clear()
+                self._full_rescan = True
+                return True
+            self._changes[relative] = kind
+            return True
+
+        merged = _MERGE_TABLE[previous][kind]
+        if merged is None:
+            del self._changes[relative]
+        else:
+            self._changes[relative] = merged
+        return True
+
+    def push_move(self, src_path: str, dest_path: str) -> bool:
+        """Queue a move as a removal of the source and a write of the dest"""
+        accepted = self.push(src_path, ChangeKind.DELETED)
+        return self.push(dest_path, ChangeKind.MODIFIED) or accepted
+
+    def request_full_rescan(self) -> None:
+        self._changes.clear()
+        self._full_rescan = True
+        if self._first_event_time is None:
+            self._first_event_time = time.monotonic()
+
+    def restore(self, older: ChangeSet) -> None:
+        """
+        Put back drained changes that could not be saved, the changes
+        queued since are applied on top of them
+        """
+        older.merge(self.drain())
+        self._changes = older.changes
+        self._full_rescan = older.full_rescan
+        self._event_count = older.event_count
+        self._first_event_time = older.first_event_time
+        if len(self._changes) > self.max_paths:
+            self.request_full_rescan()
+
+    def drain(self) -> ChangeSet:
+        """Return the accumulated net changes and reset the queue"""
+        change_set = ChangeSet(
+            changes=self._changes,
+            full_rescan=self._full_rescan,
+            event_count=self._event_count,
+            first_event_time=self._first_event_time,
+        )
+        self._changes = dict()
+        self._full_rescan = False
+        self._event_count = 0
+        self._first_event_time = None
+        return change_set
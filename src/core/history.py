@@ -0,0 +1,350 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from src.constraints import (
+    CHUNK_STORE_DIRECTORY,
+    HISTORY_FILE_SUFFIX,
+    MAX_HISTORY_PAGE_SIZE,
+)
+from src.core.chunking import is_chunk_manifest, parse_chunk_manifest
+from src.core.manifest import manifest_path_for
+from src.exceptions import GitBackendError
+from src.git_backend import MODE_TREE, CommitRecord, GitBackend
+from src.models.tracked_directory import TrackedDirectory
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+def _read_commit(backend: GitBackend, oid: str) -> CommitRecord:
+    result = backend.read_object(oid)
+    if result is None or result[0] != "commit":
+        raise GitBackendError(f"Not a commit object: {oid}")
+    return CommitRecord(oid, result[1])
+
+
+def _tree_entries(
+    backend: GitBackend, oid: Optional[str]
+) -> Dict[str, Tuple[str, str]]:
+    if oid is None:
+        return dict()
+    return {
+        name: (mode, entry) for mode, name, entry in backend.read_tree(oid)
+    }
+
+
+def _diff_trees(
+    backend: GitBackend,
+    old: Optional[str],
+    new: Optional[str],
+    prefix: str = "",
+) -> Iterator[Tuple[str, Optional[str]]]:
+    """
+    Files differing between two trees as relative path -> blob id in the
+    new tree, None if deleted. Subtrees with the same id are skipped, so
+    the cost follows the size of the change rather than of the tree.
+    """
+    before_entries = _tree_entries(backend, old)
+    after_entries = _tree_entries(backend, new)
+    for name in sorted(before_entries.keys() | after_entries.keys()):
+        before = before_entries.get(name)
+        after = after_entries.get(name)
+        if before == after:
+            continue
+        path = prefix + name
+        before_tree = before[1] if before and before[0] == MODE_TREE else None
+        after_tree = after[1] if after and after[0] == MODE_TREE else None
+        if before_tree or after_tree:
+            yield from _diff_trees(
+                backend, before_tree, after_tree, path + os.sep
+            )
+        if after is not None and after_tree is None:
+            yield path, after[1]
+        elif before is not None and before_tree is None:
+            yield path, None
+
+
+def _snapshot_changes(
+    backend: GitBackend, old: Optional[str], new: str
+) -> Tuple[Dict[str, int], List[str]]:
+    """Files a snapshot wrote with their sizes, and files it deleted"""
+    store = CHUNK_STORE_DIRECTORY + os.sep
+    changed: Dict[str, str] = dict()
+    deleted: List[str] = []
+    chunked: Set[str] = set()
+    for relative, oid in _diff_trees(backend, old, new):
+        if relative.startswith(store):
+            # <store>/<relative path of the file>/<chunk index>
+            chunked.add(os.path.dirname(relative[len(store) :]))
+        elif oid is None:
+            deleted.append(relative)
+        else:
+            changed[relative] = oid
+
+    sizes: Dict[str, int] = dict()
+    for relative, oid in changed.items():
+        if relative in chunked:
+            # The blob is a chunk manifest, it records the file size
+            result = backend.read_object(oid)
+            if result is not None and is_chunk_manifest(result[1]):
+                sizes[relative] = parse_chunk_manifest(result[1])[0]
+                continue
+        sizes[relative] = backend.object_size(oid) or 0
+    return sizes, deleted
+
+
+def _iso(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+class SnapshotHistory:
+    """
+    Per-directory sqlite index of the snapshots on the branch of a
+    repository: when each was taken, why, and which files it changed.
+    Restore points are listed from the index instead of walking commits
+    and diffing their trees. Snapshots are recorded as they are written,
+    whatever else moves the branch (pruning, syncs, commits made with the
+    git command line) is caught up from git once the branch head no
+    longer matches the newest indexed snapshot.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        # seq follows the branch, oldest snapshot first
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            "seq INTEGER PRIMARY KEY, oid TEXT NOT NULL UNIQUE, "
+            "tree TEXT NOT NULL, time INTEGER NOT NULL, "
+            "files_changed INTEGER NOT NULL, "
+            "bytes_added INTEGER NOT NULL, reason TEXT)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS snapshots_time ON snapshots (time)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS changes ("
+            "path TEXT NOT NULL, seq INTEGER NOT NULL, "
+            "deleted INTEGER NOT NULL, size INTEGER NOT NULL, "
+            "PRIMARY KEY (path, seq)) WITHOUT ROWID"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS changes_seq ON changes (seq)"
+        )
+        self._connection.commit()
+
+    @classmethod
+    def for_directory(cls, directory: TrackedDirectory) -> "SnapshotHistory":
+        return cls(manifest_path_for(directory, HISTORY_FILE_SUFFIX))
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT COUNT(*) FROM snapshots"
+            ).fetchone()
+        return row[0]
+
+    def head(self) -> Optional[str]:
+        """Newest indexed snapshot"""
+        with self._lock:
+            return self._head()
+
+    def _head(self) -> Optional[str]:
+        row = self._connection.execute(
+            "SELECT oid FROM snapshots ORDER BY seq DESC LIMIT 1"
+        ).fetchone()
+        return row[0] if row else None
+
+    def record(
+        self,
+        backend: GitBackend,
+        oid: str,
+        files: Dict[str, int],
+        deleted: List[str],
+        reason: Optional[str],
+    ) -> None:
+        """
+        Add a snapshot just committed on top of the branch. files maps
+        the relative paths it wrote to their sizes, so nothing has to be
+        diffed. If the branch moved otherwise since the last snapshot
+        recorded, the index is caught up from git first.
+        """
+        with self._lock, self._connection:
+            commit = _read_commit(backend, oid)
+            if commit.parent == self._head():
+                self._insert(commit, files, deleted, reason)
+            else:
+                self._catch_up(backend, oid)
+                self._connection.execute(
+                    "UPDATE snapshots SET reason = ? "
+                    "WHERE oid = ? AND reason IS NULL",
+                    (reason, oid),
+                )
+
+    def refresh(
+        self, backend: GitBackend, branch: str, reason: Optional[str] = None
+    ) -> int:
+        """
+        Bring the index in line with a branch, reason is given to the
+        snapshots not indexed yet. Returns how many were added.
+        """
+        head = backend.resolve(f"refs/heads/{branch}")
+        with self._lock, self._connection:
+            if head == self._head():
+                return 0
+            return self._catch_up(backend, head, reason)
+
+    def _catch_up(
+        self,
+        backend: GitBackend,
+        head: Optional[str],
+        reason: Optional[str] = None,
+    ) -> int:
+        """
+        Index the snapshots from the newest one already indexed up to
+        head, dropping indexed ones that are no longer on the branch.
+        Snapshots replayed by pruning keep their reason, they are matched
+        by tree and time. Called with the lock held.
+        """
+        missing: List[CommitRecord] = []
+        oid = head
+        known = None
+        while oid is not None:
+            row = self._connection.execute(
+                "SELECT seq, tree FROM snapshots WHERE oid = ?", (oid,)
+            ).fetchone()
+            if row is not None:
+                known = row
+                break
+            record = _read_commit(backend, oid)
+            missing.append(record)
+            oid = record.parent
+
+        seq, tree = known if known is not None else (0, None)
+        # Replays keep the order, snapshots sharing a tree and second too
+        carried: Dict[Tuple[str, int], List[Optional[str]]] = dict()
+        for row in self._connection.execute(
+            "SELECT tree, time, reason FROM snapshots "
+            "WHERE seq > ? ORDER BY seq",
+            (seq,),
+        ):
+            carried.setdefault((row[0], row[1]), []).append(row[2])
+        self._connection.execute("DELETE FROM changes WHERE seq > ?", (seq,))
+        self._connection.execute(
+            "DELETE FROM snapshots WHERE seq > ?", (seq,)
+        )
+
+        for record in reversed(missing):
+            files, deleted = _snapshot_changes(backend, tree, record.tree)
+            previous = carried.get((record.tree, int(record.time.timestamp())))
+            self._insert(
+                record,
+                files,
+                deleted,
+                previous.pop(0) if previous else reason,
+            )
+            tree = record.tree
+        if len(missing) > 1:
+            logger.debug(f"Indexed {len(missing)} snapshots for {self.path}")
+        return len(missing)
+
+    def _insert(
+        self,
+        commit: CommitRecord,
+        files: Dict[str, int],
+        deleted: List[str],
+        reason: Optional[str],
+    ) -> None:
+        cursor = self._connection.execute(
+            "INSERT INTO snapshots "
+            "(oid, tree, time, files_changed, bytes_added, reason) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                commit.oid,
+                commit.tree,
+                int(commit.time.timestamp()),
+                len(files) + len(deleted),
+                sum(files.values()),
+                reason,
+            ),
+        )
+        seq = cursor.lastrowid
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO changes (path, seq, deleted, size) "
+            "VALUES (?, ?, ?, ?)",
+            [(relative, seq, 0, size) for relative, size in files.items()]
+            + [(relative, seq, 1, 0) for relative in deleted],
+        )
+
+    def query(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: int = MAX_HISTORY_PAGE_SIZE,
+        before: Optional[int] = None,
+        path: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        One page of snapshots, newest first, taken in [since, until) and
+        older than the cursor before. With a relative path, only the
+        snapshots that wrote or deleted that file. 'next' is the cursor
+        of the following page, None on the last one.
+        """
+        limit = max(1, min(limit, MAX_HISTORY_PAGE_SIZE))
+        columns = "s.seq, s.oid, s.time, s.files_changed, s.bytes_added, "
+        columns += "s.reason"
+        clauses: List[str] = []
+        values: List[Any] = []
+        if path is None:
+            sql = f"SELECT {columns} FROM snapshots s"
+        else:
+            sql = (
+                f"SELECT {columns}, c.deleted, c.size FROM changes c "
+                "JOIN snapshots s ON s.seq = c.seq"
+            )
+            clauses.append("c.path = ?")
+            values.append(path)
+        if since is not None:
+            clauses.append("s.time >= ?")
+            values.append(int(since.timestamp()))
+        if until is not None:
+            clauses.append("s.time < ?")
+            values.append(int(until.timestamp()))
+        if before is not None:
+            clauses.append("s.seq < ?")
+            values.append(before)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY s.seq DESC LIMIT ?"
+        values.append(limit + 1)
+
+        with self._lock:
+            rows = self._connection.execute(sql, values).fetchall()
+        snapshots = []
+        for row in rows[:limit]:
+            snapshot = {
+                "id": row[1],
+                "time": _iso(row[2]),
+                "files_changed": row[3],
+                "bytes_added": row[4],
+                "reason": row[5],
+            }
+            if path is not None:
+                snapshot["deleted"] = bool(row[6])
+                snapshot["size"] = row[7]
+            snapshots.append(snapshot)
+        return {
+            "snapshots": snapshots,
+            "next": rows[limit - 1][0] if len(rows) > limit else None,
+        }
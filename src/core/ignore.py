@@ -0,0 +1,198 @@
+import os
+import re
+import stat
+from functools import lru_cache
+from typing import Iterable, List, Optional, Pattern, Tuple
+from src.models.tracked_directory import TrackedDirectory
+from src.settings import settings
+
+
+_FLAGS = re.IGNORECASE if os.name == "nt" else 0
+
+
+def translate(pattern: str, below: bool = True) -> Optional[str]:
+    """
+    Regex source for a gitignore-style glob, matched against a relative
+    path using "/" separators, with a trailing "/" for directories.
+    With below, a pattern matching a directory also matches everything
+    in it. None for blank lines and comments.
+    """
+    pattern = pattern.strip()
+    if not pattern or pattern.startswith("#"):
+        return None
+
+    directory_only = pattern.endswith("/")
+    # A separator anywhere but at the end anchors the pattern to the root
+    anchored = "/" in pattern.rstrip("/")
+    pattern = pattern.strip("/")
+
+    parts = []
+    position = 0
+    while position < len(pattern):
+        char = pattern[position]
+        if pattern.startswith("**/", position):
+            parts.append("(?:.*/)?")
+            position += 3
+            continue
+        if pattern.startswith("**", position):
+            parts.append(".*")
+            position += 2
+            continue
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", position + 1)
+            if end == -1:
+                parts.append(re.escape(char))
+            else:
+                body = pattern[position + 1 : end].replace("\\", "\\\\")
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                parts.append(f"[{body}]")
+                position = end + 1
+                continue
+        elif char == "\\" and position + 1 < len(pattern):
+            parts.append(re.escape(pattern[position + 1]))
+            position += 2
+            continue
+        else:
+            parts.append(re.escape(char))
+        position += 1
+
+    prefix = "" if anchored else "(?:.*/)?"
+    if below:
+        suffix = "/.*" if directory_only else "(?:/.*)?"
+    else:
+        suffix = "/" if directory_only else "/?"
+    return prefix + "".join(parts) + suffix
+
+
+def _compile(patterns: Iterable[str]) -> Optional[Pattern]:
+    sources = [
+        source
+        for source in (translate(pattern) for pattern in patterns)
+        if source is not None
+    ]
+    if not sources:
+        return None
+    return re.compile(
+        "(?:" + "|".join(f"(?:{source})" for source in sources) + r")\Z",
+        _FLAGS,
+    )
+
+
+def _compile_ordered(
+    patterns: Iterable[str],
+) -> Tuple[Optional[Pattern], Tuple[bool, ...]]:
+    """
+    Single regex with one group per pattern, last pattern first, so the
+    group of a match is the last matching pattern. Also returns whether
+    each group is a "!" pattern.
+    """
+    sources: List[str] = []
+    negated: List[bool] = []
+    for pattern in patterns:
+        pattern = pattern.strip()
+        negate = pattern.startswith("!")
+        source = translate(pattern[1:] if negate else pattern, below=False)
+        if source is None:
+            continue
+        sources.append(f"({source})")
+        negated.append(negate)
+    if not sources:
+        return None, ()
+    pattern = "(?:" + "|".join(reversed(sources)) + r")\Z"
+    return re.compile(pattern, _FLAGS), tuple(reversed(negated))
+
+
+def _normalize(relative: str, is_dir: bool) -> str:
+    path = relative.replace(os.sep, "/").strip("/")
+    return path + "/" if is_dir else path
+
+
+class IgnoreRules:
+    """
+    Include/exclude globs and a size limit deciding which files of a
+    tracked directory are saved. Every pattern list is compiled into a
+    single regex, so a lookup costs one match call per path component
+    whatever the number of rules. Excludes are evaluated like gitignore:
+    the last matching pattern decides, one prefixed with "!" re-includes
+    the path, and nothing below an excluded directory can be re-included.
+    With include patterns, only matching files are saved.
+    """
+
+    def __init__(
+        self,
+        include: Iterable[str] = (),
+        exclude: Iterable[str] = (),
+        max_file_size: Optional[int] = None,
+    ):
+        self._include = _compile(include)
+        self._exclude, self._negated = _compile_ordered(exclude)
+        self.max_file_size = max_file_size
+
+    @classmethod
+    def for_directory(cls, directory: TrackedDirectory) -> "IgnoreRules":
+        exclude = directory.exclude
+        if exclude is None:
+            exclude = settings.watcher.default_exclude
+        return _cached_rules(
+            tuple(directory.include),
+            tuple(exclude),
+            directory.max_file_size_bytes,
+        )
+
+    def __bool__(self) -> bool:
+        return bool(
+            self._include or self._exclude or self.max_file_size is not None
+        )
+
+    def excludes(self, relative: str, is_dir: bool = False) -> bool:
+        """Whether a path or one of its parents is excluded by pattern"""
+        if self._exclude is None:
+            return False
+        path = _normalize(relative, is_dir)
+        parent = path.find("/")
+        while 0 <= parent < len(path) - 1:
+            if self._matches(path[: parent + 1]):
+                return True
+            parent = path.find("/", parent + 1)
+        return self._matches(path)
+
+    def _matches(self, path: str) -> bool:
+        """Whether the last pattern matching a path excludes it"""
+        match = self._exclude.match(path)
+        return match is not None and not self._negated[match.lastindex - 1]
+
+    def ignores(
+        self,
+        relative: str,
+        st: Optional[os.stat_result] = None,
+        is_dir: bool = False,
+    ) -> bool:
+        """Whether a path is left out of snapshots"""
+        if self.excludes(relative, is_dir):
+            return True
+        if is_dir:
+            return False
+        if self._include is not None and not self._include.match(
+            _normalize(relative, False)
+        ):
+            return True
+        return (
+            st is not None
+            and self.max_file_size is not None
+            and not stat.S_ISDIR(st.st_mode)
+            and st.st_size > self.max_file_size
+        )
+
+
+@lru_cache(maxsize=None)
+def _cached_rules(
+    include: Tuple[str, ...],
+    exclude: Tuple[str, ...],
+    max_file_size: Optional[int],
+) -> IgnoreRules:
+    return IgnoreRules(include, exclude, max_file_size)
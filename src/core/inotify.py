@@ -0,0 +1,347 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from watchdog.events import (
+    DirCreatedEvent,
+    DirDeletedEvent,
+    DirModifiedEvent,
+    DirMovedEvent,
+    FileClosedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+    FileSystemEvent,
+)
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_ONLYDIR
+    | IN_DONT_FOLLOW
+    | IN_EXCL_UNLINK
+)
+# struct inotify_event: wd, mask, cookie, len, then the name
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+# A rename arrives as a pair of events, an unpaired half moved the entry
+# out of (or into) the watched trees
+_MOVE_PAIR_TIMEOUT_SEC = 0.05
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        # Only there from glibc 2.9 on
+        libc.inotify_init1
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_uint32,
+    ]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+_libc = _load_libc()
+
+
+def inotify_available() -> bool:
+    return _libc is not None
+
+
+def _os_error(path: Optional[str] = None) -> OSError:
+    code = ctypes.get_errno()
+    return OSError(code, os.strerror(code), path)
+
+
+class InotifyWatcher(threading.Thread):
+    """
+    Recursive watches on any number of roots from one inotify instance
+    and one thread. watchdog opens an instance and starts a thread for
+    each scheduled path, which runs into the per-user instance limit and
+    grows with every tracked directory. Events are handed to dispatch as
+    watchdog events, lost events (queue overflow) to overflow.
+    """
+
+    def __init__(
+        self,
+        dispatch: Callable[[FileSystemEvent], None],
+        overflow: Callable[[], None],
+    ):
+        super().__init__(name="inotify-watcher", daemon=True)
+        if _libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._dispatch = dispatch
+        self._overflow = overflow
+        self._fd = _libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self._fd < 0:
+            raise _os_error()
+        self._wake_read, self._wake_write = os.pipe()
+        self._lock = threading.Lock()
+        self._paths: Dict[int, str] = dict()
+        self._descriptors: Dict[str, int] = dict()
+        # Move cookie -> source path, whether it is a directory, deadline
+        self._moves: Dict[int, Tuple[str, bool, float]] = dict()
+
+    @property
+    def watch_count(self) -> int:
+        return len(self._paths)
+
+    def add_root(self, path: str) -> None:
+        """Watch a directory and everything below it"""
+        with self._lock:
+            self._add_tree(path)
+
+    def remove_root(self, path: str) -> None:
+        with self._lock:
+            self._remove_tree(path)
+
+    def stop(self) -> None:
+        # The thread closes the pipe once it read this, not before
+        os.write(self._wake_write, b"\0")
+
+    def run(self) -> None:
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        poller.register(self._wake_read, select.POLLIN)
+        try:
+            while True:
+                timeout = None
+                if self._moves:
+                    timeout = _MOVE_PAIR_TIMEOUT_SEC * 1000
+                ready = poller.poll(timeout)
+                if any(fd == self._wake_read for fd, _ in ready):
+                    return
+                events: List[FileSystemEvent] = []
+                lost = False
+                with self._lock:
+                    if any(fd == self._fd for fd, _ in ready):
+                        lost = self._read(events)
+                    self._expire_moves(events)
+                if lost:
+                    logger.warning("inotify queue overflowed, rescanning")
+                    self._overflow()
+                for event in events:
+                    try:
+                        self._dispatch(event)
+                    except Exception as e:
+                        logger.exception(f"Failed to dispatch {event}: {e}")
+        finally:
+            os.close(self._fd)
+            os.close(self._wake_read)
+            os.close(self._wake_write)
+
+    def _read(self, events: List[FileSystemEvent]) -> bool:
+        """Translate all pending events, True if some were lost"""
+        lost = False
+        while True:
+            try:
+                data = os.read(self._fd, _READ_SIZE)
+            except BlockingIOError:
+                return lost
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT_HEADER.unpack_from(
+                    data, offset
+                )
+                start = offset + _EVENT_HEADER.size
+                name = data[start : start + length].rstrip(b"\0")
+                offset = start + length
+                if mask & IN_Q_OVERFLOW:
+                    lost = True
+                    continue
+                self._translate(wd, mask, cookie, os.fsdecode(name), events)
+
+    def _translate(
+        self,
+        wd: int,
+        mask: int,
+        cookie: int,
+        name: str,
+        events: List[FileSystemEvent],
+    ) -> None:
+        if mask & IN_IGNORED:
+            path = self._paths.pop(wd, None)
+            if path is not None and self._descriptors.get(path) == wd:
+                del self._descriptors[path]
+            return
+        parent = self._paths.get(wd)
+        if parent is None or not name:
+            # Events of the watched directory itself, its parent reports
+            # the same change
+            return
+        path = os.path.join(parent, name)
+        is_dir = bool(mask & IN_ISDIR)
+        move = None
+        if mask & IN_MOVED_TO:
+            move = self._moves.pop(cookie, None)
+        # A pending move out of the tree happened before this event, e.g.
+        # a save moved away and written again under the same name
+        self._expire_moves(events, related=path)
+
+        if mask & IN_MOVED_FROM:
+            deadline = time.monotonic() + _MOVE_PAIR_TIMEOUT_SEC
+            self._moves[cookie] = (path, is_dir, deadline)
+        elif mask & IN_MOVED_TO:
+            if move is None:
+                self._created(path, is_dir, events)
+            elif is_dir:
+                self._rename_tree(move[0], path)
+                events.append(DirMovedEvent(move[0], path))
+            else:
+                events.append(FileMovedEvent(move[0], path))
+        elif mask & IN_CREATE:
+            self._created(path, is_dir, events)
+        elif mask & IN_DELETE:
+            if is_dir:
+                events.append(DirDeletedEvent(path))
+            else:
+                events.append(FileDeletedEvent(path))
+        elif mask & IN_CLOSE_WRITE:
+            if not is_dir:
+                events.append(FileClosedEvent(path))
+        elif mask & (IN_MODIFY | IN_ATTRIB):
+            if is_dir:
+                events.append(DirModifiedEvent(path))
+            else:
+                events.append(FileModifiedEvent(path))
+
+    def _expire_moves(
+        self, events: List[FileSystemEvent], related: Optional[str] = None
+    ) -> None:
+        """
+        Report unpaired moves as deletions once their pair is overdue or,
+        with related, right away if they concern that path, an entry
+        below it or one of its parents, so events stay in order
+        """
+        now = time.monotonic()
+        for cookie, (path, is_dir, deadline) in list(self._moves.items()):
+            if related is None:
+                if deadline > now:
+                    continue
+            elif not (
+                path == related
+                or related.startswith(path + os.sep)
+                or path.startswith(related + os.sep)
+            ):
+                continue
+            del self._moves[cookie]
+            if is_dir:
+                self._remove_tree(path)
+                events.append(DirDeletedEvent(path))
+            else:
+                events.append(FileDeletedEvent(path))
+
+    def _created(
+        self, path: str, is_dir: bool, events: List[FileSystemEvent]
+    ) -> None:
+        if not is_dir:
+            events.append(FileCreatedEvent(path))
+            return
+        events.append(DirCreatedEvent(path))
+        # Entries written before the watch was in place went unnoticed
+        self._add_tree(path, events)
+
+    def _add_tree(
+        self, root: str, events: Optional[List[FileSystemEvent]] = None
+    ) -> None:
+        pending = [root]
+        while pending:
+            path = pending.pop()
+            if not self._add_watch(path):
+                continue
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        if is_dir:
+                            pending.append(entry.path)
+                        if events is None:
+                            continue
+                        if is_dir:
+                            events.append(DirCreatedEvent(entry.path))
+                        else:
+                            events.append(FileCreatedEvent(entry.path))
+            except OSError as e:
+                logger.debug(f"Could not list {path}: {e}")
+
+    def _add_watch(self, path: str) -> bool:
+        wd = _libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            error = _os_error(path)
+            if error.errno == errno.ENOSPC:
+                logger.error(
+                    f"Out of inotify watches, changes below {path} will "
+                    "be missed (raise fs.inotify.max_user_watches)"
+                )
+            elif error.errno not in (errno.ENOENT, errno.ENOTDIR):
+                logger.warning(f"Could not watch {path}: {error}")
+            return False
+        previous = self._paths.get(wd)
+        if previous is not None and previous != path:
+            # Same directory reached under another name
+            self._descriptors.pop(previous, None)
+        self._paths[wd] = path
+        self._descriptors[path] = wd
+        return True
+
+    def _remove_tree(self, root: str) -> None:
+        for path in self._below(root):
+            wd = self._descriptors.pop(path)
+            self._paths.pop(wd, None)
+            _libc.inotify_rm_watch(self._fd, wd)
+
+    def _rename_tree(self, source: str, destination: str) -> None:
+        for path in self._below(source):
+            wd = self._descriptors.pop(path)
+            renamed = destination + path[len(source) :]
+            self._paths[wd] = renamed
+            self._descriptors[renamed] = wd
+
+    def _below(self, root: str) -> List[str]:
+        prefix = root + os.sep
+        return [
+            path
+            for path in self._descriptors
+            if path == root or path.startswith(prefix)
+        ]
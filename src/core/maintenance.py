@@ -0,0 +1,151 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Hashable, List, Optional, Set, Tuple
+from src.constraints import GIT_REWRITE_REF
+from src.git_backend import CommitRecord, GitBackend
+from src.git_utils import delete_ref, update_ref
+from src.models.tracked_directory import RetentionPolicy
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+def _month_index(when: datetime) -> int:
+    return when.year * 12 + when.month - 1
+
+
+def _tiers(
+    policy: RetentionPolicy, now: datetime
+) -> List[Tuple[Callable[[datetime], Hashable], Callable[[datetime], bool]]]:
+    """(bucket of a commit time, whether a time is inside the window)"""
+    tiers = []
+    if policy.hourly_hours > 0:
+        since = now - timedelta(hours=policy.hourly_hours)
+        tiers.append(
+            (
+                lambda t: t.replace(minute=0, second=0, microsecond=0),
+                lambda t, since=since: t >= since,
+            )
+        )
+    if policy.daily_days > 0:
+        since = now - timedelta(days=policy.daily_days)
+        tiers.append((lambda t: t.date(), lambda t, since=since: t >= since))
+    if policy.weekly_weeks > 0:
+        since = now - timedelta(weeks=policy.weekly_weeks)
+        tiers.append(
+            (lambda t: t.isocalendar()[:2], lambda t, since=since: t >= since)
+        )
+    if policy.monthly_months > 0:
+        oldest = _month_index(now) - policy.monthly_months
+        tiers.append(
+            (_month_index, lambda t, oldest=oldest: _month_index(t) > oldest)
+        )
+    return tiers
+
+
+def select_snapshots(
+    policy: RetentionPolicy,
+    snapshots: List[Tuple[str, datetime]],
+    now: Optional[datetime] = None,
+) -> Set[str]:
+    """
+    Ids of the snapshots a policy keeps. snapshots are (id, time) pairs,
+    newest first, so the first snapshot seen in a bucket is its newest.
+    """
+    now = now or datetime.now(timezone.utc)
+    keep_all_since = now - timedelta(hours=policy.keep_all_hours)
+    tiers = _tiers(policy, now)
+    seen: List[Set[Hashable]] = [set() for _ in tiers]
+
+    kept = set()
+    for index, (oid, when) in enumerate(snapshots):
+        keep = index == 0 or when >= keep_all_since
+        for (bucket_of, inside), buckets in zip(tiers, seen):
+            if not inside(when):
+                continue
+            bucket = bucket_of(when)
+            if bucket not in buckets:
+                buckets.add(bucket)
+                keep = True
+        if keep:
+            kept.add(oid)
+    return kept
+
+
+def prune_snapshots(
+    backend: GitBackend,
+    branch: str,
+    policy: RetentionPolicy,
+    now: Optional[datetime] = None,
+) -> int:
+    """
+    Drop the snapshots of a branch a retention policy does not keep by
+    replaying the kept ones as a new history. The branch only moves if
+    nothing was committed in the meantime. Returns how many were dropped,
+    their objects stay in the repository until garbage collected.
+    """
+    ref = f"refs/heads/{branch}"
+    history: List[CommitRecord] = backend.history(ref)
+    kept = select_snapshots(
+        policy, [(record.oid, record.time) for record in history], now
+    )
+    if len(kept) == len(history):
+        return 0
+
+    # Commits older than the first dropped one keep their ids
+    oldest_first = list(reversed(history))
+    first = next(
+        index
+        for index, record in enumerate(oldest_first)
+        if record.oid not in kept
+    )
+    base = oldest_first[first - 1].oid if first else None
+    records = [
+        record for record in oldest_first[first:] if record.oid in kept
+    ]
+
+    new_head = backend.replay(GIT_REWRITE_REF, records, parent=base)
+    try:
+        update_ref(backend.path, ref, new_head, history[0].oid)
+    finally:
+        delete_ref(backend.path, GIT_REWRITE_REF)
+    return len(history) - len(kept)
+
+
+class MaintenanceScheduler:
+    """
+    Background thread running repository maintenance every interval.
+    The task decides per directory whether it is idle enough to compact,
+    the scheduler only provides the timing and keeps failures contained.
+    """
+
+    def __init__(self, interval: float, task: Callable[[], None]):
+        self.interval = interval
+        self.task = task
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="maintenance", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop scheduling, waits for a running pass to finish"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.task()
+            except Exception as ex:
+                logger.error(f"Repository maintenance failed: {ex}")
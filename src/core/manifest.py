@@ -0,0 +1,347 @@
+import hashlib
+import os
+import sqlite3
+import stat
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from src.constraints import GIT_DIRECTORY_NAME, MANIFEST_FILE_SUFFIX
+from src.models.tracked_directory import TrackedDirectory
+from src.core.ignore import IgnoreRules
+from src.metrics import PhaseTimer
+from src.settings import settings
+
+
+class ManifestEntry:
+    """Recorded state of a single file at the time of the last save"""
+
+    size: int
+    mtime_ns: int
+    inode: int
+    digest: bytes
+    # Id of the chunk manifest the snapshot holds for a file stored as
+    # chunks, None for files stored whole or when it is not known
+    stored: Optional[str]
+
+    def __init__(
+        self,
+        size: int,
+        mtime_ns: int,
+        inode: int,
+        digest: bytes,
+        stored: Optional[str] = None,
+    ):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+        self.digest = digest
+        self.stored = stored
+
+    @classmethod
+    def from_stat(
+        cls,
+        st: os.stat_result,
+        digest: bytes,
+        recorded: Optional["ManifestEntry"] = None,
+    ) -> "ManifestEntry":
+        """Entry for a file, keeping what was recorded for the content"""
+        stored = None
+        if recorded is not None and recorded.digest == digest:
+            stored = recorded.stored
+        return cls(st.st_size, st.st_mtime_ns, st.st_ino, digest, stored)
+
+    def stat_key(self) -> Tuple[int, int, int]:
+        return (self.size, self.mtime_ns, self.inode)
+
+
+def stat_key(st: os.stat_result) -> Tuple[int, int, int]:
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+# Digest of a file given its path and lstat
+Hasher = Callable[[str, os.stat_result], bytes]
+
+
+def hash_file(path: str, st: Optional[os.stat_result] = None) -> bytes:
+    """Git blob id of a file, read through one fixed-size buffer"""
+    if st is None:
+        st = os.lstat(path)
+    if stat.S_ISLNK(st.st_mode):
+        target = os.fsencode(os.readlink(path))
+        digest = hashlib.sha1(b"blob %d\0" % len(target))
+        digest.update(target)
+        return digest.digest()
+
+    digest = hashlib.sha1(b"blob %d\0" % st.st_size)
+    buffer = memoryview(bytearray(settings.storage.stream_buffer_bytes))
+    with open(path, "rb", buffering=0) as file:
+        while True:
+            count = file.readinto(buffer)
+            if not count:
+                break
+            digest.update(buffer[:count])
+    return digest.digest()
+
+
+def manifest_path_for(
+    directory: TrackedDirectory, suffix: str = MANIFEST_FILE_SUFFIX
+) -> str:
+    """Manifest location, next to the metadata file"""
+    root = os.path.dirname(os.path.abspath(settings.metadata.storage_filepath))
+    key = hashlib.sha1(os.fsencode(str(directory.path))).hexdigest()[:16]
+    return os.path.join(
+        root,
+        settings.metadata.manifest_directory,
+        f"{key}{suffix}",
+    )
+
+
+class FileManifest:
+    """
+    Per-directory sqlite index of relative path -> (size, mtime_ns, inode,
+    blob id) describing the directory as of its last snapshot. Used to
+    narrow a set of candidate paths down to the ones that actually changed.
+    """
+
+    def __init__(self, path: str, rules: Optional[IgnoreRules] = None):
+        self.path = path
+        self.rules = rules or IgnoreRules()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+            "mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, "
+            "digest BLOB NOT NULL, stored TEXT) WITHOUT ROWID"
+        )
+        columns = {
+            row[1]
+            for row in self._connection.execute("PRAGMA table_info(files)")
+        }
+        if "stored" not in columns:
+            # Manifests written before chunk manifest ids were recorded
+            self._connection.execute(
+                "ALTER TABLE files ADD COLUMN stored TEXT"
+            )
+        self._connection.commit()
+
+    @classmethod
+    def for_directory(cls, directory: TrackedDirectory) -> "FileManifest":
+        return cls(
+            manifest_path_for(directory),
+            rules=IgnoreRules.for_directory(directory),
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT COUNT(*) FROM files"
+            ).fetchone()
+        return row[0]
+
+    def get(self, relative: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size, mtime_ns, inode, digest, stored FROM files "
+                "WHERE path = ?",
+                (relative,),
+            ).fetchone()
+        if row is None:
+            return None
+        return ManifestEntry(*row)
+
+    def entries(self) -> Dict[str, ManifestEntry]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT path, size, mtime_ns, inode, digest, stored "
+                "FROM files"
+            ).fetchall()
+        return {row[0]: ManifestEntry(*row[1:]) for row in rows}
+
+    def paths_under(self, relative: str) -> List[str]:
+        """Recorded paths equal to or nested below a relative path"""
+        prefix = relative.rstrip(os.sep) + os.sep
+        # Every path starting with "dir/" sorts between "dir/" and "dir0"
+        upper = prefix[:-1] + chr(ord(os.sep) + 1)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT path FROM files WHERE path = ? "
+                "OR (path >= ? AND path < ?)",
+                (relative, prefix, upper),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def apply(
+        self, changed: Dict[str, ManifestEntry], deleted: Iterable[str]
+    ) -> None:
+        """Record the state that was just committed"""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "DELETE FROM files WHERE path = ?",
+                ((path,) for path in deleted),
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO files "
+                "(path, size, mtime_ns, inode, digest, stored) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (path, e.size, e.mtime_ns, e.inode, e.digest, e.stored)
+                    for path, e in changed.items()
+                ),
+            )
+
+    def _check(
+        self,
+        root: str,
+        relative: str,
+        st: os.stat_result,
+        recorded: Optional[ManifestEntry],
+        changed: Dict[str, ManifestEntry],
+        touched: Dict[str, ManifestEntry],
+        timer: Optional[PhaseTimer] = None,
+        hasher: Hasher = hash_file,
+    ) -> None:
+        if recorded is not None and recorded.stat_key() == stat_key(st):
+            return
+        started = time.perf_counter()
+        digest = hasher(os.path.join(root, relative), st)
+        if timer is not None:
+            timer.add("hash", time.perf_counter() - started)
+        entry = ManifestEntry.from_stat(st, digest, recorded)
+        if recorded is not None and recorded.digest == digest:
+            touched[relative] = entry
+        else:
+            changed[relative] = entry
+
+    def _walk(self, root: str, relative: str = ""):
+        """Yield (relative path, lstat) of every saved file below a path"""
+        stack = [relative]
+        while stack:
+            current = stack.pop()
+            try:
+                iterator = os.scandir(os.path.join(root, current))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            with iterator:
+                for item in iterator:
+                    if item.name == GIT_DIRECTORY_NAME:
+                        continue
+                    path = os.path.join(current, item.name)
+                    if item.is_dir(follow_symlinks=False):
+                        if not self.rules.excludes(path, is_dir=True):
+                            stack.append(path)
+                        continue
+                    st = item.stat(follow_symlinks=False)
+                    if not self.rules.ignores(path, st):
+                        yield path, st
+
+    def current_entries(self, root: str) -> Dict[str, ManifestEntry]:
+        """
+        Entries of the files currently on disk, reusing recorded digests
+        of files whose stat data did not change and hashing the rest
+        """
+        recorded = self.entries()
+        current = dict()
+        for relative, st in self._walk(root):
+            entry = recorded.get(relative)
+            if entry is None or entry.stat_key() != stat_key(st):
+                digest = hash_file(os.path.join(root, relative), st)
+                entry = ManifestEntry.from_stat(st, digest, entry)
+            current[relative] = entry
+        return current
+
+    def stale_paths(self, root: str) -> Tuple[List[str], List[str]]:
+        """
+        Walk the whole tree comparing stat data only. Returns (candidates,
+        deleted) where candidates are new files or files whose size, mtime
+        or inode no longer match, content is not read.
+        """
+        recorded = {
+            relative: entry.stat_key()
+            for relative, entry in self.entries().items()
+        }
+        candidates = []
+        for relative, st in self._walk(root):
+            if recorded.pop(relative, None) != stat_key(st):
+                candidates.append(relative)
+        return candidates, list(recorded)
+
+    def diff(
+        self,
+        root: str,
+        candidates: Optional[Iterable[str]] = None,
+        timer: Optional[PhaseTimer] = None,
+        hasher: Hasher = hash_file,
+    ) -> Tuple[Dict[str, ManifestEntry], List[str], Dict[str, ManifestEntry]]:
+        """
+        Compare candidate paths (or the whole tree when None) against the
+        manifest. Returns (changed, deleted, touched) where touched holds
+        files whose stat changed but whose content did not. Time spent
+        hashing is added to the "hash" phase of timer. A custom hasher
+        may store file content while hashing it.
+        """
+        changed: Dict[str, ManifestEntry] = dict()
+        touched: Dict[str, ManifestEntry] = dict()
+        deleted: List[str] = []
+
+        if candidates is None:
+            recorded = self.entries()
+            for relative, st in self._walk(root):
+                entry = recorded.pop(relative, None)
+                self._check(
+                    root, relative, st, entry, changed, touched, timer, hasher
+                )
+            return changed, list(recorded), touched
+
+        for relative in candidates:
+            try:
+                st = os.lstat(os.path.join(root, relative))
+            except (FileNotFoundError, NotADirectoryError):
+                deleted.extend(self.paths_under(relative))
+                continue
+
+            is_dir = stat.S_ISDIR(st.st_mode)
+            if self.rules.ignores(relative, st, is_dir=is_dir):
+                # Saved before the rules matched it, stop saving it
+                deleted.extend(self.paths_under(relative))
+                continue
+
+            if is_dir:
+                seen = set()
+                for path, child in self._walk(root, relative):
+                    seen.add(path)
+                    entry = self.get(path)
+                    self._check(
+                        root,
+                        path,
+                        child,
+                        entry,
+                        changed,
+                        touched,
+                        timer,
+                        hasher,
+                    )
+                deleted.extend(
+                    path
+                    for path in self.paths_under(relative)
+                    if path not in seen and path != relative
+                )
+                continue
+
+            entry = self.get(relative)
+            self._check(
+                root, relative, st, entry, changed, touched, timer, hasher
+            )
+            # A directory that was replaced by a file
+            deleted.extend(
+                path for path in self.paths_under(relative) if path != relative
+            )
+
+        return changed, deleted, touched
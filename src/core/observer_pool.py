@@ -0,0 +1,197 @@
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.api import BaseObserver, ObservedWatch
+from src.core.event_handler import TrackedDirectoryHandler
+from src.core.inotify import InotifyWatcher, inotify_available
+from src.models.registry import DirectoryRegistry
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+class _RoutingHandler(FileSystemEventHandler):
+    """Forwards events of a shared watch to the handlers owning the path"""
+
+    def __init__(self, pool: "ObserverPool"):
+        self.pool = pool
+        super().__init__()
+
+    def dispatch(self, event: FileSystemEvent) -> None:
+        paths = [os.fsdecode(event.src_path)]
+        if event.dest_path:
+            paths.append(os.fsdecode(event.dest_path))
+
+        delivered = set()
+        for path in paths:
+            for handler in self.pool.handlers_for(path):
+                if id(handler) in delivered:
+                    continue
+                delivered.add(id(handler))
+                handler.dispatch(event)
+
+
+class ObserverPool:
+    """
+    Small fixed set of observers shared by all tracked directories.
+    Every directory is registered with its own handler, events are routed
+    to the owning handlers by path prefix. A directory nested inside an
+    already watched one does not get a watch of its own. Watches can be
+    added and removed at runtime without touching the others.
+
+    Where inotify is available all directories share a single inotify
+    instance and thread (native), whatever their number. Elsewhere they
+    are spread over size watchdog observers, which still run an emitter
+    thread per watched directory.
+    """
+
+    def __init__(
+        self,
+        size: int = 1,
+        observer_factory: Callable[[], BaseObserver] = Observer,
+        native: Optional[bool] = None,
+    ):
+        if size < 1:
+            raise ValueError("Observer pool size must be at least 1")
+        if native is None:
+            native = inotify_available()
+        self._router = _RoutingHandler(self)
+        self.watcher: Optional[InotifyWatcher] = None
+        self.observers: List[BaseObserver] = []
+        if native:
+            self.watcher = InotifyWatcher(
+                self._router.dispatch, self._events_lost
+            )
+        else:
+            self.observers = [observer_factory() for _ in range(size)]
+        self._handlers: DirectoryRegistry[TrackedDirectoryHandler] = (
+            DirectoryRegistry(
+                directory_of=lambda handler: handler.tracked_directory
+            )
+        )
+        # Root -> observer and watch, None for roots of the native watcher
+        self._watches: Dict[
+            str, Optional[Tuple[BaseObserver, ObservedWatch]]
+        ] = dict()
+        self._lock = threading.RLock()
+        self._started = False
+
+    @staticmethod
+    def _normalize(path) -> str:
+        return os.path.abspath(os.fsdecode(path))
+
+    @staticmethod
+    def _ancestors(path: str):
+        """Yield the path itself followed by each of its parents"""
+        while True:
+            yield path
+            parent = os.path.dirname(path)
+            if parent == path:
+                return
+            path = parent
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            if self.watcher is not None:
+                self.watcher.start()
+            for observer in self.observers:
+                observer.start()
+            self._started = True
+
+    def stop(self) -> None:
+        with self._lock:
+            for root in list(self._watches):
+                self._unschedule(root)
+            self._handlers.clear()
+            if not self._started:
+                return
+            if self.watcher is not None:
+                self.watcher.stop()
+            for observer in self.observers:
+                observer.stop()
+            self._started = False
+        if self.watcher is not None:
+            self.watcher.join()
+        for observer in self.observers:
+            observer.join()
+
+    def handlers_for(self, path: str) -> List[TrackedDirectoryHandler]:
+        """Handlers of all registered directories containing the path"""
+        # Lock-free read, the observers dispatch while holding their own
+        # lock which schedule() needs, so taking ours here could deadlock.
+        # Single dict lookups are atomic, which is all the registry does.
+        return self._handlers.owners_of(path)
+
+    def is_watched(self, path) -> bool:
+        return path in self._handlers
+
+    def add(self, handler: TrackedDirectoryHandler) -> None:
+        """Register a handler for its directory, scheduling it if needed"""
+        path = self._normalize(handler.tracked_directory.path)
+        with self._lock:
+            if path in self._handlers:
+                raise ValueError(f"Directory already watched: {path}")
+            self._handlers.add(handler)
+
+            if self._covering_watch(path) is not None:
+                logger.debug(f"Reusing an enclosing watch for {path}")
+                return
+
+            for root in list(self._watches):
+                if root.startswith(path + os.sep):
+                    self._unschedule(root)
+            self._schedule(path)
+
+    def remove(self, path) -> None:
+        """Unregister a directory, other watches are left untouched"""
+        path = self._normalize(path)
+        with self._lock:
+            if path not in self._handlers:
+                return
+            self._handlers.pop(path)
+            if path not in self._watches:
+                return
+
+            self._unschedule(path)
+            orphans = sorted(
+                root
+                for root in self._handlers.paths()
+                if root.startswith(path + os.sep)
+            )
+            for root in orphans:
+                if self._covering_watch(root) is None:
+                    self._schedule(root)
+
+    def _covering_watch(self, path: str) -> Optional[str]:
+        for ancestor in self._ancestors(path):
+            if ancestor in self._watches:
+                return ancestor
+        return None
+
+    def _events_lost(self) -> None:
+        for handler in self._handlers.values():
+            handler.events_lost()
+
+    def _schedule(self, path: str) -> None:
+        if self.watcher is not None:
+            self.watcher.add_root(path)
+            self._watches[path] = None
+        else:
+            observer = min(self.observers, key=lambda obs: len(obs.emitters))
+            watch = observer.schedule(self._router, path, recursive=True)
+            self._watches[path] = (observer, watch)
+        logger.debug(f"Scheduled shared watch for {path}")
+
+    def _unschedule(self, path: str) -> None:
+        entry = self._watches.pop(path)
+        if entry is None:
+            self.watcher.remove_root(path)
+        else:
+            observer, watch = entry
+            observer.unschedule(watch)
+        logger.debug(f"Unscheduled shared watch for {path}")
@@ -0,0 +1,330 @@
+import heapq
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from watchdog.events import (
+    DirCreatedEvent,
+    DirDeletedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileSystemEvent,
+)
+from src.constraints import GIT_DIRECTORY_NAME
+from src.core.event_handler import TrackedDirectoryHandler
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+# (size, mtime_ns, inode) of a file
+FileState = Tuple[int, int, int]
+
+# Listings taken this close to a directory's mtime may have missed a
+# change made within the same timestamp tick, those are listed again
+_RACY_WINDOW_NS = 2 * 10**9
+
+
+class _DirectoryState:
+    """Last seen listing of a single directory"""
+
+    mtime_ns: int
+    files: Dict[str, FileState]
+    directories: List[str]
+    listed_at_ns: int
+
+    def __init__(
+        self,
+        mtime_ns: int,
+        files: Dict[str, FileState],
+        directories: List[str],
+    ):
+        self.mtime_ns = mtime_ns
+        self.files = files
+        self.directories = directories
+        self.listed_at_ns = time.time_ns()
+
+    def unchanged(self, mtime_ns: int) -> bool:
+        """Whether the listing is still valid for a directory mtime"""
+        return (
+            mtime_ns == self.mtime_ns
+            and self.listed_at_ns - mtime_ns > _RACY_WINDOW_NS
+        )
+
+
+def _file_state(st: os.stat_result) -> FileState:
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+class PolledDirectory:
+    """
+    In-memory snapshot of a tracked directory compared on every poll.
+    A directory is only listed again when its own mtime changed, i.e.
+    when entries were added, removed or renamed in it. Known files are
+    stat'ed to catch in-place writes, which do not touch the directory.
+    """
+
+    def __init__(self, handler: TrackedDirectoryHandler):
+        self.handler = handler
+        self.root = str(handler.tracked_directory.path)
+        self._directories: Dict[str, _DirectoryState] = dict()
+        self._events: List[FileSystemEvent] = []
+        self._primed = False
+        self.interval = 0.0
+        # Sequence of the live entry in the engine's heap
+        self.sequence = 0
+
+    def _full(self, relative: str) -> str:
+        return os.path.join(self.root, relative) if relative else self.root
+
+    def _skips(self, relative: str, is_dir: bool) -> bool:
+        name = os.path.basename(relative)
+        if is_dir and name == GIT_DIRECTORY_NAME:
+            return True
+        return self.handler.rules.excludes(relative, is_dir=is_dir)
+
+    def _list(
+        self, relative: str
+    ) -> Optional[Tuple[int, Dict[str, FileState], List[str]]]:
+        """Stat'ed listing of a directory, None if it is gone"""
+        path = self._full(relative)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            iterator = os.scandir(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        files: Dict[str, FileState] = dict()
+        directories: List[str] = []
+        with iterator:
+            for item in iterator:
+                child = os.path.join(relative, item.name)
+                try:
+                    is_dir = item.is_dir(follow_symlinks=False)
+                    if self._skips(child, is_dir):
+                        continue
+                    if is_dir:
+                        directories.append(item.name)
+                    else:
+                        files[item.name] = _file_state(
+                            item.stat(follow_symlinks=False)
+                        )
+                except FileNotFoundError:
+                    continue
+        return mtime_ns, files, directories
+
+    def prime(self) -> None:
+        """Record the current tree without reporting anything"""
+        self._directories.clear()
+        self._scan("", emit=False)
+        self._events.clear()
+        self._primed = True
+
+    def poll(self) -> int:
+        """Compare against the snapshot, dispatch changes, return count"""
+        if not self._primed:
+            # Changes made before watching are the reconciliation's job
+            self.prime()
+            return 0
+        self._scan("", emit=True)
+        events, self._events = self._events, []
+        for event in events:
+            self.handler.dispatch(event)
+        return len(events)
+
+    def _emit(self, event: FileSystemEvent) -> None:
+        self._events.append(event)
+
+    def _scan(self, relative: str, emit: bool) -> None:
+        stack = [relative]
+        while stack:
+            current = stack.pop()
+            previous = self._directories.get(current)
+            try:
+                mtime_ns = os.stat(self._full(current)).st_mtime_ns
+            except (FileNotFoundError, NotADirectoryError):
+                if previous is not None:
+                    self._forget(current, emit)
+                continue
+
+            if previous is not None and previous.unchanged(mtime_ns):
+                # Same entries as before, only look for in-place writes
+                self._restat(current, previous, emit)
+                stack.extend(
+                    os.path.join(current, name)
+                    for name in previous.directories
+                )
+                continue
+
+            listing = self._list(current)
+            if listing is None:
+                if previous is not None:
+                    self._forget(current, emit)
+                continue
+            mtime_ns, files, directories = listing
+            if emit:
+                self._compare(current, previous, files, directories)
+            self._directories[current] = _DirectoryState(
+                mtime_ns, files, directories
+            )
+            stack.extend(os.path.join(current, name) for name in directories)
+
+    def _restat(
+        self, relative: str, state: _DirectoryState, emit: bool
+    ) -> None:
+        for name, recorded in list(state.files.items()):
+            path = os.path.join(self._full(relative), name)
+            try:
+                current = _file_state(os.lstat(path))
+            except FileNotFoundError:
+                # Racing with a removal, the next listing reports it
+                continue
+            if current != recorded:
+                state.files[name] = current
+                if emit:
+                    self._emit(FileModifiedEvent(path))
+
+    def _compare(
+        self,
+        relative: str,
+        previous: Optional[_DirectoryState],
+        files: Dict[str, FileState],
+        directories: List[str],
+    ) -> None:
+        base = self._full(relative)
+        old_files = previous.files if previous else dict()
+        old_directories = set(previous.directories) if previous else set()
+
+        for name, state in files.items():
+            recorded = old_files.get(name)
+            if recorded is None:
+                self._emit(FileCreatedEvent(os.path.join(base, name)))
+            elif recorded != state:
+                self._emit(FileModifiedEvent(os.path.join(base, name)))
+        for name in old_files:
+            if name not in files:
+                self._emit(FileDeletedEvent(os.path.join(base, name)))
+
+        for name in directories:
+            if name not in old_directories:
+                self._emit(DirCreatedEvent(os.path.join(base, name)))
+        for name in old_directories - set(directories):
+            self._forget(os.path.join(relative, name), emit=True)
+
+    def _forget(self, relative: str, emit: bool) -> None:
+        """Drop a removed directory and everything recorded below it"""
+        prefix = relative + os.sep
+        for key in list(self._directories):
+            if not relative or key == relative or key.startswith(prefix):
+                del self._directories[key]
+        if emit:
+            self._emit(DirDeletedEvent(self._full(relative)))
+
+
+class PollingEngine:
+    """
+    Single thread polling every directory whose filesystem does not
+    deliver native events (network shares, some bind mounts). Each
+    directory has its own interval: reset to the minimum whenever a poll
+    finds changes and stretched by the backoff factor after every quiet
+    poll, up to the maximum. Idle directories cost one stat per file and
+    directory every max_interval seconds.
+    """
+
+    def __init__(
+        self, min_interval: float, max_interval: float, backoff: float
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff = max(1.0, backoff)
+        self._directories: Dict[str, PolledDirectory] = dict()
+        self._due: List[Tuple[float, int, str]] = []
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def start(self) -> None:
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(
+                target=self._run, name="poller", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def add(self, handler: TrackedDirectoryHandler) -> None:
+        directory = PolledDirectory(handler)
+        directory.interval = self.min_interval
+        with self._condition:
+            self._directories[directory.root] = directory
+            # The first poll only records the tree as a baseline
+            self._schedule(directory, 0)
+
+    def remove(self, path) -> None:
+        with self._condition:
+            self._directories.pop(os.path.abspath(os.fsdecode(path)), None)
+
+    def is_polling(self, path) -> bool:
+        return os.path.abspath(os.fsdecode(path)) in self._directories
+
+    def _schedule(self, directory: PolledDirectory, delay: float) -> None:
+        self._sequence += 1
+        directory.sequence = self._sequence
+        heapq.heappush(
+            self._due,
+            (time.monotonic() + delay, self._sequence, directory.root),
+        )
+        self._condition.notify()
+
+    def _next(self) -> Optional[PolledDirectory]:
+        """Wait for the next due directory, None once stopped"""
+        with self._condition:
+            while self._running:
+                if not self._due:
+                    self._condition.wait()
+                    continue
+                due, sequence, root = self._due[0]
+                directory = self._directories.get(root)
+                if directory is None or directory.sequence != sequence:
+                    # Removed, or re-added since with an entry of its own
+                    heapq.heappop(self._due)
+                    continue
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._due)
+                return directory
+            return None
+
+    def _run(self) -> None:
+        while True:
+            directory = self._next()
+            if directory is None:
+                return
+            try:
+                changes = directory.poll()
+            except OSError as ex:
+                logger.warning(f"Failed polling {directory.root}: {ex}")
+                changes = 0
+
+            if changes:
+                directory.interval = self.min_interval
+            else:
+                directory.interval = min(
+                    self.max_interval, directory.interval * self.backoff
+                )
+            with self._condition:
+                if self._directories.get(directory.root) is directory:
+                    self._schedule(directory, directory.interval)
@@ -0,0 +1,362 @@
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from src.core.scheduler import SaveScheduler
+from src.git_utils import push_branch
+from src.metrics import PUSHES, PUSH_SECONDS
+from src.models.remote import GitRemote
+from src.models.tracked_directory import TrackedDirectory
+from src.utils import atomic_write
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+def remote_branch(name: str) -> str:
+    """Branch a tracked directory is pushed to, one per directory"""
+    branch = re.sub(r"[^A-Za-z0-9._-]+", "-", name).strip("-.")
+    return branch or "directory"
+
+
+class _Pending:
+    """Snapshots of one directory not yet pushed to one remote"""
+
+    def __init__(
+        self,
+        path: str,
+        name: str,
+        remote: str,
+        since: datetime,
+        force: bool = False,
+    ):
+        self.path = path
+        self.name = name
+        self.remote = remote
+        # Time of the oldest snapshot the remote has not received
+        self.since = since
+        self.force = force
+        # Bumped by every snapshot, a push only clears what it has seen
+        self.generation = 0
+        self.attempts = 0
+        self.due = time.monotonic()
+        self.pushing = False
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "name": self.name,
+            "remote": self.remote,
+            "since": self.since.isoformat(),
+            "force": self.force,
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "_Pending":
+        return _Pending(
+            path=data["path"],
+            name=data["name"],
+            remote=data["remote"],
+            since=datetime.fromisoformat(data["since"]),
+            force=bool(data.get("force", False)),
+        )
+
+
+class PushScheduler:
+    """
+    Pushes snapshots to the configured remotes off the save path. A
+    snapshot only marks its directory as pending in an outbox, each
+    remote then gets one push round per batch window in which every
+    pending directory is pushed once, however many snapshots it took.
+    Failed pushes back off exponentially per directory and remote.
+
+    The outbox is written to disk whenever a directory becomes pending or
+    is pushed, so snapshots made before a restart are still pushed.
+    """
+
+    def __init__(
+        self,
+        remotes: Callable[[], List[GitRemote]],
+        outbox_path: str,
+        branch: str,
+        batch_delay: float,
+        workers: int,
+        remote_concurrency: int,
+        retry_min: float,
+        retry_max: float,
+    ):
+        self.remotes = remotes
+        self.outbox_path = outbox_path
+        self.branch = branch
+        self.batch_delay = batch_delay
+        self.workers = max(1, workers)
+        self.remote_concurrency = max(1, remote_concurrency)
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str], _Pending] = dict()
+        # Rounds only hand pushes to the executor, they run inline
+        self._rounds = SaveScheduler(dispatch=lambda key, callback: callback())
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._load()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="push"
+            )
+            remotes = {entry.remote for entry in self._pending.values()}
+        self._rounds.start()
+        for url in remotes:
+            self._reschedule(url)
+
+    def stop(self) -> None:
+        """Stop pushing, waits for pushes in flight, the outbox is kept"""
+        self._rounds.stop()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def enqueue(
+        self, directory: TrackedDirectory, force: bool = False
+    ) -> None:
+        """
+        Mark a new snapshot of a directory for every remote. force is for
+        rewritten history, the next push replaces the remote branch.
+        """
+        path = str(directory.path)
+        now = time.monotonic()
+        urls = [str(remote.url) for remote in self.remotes()]
+        changed = False
+        with self._lock:
+            for url in urls:
+                entry = self._pending.get((path, url))
+                if entry is None:
+                    entry = _Pending(
+                        path,
+                        directory.name,
+                        url,
+                        since=datetime.now(timezone.utc),
+                        force=force,
+                    )
+                    entry.due = now + self.batch_delay
+                    self._pending[(path, url)] = entry
+                    changed = True
+                else:
+                    if entry.pushing:
+                        # Picked up after the push in flight, not before
+                        entry.due = now + self.batch_delay
+                    changed = changed or (force and not entry.force)
+                    entry.force = entry.force or force
+                entry.generation += 1
+            if changed:
+                self._save()
+        for url in urls:
+            self._reschedule(url)
+
+    def flush(self, path: Optional[str] = None) -> int:
+        """
+        Push pending snapshots now, skipping batch windows and backoff.
+        Returns the number of pushes started.
+        """
+        now = time.monotonic()
+        remotes = set()
+        with self._lock:
+            for entry in self._pending.values():
+                if path is None or entry.path == path:
+                    entry.due = now
+                    entry.attempts = 0
+                    remotes.add(entry.remote)
+        started = 0
+        for url in remotes:
+            self._rounds.cancel(url)
+            started += self._round(url)
+        return started
+
+    def forget(self, path: str) -> None:
+        """Drop everything pending for a directory no longer tracked"""
+        with self._lock:
+            keys = [key for key in self._pending if key[0] == path]
+            for key in keys:
+                del self._pending[key]
+            if keys:
+                self._save()
+
+    def lag(self) -> List[Tuple[Dict[str, str], float]]:
+        """Age of the oldest unpushed snapshot per directory and remote"""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            return [
+                (
+                    {"directory": entry.name, "remote": entry.remote},
+                    max(0.0, (now - entry.since).total_seconds()),
+                )
+                for entry in self._pending.values()
+            ]
+
+    def directory_lag(self, path: str) -> Optional[float]:
+        """Push lag of a directory over all remotes, None if up to date"""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            lags = [
+                (now - entry.since).total_seconds()
+                for entry in self._pending.values()
+                if entry.path == path
+            ]
+        return max(0.0, max(lags)) if lags else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def _reschedule(self, url: str) -> None:
+        """Move the round of a remote up to its earliest waiting push"""
+        with self._lock:
+            entries = [
+                entry
+                for entry in self._pending.values()
+                if entry.remote == url
+            ]
+            dues = [entry.due for entry in entries if not entry.pushing]
+            busy = sum(1 for entry in entries if entry.pushing)
+        if not dues or busy >= self.remote_concurrency:
+            # A finishing push reschedules the remote
+            return
+        deadline = min(dues)
+        current = self._rounds.deadline(url)
+        if current is None or deadline < current:
+            self._rounds.schedule_at(url, deadline, lambda: self._round(url))
+
+    def _round(self, url: str) -> int:
+        """
+        Start a push for every directory pending for a remote, up to its
+        concurrency. Directories still inside their batch window go along,
+        directories backing off after a failure wait for their retry time.
+        """
+        remote = next(
+            (item for item in self.remotes() if str(item.url) == url), None
+        )
+        now = time.monotonic()
+        started = 0
+        with self._lock:
+            executor = self._executor
+            if executor is None:
+                return 0
+            entries = [
+                entry
+                for entry in self._pending.values()
+                if entry.remote == url
+            ]
+            if remote is None:
+                # Remote removed since, nothing left to push it to
+                for entry in entries:
+                    if not entry.pushing:
+                        del self._pending[(entry.path, url)]
+                self._save()
+                return 0
+            free = self.remote_concurrency - sum(
+                1 for entry in entries if entry.pushing
+            )
+            waiting = sorted(
+                (
+                    entry
+                    for entry in entries
+                    if not entry.pushing
+                    and (entry.attempts == 0 or entry.due <= now)
+                ),
+                key=lambda entry: entry.since,
+            )
+            # Submitted under the lock, stop() cannot shut the executor
+            # down in between
+            for entry in waiting[: max(0, free)]:
+                entry.pushing = True
+                executor.submit(
+                    self._push, remote, entry, entry.generation, entry.force
+                )
+                started += 1
+        self._reschedule(url)
+        return started
+
+    def _push(
+        self, remote: GitRemote, entry: _Pending, generation: int, force: bool
+    ) -> None:
+        url = str(remote.url)
+        error = None
+        try:
+            with PUSH_SECONDS.time(directory=entry.name):
+                push_branch(
+                    entry.path,
+                    url,
+                    self.branch,
+                    remote_branch=remote_branch(entry.name),
+                    access_token=remote.access_token,
+                    force=force,
+                )
+        except subprocess.CalledProcessError as ex:
+            output = (ex.stderr or b"").decode(errors="replace").strip()
+            error = output.splitlines()[0] if output else ex
+        except Exception as ex:
+            error = ex
+
+        with self._lock:
+            entry.pushing = False
+            current = self._pending.get((entry.path, url)) is entry
+            if error is None:
+                entry.attempts = 0
+                if entry.force == force:
+                    entry.force = False
+                if current and entry.generation == generation:
+                    del self._pending[(entry.path, url)]
+                    self._save()
+            else:
+                entry.attempts += 1
+                entry.due = time.monotonic() + min(
+                    self.retry_max,
+                    self.retry_min * 2 ** (entry.attempts - 1),
+                )
+        if error is None:
+            PUSHES.inc(directory=entry.name, result="pushed")
+            logger.debug(f"Pushed {entry.name} to {url}")
+        else:
+            PUSHES.inc(directory=entry.name, result="failed")
+            logger.warning(
+                f"Failed pushing {entry.name} to {url} \
+(attempt {entry.attempts}): {error}"
+            )
+        self._reschedule(url)
+
+    def _load(self) -> None:
+        try:
+            with open(self.outbox_path, "rb") as file:
+                records = json.loads(file.read() or b"[]")
+        except FileNotFoundError:
+            return
+        except ValueError as ex:
+            logger.error(f"Ignoring unreadable push outbox: {ex}")
+            return
+        for record in records:
+            try:
+                entry = _Pending.from_dict(record)
+            except (KeyError, TypeError, ValueError):
+                continue
+            self._pending[(entry.path, entry.remote)] = entry
+        if self._pending:
+            logger.info(
+                f"{len(self._pending)} pushes pending from the last run"
+            )
+
+    def _save(self) -> None:
+        """Write the outbox, called with the lock held"""
+        records = [entry.as_dict() for entry in self._pending.values()]
+        if not records and not os.path.exists(self.outbox_path):
+            return
+        atomic_write(self.outbox_path, json.dumps(records).encode())
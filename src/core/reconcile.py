@@ -0,0 +1,89 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, List, Optional, Tuple
+from src.core.manifest import FileManifest
+from src.models.tracked_directory import TrackedDirectory
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+class Reconciler:
+    """
+    Startup scan finding changes made while the daemon was not running.
+    Every directory is walked on a worker thread and compared by stat data
+    against its manifest, i.e. the state of its last snapshot. Directories
+    that differ are reported through a callback so a catch-up snapshot can
+    be queued, the scan itself never commits anything.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures: List[Future] = []
+        self._lock = threading.Lock()
+
+    def start(
+        self,
+        directories: Iterable[Tuple[TrackedDirectory, FileManifest]],
+        on_stale: Callable[[TrackedDirectory, List[str], List[str]], None],
+    ) -> None:
+        """Scan directories in the background, returns immediately"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="reconcile",
+                )
+            for directory, manifest in directories:
+                self._futures.append(
+                    self._executor.submit(
+                        self._scan, directory, manifest, on_stale
+                    )
+                )
+
+    def _scan(
+        self,
+        directory: TrackedDirectory,
+        manifest: FileManifest,
+        on_stale: Callable[[TrackedDirectory, List[str], List[str]], None],
+    ) -> None:
+        started = time.monotonic()
+        try:
+            candidates, deleted = manifest.stale_paths(str(directory.path))
+        except Exception as ex:
+            logger.error(f"Failed scanning {directory.path}: {ex}")
+            return
+
+        elapsed = time.monotonic() - started
+        if not (candidates or deleted):
+            logger.debug(
+                f"No offline changes in {directory.name} ({elapsed:.2f}s)"
+            )
+            return
+
+        logger.info(
+            f"Found {len(candidates)} changed and {len(deleted)} deleted \
+files in {directory.name} since the last snapshot ({elapsed:.2f}s)"
+        )
+        on_stale(directory, candidates, deleted)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every submitted scan finished, False on timeout"""
+        with self._lock:
+            futures = list(self._futures)
+        _, pending = wait(futures, timeout=timeout)
+        with self._lock:
+            self._futures = [f for f in self._futures if not f.done()]
+        return not pending
+
+    def shutdown(self) -> None:
+        """Drop scans that have not started and wait for running ones"""
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+            self._futures = []
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,518 @@
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, List, Optional, Set, Tuple
+from src.constraints import CHUNK_STORE_DIRECTORY, GIT_DIRECTORY_NAME
+from src.core.chunking import (
+    ChunkedFile,
+    ChunkingPolicy,
+    blob_id,
+    is_chunk_manifest,
+    parse_chunk_manifest,
+    reassemble,
+)
+from src.core.manifest import FileManifest, ManifestEntry, stat_key
+from src.exceptions import GitBackendError, RestoreError
+from src.git_backend import MODE_EXECUTABLE, MODE_SYMLINK, GitBackend
+from src.settings import settings
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+# Relative path -> (mode, blob id) of a file in a snapshot
+TreeEntry = Tuple[str, str]
+
+
+class RestoreResult:
+    """What a restore changed on disk"""
+
+    commit: str
+    written: int
+    removed: int
+    unchanged: int
+    bytes_written: int
+    swapped: bool
+    # Relative paths written or removed
+    paths: List[str]
+    # Relative path -> chunk manifest id of the chunked files written
+    chunked: Dict[str, str]
+
+    def __init__(self, commit: str):
+        self.commit = commit
+        self.written = 0
+        self.removed = 0
+        self.unchanged = 0
+        self.bytes_written = 0
+        self.swapped = False
+        self.paths = []
+        self.chunked = dict()
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "commit": self.commit,
+            "written": self.written,
+            "removed": self.removed,
+            "unchanged": self.unchanged,
+            "bytes_written": self.bytes_written,
+            "swapped": self.swapped,
+        }
+
+
+class _Readers:
+    """
+    One `git cat-file --batch` pipe per writer thread, so blobs are read
+    concurrently instead of queueing on the shared backend's lock
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._backends: List[GitBackend] = []
+
+    def _backend(self) -> GitBackend:
+        backend = getattr(self._local, "backend", None)
+        if backend is None:
+            backend = GitBackend(self.path)
+            self._local.backend = backend
+            with self._lock:
+                self._backends.append(backend)
+        return backend
+
+    def blob_size(self, oid: str) -> int:
+        size = self._backend().object_size(oid)
+        if size is None:
+            raise RestoreError(f"Missing blob {oid} in {self.path}")
+        return size
+
+    def copy_blob(self, oid: str, out: BinaryIO) -> int:
+        """Stream a blob into a file without holding it in memory"""
+        try:
+            return self._backend().copy_object(oid, out)
+        except GitBackendError as ex:
+            raise RestoreError(f"Failed reading blob {oid}: {ex}")
+
+    def read_blob(self, oid: str) -> bytes:
+        result = self._backend().read_object(oid)
+        if result is None or result[0] != "blob":
+            raise RestoreError(f"Missing blob {oid} in {self.path}")
+        return result[1]
+
+    def close(self) -> None:
+        with self._lock:
+            backends, self._backends = self._backends, []
+        for backend in backends:
+            backend.close()
+
+
+def _snapshot_files(
+    backend: GitBackend, commit: str
+) -> Tuple[Dict[str, TreeEntry], Set[str]]:
+    """Files of a snapshot and which of them are stored chunked"""
+    files: Dict[str, TreeEntry] = dict()
+    chunked: Set[str] = set()
+    store = CHUNK_STORE_DIRECTORY + os.sep
+    for relative, entry in backend.list_files(commit).items():
+        if relative.startswith(store):
+            # <store>/<relative path of the file>/<chunk index>
+            chunked.add(os.path.dirname(relative[len(store) :]))
+            continue
+        files[relative] = entry
+    return files, chunked
+
+
+def _same_chunks(
+    path: str, manifest: bytes, chunking: Optional[ChunkingPolicy]
+) -> bool:
+    """Whether a file splits into exactly the chunks of a chunk manifest"""
+    if chunking is None or not is_chunk_manifest(manifest):
+        return False
+    size, chunks = parse_chunk_manifest(manifest)
+    if os.lstat(path).st_size != size:
+        return False
+    with ChunkedFile(
+        path, *chunking.bounds(), fixed_above=chunking.fixed_above
+    ) as chunked:
+        index = 0
+        for data in chunked.chunks():
+            if index >= len(chunks) or blob_id(data) != chunks[index][0]:
+                return False
+            index += 1
+    return index == len(chunks)
+
+
+def _unchanged(
+    root: str,
+    relative: str,
+    target: TreeEntry,
+    current: Optional[ManifestEntry],
+    is_chunked: bool,
+    readers: _Readers,
+    chunking: Optional[ChunkingPolicy],
+) -> bool:
+    if current is None:
+        return False
+    mode, oid = target
+    path = os.path.join(root, relative)
+    try:
+        if is_chunked:
+            # The chunk manifest recorded when the content was saved or
+            # restored, only files without one are chunked to compare
+            if current.stored is not None:
+                if current.stored != oid:
+                    return False
+            elif not _same_chunks(path, readers.read_blob(oid), chunking):
+                return False
+        elif current.digest.hex() != oid:
+            return False
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return False
+    if mode == MODE_SYMLINK:
+        return os.path.islink(path)
+    return (mode == MODE_EXECUTABLE) == bool(st.st_mode & 0o100)
+
+
+def _write_file(readers: _Readers, destination: str, target: TreeEntry) -> int:
+    """Atomically create or replace a file with its snapshot content"""
+    mode, oid = target
+    directory = os.path.dirname(destination)
+    os.makedirs(directory, exist_ok=True)
+    # Chunk manifests and symlinks are small, large blobs are streamed
+    data = None
+    if mode == MODE_SYMLINK or (
+        readers.blob_size(oid) < settings.storage.stream_threshold_bytes
+    ):
+        data = readers.read_blob(oid)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".restore-")
+    try:
+        if mode == MODE_SYMLINK:
+            os.close(fd)
+            os.remove(tmp_path)
+            os.symlink(os.fsdecode(data), tmp_path)
+            written = len(data)
+        else:
+            with os.fdopen(fd, "wb") as file:
+                if data is None:
+                    written = readers.copy_blob(oid, file)
+                elif is_chunk_manifest(data):
+                    written = reassemble(data, readers.read_blob, file)
+                else:
+                    file.write(data)
+                    written = len(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.chmod(tmp_path, 0o755 if mode == MODE_EXECUTABLE else 0o644)
+        if os.path.isdir(destination) and not os.path.islink(destination):
+            shutil.rmtree(destination)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return written
+
+
+def _remove_empty_parents(root: str, relative: str) -> None:
+    parent = os.path.dirname(relative)
+    while parent:
+        try:
+            os.rmdir(os.path.join(root, parent))
+        except OSError:
+            return
+        parent = os.path.dirname(parent)
+
+
+def _clear_blocking_file(root: str, relative: str) -> None:
+    """Remove a file standing where a directory of the snapshot goes"""
+    parent = os.path.dirname(relative)
+    while parent:
+        path = os.path.join(root, parent)
+        if os.path.lexists(path) and not os.path.isdir(path):
+            os.remove(path)
+            return
+        parent = os.path.dirname(parent)
+
+
+class _StagingUnsupported(OSError):
+    """
+    The filesystem refused a hard link or the directory cannot be renamed
+    (a mount point, busy, no permission on its parent), a staged swap is
+    not possible
+    """
+
+
+class DirectoryRestore:
+    """
+    Brings a tracked directory to the state of one of its snapshots while
+    touching as little as possible. Files are compared against the
+    snapshot through the file manifest, so only files whose stat data
+    changed since the last save are hashed, and only files that differ
+    are read from the repository and written, by a pool of workers.
+
+    By default the new tree is staged in a temporary sibling directory
+    made of hard links to the unchanged files plus the rewritten ones,
+    then swapped in with two renames, so the directory never shows a mix
+    of both states. Where hard links are not available or the directory
+    cannot be renamed the differing files are replaced one by one, each
+    atomically.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        backend: GitBackend,
+        manifest: FileManifest,
+        chunking: Optional[ChunkingPolicy] = None,
+        workers: int = 8,
+        staged: bool = True,
+    ):
+        self.root = os.path.abspath(root)
+        self.backend = backend
+        self.manifest = manifest
+        self.chunking = chunking
+        self.workers = max(1, workers)
+        self.staged = staged
+
+    def run(self, rev: str, base: Optional[str] = None) -> RestoreResult:
+        """
+        Restore a snapshot. base is a snapshot the directory is known to
+        match, then only the files differing between both are looked at.
+        """
+        try:
+            commit = self.backend.resolve(rev)
+        except GitBackendError as ex:
+            raise RestoreError(f"Failed reading {rev}: {ex}")
+        if commit is None:
+            raise RestoreError(f"Unknown snapshot '{rev}' in {self.root}")
+        result = RestoreResult(commit)
+
+        files, chunked = _snapshot_files(self.backend, commit)
+        readers = _Readers(self.root)
+        try:
+            if base is None:
+                writes, removals = self._plan(files, chunked, readers, result)
+            else:
+                writes, removals = self._plan_from(
+                    base, files, chunked, readers, result
+                )
+            result.paths = list(writes) + removals
+            result.chunked = {
+                relative: entry[1]
+                for relative, entry in writes.items()
+                if relative in chunked
+            }
+            if not writes and not removals:
+                return result
+            if self.staged:
+                try:
+                    self._swap(writes, removals, readers, result)
+                    return result
+                except _StagingUnsupported as ex:
+                    logger.info(
+                        f"Cannot stage a restore of {self.root} ({ex}), \
+restoring files in place"
+                    )
+            self._in_place(writes, removals, readers, result)
+        finally:
+            readers.close()
+        return result
+
+    def _plan(
+        self,
+        files: Dict[str, TreeEntry],
+        chunked: Set[str],
+        readers: _Readers,
+        result: RestoreResult,
+    ) -> Tuple[Dict[str, TreeEntry], List[str]]:
+        """Files to write and files to remove"""
+        current = self.manifest.current_entries(self.root)
+
+        def check(relative: str) -> bool:
+            return _unchanged(
+                self.root,
+                relative,
+                files[relative],
+                current.get(relative),
+                relative in chunked,
+                readers,
+                self.chunking,
+            )
+
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="restore"
+        ) as pool:
+            unchanged = dict(zip(files, pool.map(check, files)))
+
+        writes = {
+            relative: entry
+            for relative, entry in files.items()
+            if not unchanged[relative]
+        }
+        removals = [relative for relative in current if relative not in files]
+        result.unchanged = len(files) - len(writes)
+        return writes, removals
+
+    def _plan_from(
+        self,
+        base: str,
+        files: Dict[str, TreeEntry],
+        chunked: Set[str],
+        readers: _Readers,
+        result: RestoreResult,
+    ) -> Tuple[Dict[str, TreeEntry], List[str]]:
+        """Files to write and remove, from the difference to base"""
+        base_files, _ = _snapshot_files(self.backend, base)
+        writes = dict()
+        for relative, entry in files.items():
+            if base_files.get(relative) == entry:
+                continue
+            # Skip files that already have the content, e.g. a retried sync
+            if not _unchanged(
+                self.root,
+                relative,
+                entry,
+                self._recorded(relative),
+                relative in chunked,
+                readers,
+                self.chunking,
+            ):
+                writes[relative] = entry
+        removals = [
+            relative for relative in base_files if relative not in files
+        ]
+        result.unchanged = len(files) - len(writes)
+        return writes, removals
+
+    def _recorded(self, relative: str) -> Optional[ManifestEntry]:
+        """Manifest entry of a file, None if it changed since recorded"""
+        entry = self.manifest.get(relative)
+        if entry is None:
+            return None
+        try:
+            st = os.lstat(os.path.join(self.root, relative))
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return entry if entry.stat_key() == stat_key(st) else None
+
+    def _write_all(
+        self,
+        root: str,
+        writes: Dict[str, TreeEntry],
+        readers: _Readers,
+        result: RestoreResult,
+    ) -> None:
+        def write(item: Tuple[str, TreeEntry]) -> int:
+            relative, entry = item
+            return _write_file(readers, os.path.join(root, relative), entry)
+
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="restore"
+        ) as pool:
+            for written in pool.map(write, writes.items()):
+                result.written += 1
+                result.bytes_written += written
+
+    def _in_place(
+        self,
+        writes: Dict[str, TreeEntry],
+        removals: List[str],
+        readers: _Readers,
+        result: RestoreResult,
+    ) -> None:
+        for relative in removals:
+            try:
+                os.remove(os.path.join(self.root, relative))
+            except FileNotFoundError:
+                continue
+            result.removed += 1
+            _remove_empty_parents(self.root, relative)
+        for relative in writes:
+            _clear_blocking_file(self.root, relative)
+        self._write_all(self.root, writes, readers, result)
+
+    def _swap(
+        self,
+        writes: Dict[str, TreeEntry],
+        removals: List[str],
+        readers: _Readers,
+        result: RestoreResult,
+    ) -> None:
+        token = uuid.uuid4().hex[:8]
+        parent, name = os.path.split(self.root)
+        staging = os.path.join(parent, f".{name}.restore-{token}")
+        previous = os.path.join(parent, f".{name}.previous-{token}")
+
+        try:
+            os.mkdir(staging)
+        except OSError as ex:
+            raise _StagingUnsupported(str(ex))
+        try:
+            self._link_tree(staging, set(writes) | set(removals))
+            self._write_all(staging, writes, readers, result)
+            for relative in removals:
+                _remove_empty_parents(staging, relative)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        git_directory = os.path.join(self.root, GIT_DIRECTORY_NAME)
+        staged_git = os.path.join(staging, GIT_DIRECTORY_NAME)
+        os.rename(git_directory, staged_git)
+        try:
+            os.rename(self.root, previous)
+        except OSError as ex:
+            os.rename(staged_git, git_directory)
+            shutil.rmtree(staging, ignore_errors=True)
+            # Nothing changed yet, the files are written again in place
+            result.written = result.bytes_written = 0
+            raise _StagingUnsupported(str(ex))
+        except BaseException:
+            os.rename(staged_git, git_directory)
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        try:
+            os.rename(staging, self.root)
+        except BaseException:
+            os.rename(previous, self.root)
+            os.rename(staged_git, git_directory)
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        shutil.rmtree(previous, ignore_errors=True)
+
+        result.removed = len(removals)
+        result.swapped = True
+
+    def _link_tree(self, staging: str, replaced: Set[str]) -> None:
+        """
+        Mirror the directory into staging with hard links, leaving out the
+        files about to be rewritten or removed. Files outside the saved
+        set (ignored files) are carried over untouched.
+        """
+        stack = [""]
+        while stack:
+            current = stack.pop()
+            with os.scandir(os.path.join(self.root, current)) as iterator:
+                for item in iterator:
+                    if not current and item.name == GIT_DIRECTORY_NAME:
+                        continue
+                    relative = os.path.join(current, item.name)
+                    destination = os.path.join(staging, relative)
+                    if item.is_dir(follow_symlinks=False):
+                        os.mkdir(destination)
+                        stack.append(relative)
+                    elif relative in replaced:
+                        continue
+                    elif item.is_symlink():
+                        os.symlink(os.readlink(item.path), destination)
+                    else:
+                        try:
+                            os.link(item.path, destination)
+                        except OSError as ex:
+                            raise _StagingUnsupported(str(ex))
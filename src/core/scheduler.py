@@ -0,0 +1,124 @@
+import heapq
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+def _spawn(key: str, callback: Callable[[], None]) -> None:
+    threading.Thread(target=callback, name=f"save-{key}", daemon=True).start()
+
+
+class SaveScheduler:
+    """
+    Single thread owning the pending save deadline of every directory.
+    Deadlines sit in a min-heap keyed by directory, rescheduling pushes a
+    new heap entry and leaves the old one to be skipped when it surfaces,
+    so every schedule, reschedule and cancel is O(log n) and idle
+    directories cost nothing. Due callbacks are handed to dispatch, which
+    by default runs each one on a short-lived thread so a slow snapshot
+    never delays the deadlines of other directories.
+    """
+
+    def __init__(
+        self,
+        dispatch: Optional[Callable[[str, Callable[[], None]], None]] = None,
+    ):
+        self.dispatch = dispatch or _spawn
+        # key -> (deadline, sequence, callback) of the live entry
+        self._entries: Dict[str, Tuple[float, int, Callable[[], None]]] = (
+            dict()
+        )
+        self._due: List[Tuple[float, int, str]] = []
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def start(self) -> None:
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(
+                target=self._run, name="save-scheduler", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop firing, pending deadlines are kept for a restart"""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._entries)
+
+    def schedule(
+        self, key: str, delay: float, callback: Callable[[], None]
+    ) -> None:
+        """Set (or move) the deadline of a key to delay seconds from now"""
+        self.schedule_at(key, time.monotonic() + max(0.0, delay), callback)
+
+    def schedule_at(
+        self, key: str, deadline: float, callback: Callable[[], None]
+    ) -> None:
+        """Set (or move) the deadline of a key to a time.monotonic() value"""
+        with self._condition:
+            self._sequence += 1
+            self._entries[key] = (deadline, self._sequence, callback)
+            heapq.heappush(self._due, (deadline, self._sequence, key))
+            if self._due[0][1] == self._sequence:
+                # Only an earlier head changes how long the thread sleeps
+                self._condition.notify()
+
+    def deadline(self, key: str) -> Optional[float]:
+        """Pending deadline of a key as a time.monotonic() value"""
+        with self._condition:
+            entry = self._entries.get(key)
+            return entry[0] if entry else None
+
+    def cancel(self, key: str) -> bool:
+        """Drop the pending deadline of a key, False if there was none"""
+        with self._condition:
+            return self._entries.pop(key, None) is not None
+
+    def _next(self) -> Optional[Tuple[str, Callable[[], None]]]:
+        """Wait for the next due key, None once stopped"""
+        with self._condition:
+            while self._running:
+                if not self._due:
+                    self._condition.wait()
+                    continue
+                deadline, sequence, key = self._due[0]
+                entry = self._entries.get(key)
+                if entry is None or entry[1] != sequence:
+                    # Cancelled or rescheduled since this entry was pushed
+                    heapq.heappop(self._due)
+                    continue
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._due)
+                del self._entries[key]
+                return key, entry[2]
+            return None
+
+    def _run(self) -> None:
+        while True:
+            due = self._next()
+            if due is None:
+                return
+            key, callback = due
+            try:
+                self.dispatch(key, callback)
+            except Exception as ex:
+                logger.error(f"Failed dispatching the save of {key}: {ex}")
@@ -0,0 +1,74 @@
+import os
+from typing import Dict, Optional, Set, Tuple
+
+
+# (size, mtime_ns) of a file when it was closed, None if it was gone
+_CloseState = Optional[Tuple[int, int]]
+
+
+def _close_state(path: str) -> _CloseState:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+class SettleDetector:
+    """
+    Tracks the files written during a burst of a single directory. A file
+    is open from its first write event until a close-after-write event
+    (or a rename onto it) arrives. The burst has settled once every file
+    is closed again and none changed since it was closed, so it can be
+    saved without waiting out the cooldown.
+
+    Close events only exist on some platforms (inotify), the detector
+    reports itself as unsupported until it has seen one, and handlers
+    then keep relying on the cooldown alone.
+    """
+
+    def __init__(self):
+        self.supported = False
+        self._open: Set[str] = set()
+        self._closed: Dict[str, _CloseState] = dict()
+
+    def __len__(self) -> int:
+        return len(self._open) + len(self._closed)
+
+    def written(self, path: str) -> None:
+        self._closed.pop(path, None)
+        self._open.add(path)
+
+    def completed(self, path: str) -> None:
+        """A file is fully written, e.g. renamed into place"""
+        self._open.discard(path)
+        self._closed[path] = _close_state(path)
+
+    def closed(self, path: str) -> None:
+        self.supported = True
+        if path in self._open or path in self._closed:
+            self.completed(path)
+
+    def removed(self, path: str, is_dir: bool = False) -> None:
+        """Deleted files have nothing left to settle"""
+        self._open.discard(path)
+        self._closed.pop(path, None)
+        if is_dir:
+            prefix = path.rstrip(os.sep) + os.sep
+            self._open = {p for p in self._open if not p.startswith(prefix)}
+            for closed in [p for p in self._closed if p.startswith(prefix)]:
+                del self._closed[closed]
+
+    def settled(self) -> bool:
+        """Whether every file written in the burst has been closed"""
+        return self.supported and not self._open and bool(self._closed)
+
+    def stable(self) -> bool:
+        """Whether no closed file changed size or mtime since its close"""
+        return all(
+            _close_state(path) == state for path, state in self._closed.items()
+        )
+
+    def reset(self) -> None:
+        self._open.clear()
+        self._closed.clear()
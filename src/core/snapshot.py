@@ -0,0 +1,388 @@
+import os
+import sqlite3
+import stat
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from src.core.event_queue import ChangeKind, ChangeSet
+from src.core.history import SnapshotHistory
+from src.core.manifest import FileManifest, ManifestEntry, hash_file
+from src.core.chunking import ChunkingPolicy
+from src.core.ignore import IgnoreRules
+from src.models.tracked_directory import TrackedDirectory, StorageMode
+from src.git_backend import GitBackend
+from src.git_utils import (
+    ensure_git_repository,
+    list_files,
+    reset_index,
+    stage_paths,
+    stage_all,
+    commit,
+)
+from src.exceptions import GitBackendError
+from src.metrics import (
+    BYTES_STORED,
+    FILES_STORED,
+    SNAPSHOTS,
+    PhaseTimer,
+    observe_phases,
+)
+from src.settings import settings
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+class SnapshotReason:
+    """What triggered a snapshot, kept in the history index"""
+
+    CHANGES = "changes"
+    SETTLED = "settled"
+    FORCED = "forced"
+    CATCH_UP = "catch_up"
+    BEFORE_RESTORE = "before_restore"
+    RESTORED = "restored"
+    BEFORE_SYNC = "before_sync"
+    SYNCED = "synced"
+
+
+class SnapshotJob:
+    """A single request to commit the net changes of a directory"""
+
+    directory: TrackedDirectory
+    changes: ChangeSet
+    created_at: float
+    # Explicitly requested, runs ahead of regular saves
+    forced: bool
+    reason: str
+
+    def __init__(
+        self,
+        directory: TrackedDirectory,
+        changes: ChangeSet,
+        forced: bool = False,
+        reason: Optional[str] = None,
+    ):
+        self.directory = directory
+        self.changes = changes
+        self.created_at = time.monotonic()
+        self.forced = forced
+        self.reason = reason or (
+            SnapshotReason.FORCED if forced else SnapshotReason.CHANGES
+        )
+
+
+def _stage_change_set(
+    path: str, changes: ChangeSet, rules: IgnoreRules
+) -> None:
+    if changes.full_rescan:
+        if rules:
+            _stage_filtered(path, rules)
+        else:
+            stage_all(path)
+        return
+
+    present: List[str] = []
+    deleted: List[str] = changes.paths(ChangeKind.DELETED)
+    for relative in changes.paths():
+        if changes.changes[relative] == ChangeKind.DELETED:
+            continue
+        if os.path.lexists(os.path.join(path, relative)):
+            present.append(relative)
+        else:
+            deleted.append(relative)
+    _stage(path, present=present, deleted=deleted, rules=rules)
+
+
+def _stage_filtered(path: str, rules: IgnoreRules) -> None:
+    """Stage the whole directory, leaving out what the rules ignore"""
+    tracked, untracked = list_files(path)
+    present: List[str] = []
+    deleted: List[str] = []
+    for relative in sorted(tracked | untracked):
+        try:
+            st = os.lstat(os.path.join(path, relative))
+        except (FileNotFoundError, NotADirectoryError):
+            deleted.append(relative)
+            continue
+        if not rules.ignores(relative, st):
+            present.append(relative)
+        elif relative in tracked:
+            deleted.append(relative)
+    _stage(path, present=present, deleted=deleted, rules=rules)
+
+
+def _stage(
+    path: str,
+    present: List[str],
+    deleted: List[str],
+    rules: Optional[IgnoreRules] = None,
+) -> None:
+    try:
+        stage_paths(path, paths=present, deleted=deleted)
+    except subprocess.CalledProcessError:
+        if rules:
+            # git add -A would stage what the rules leave out, the job
+            # is retried instead
+            raise
+        logger.warning(
+            f"Failed staging individual paths in {path}, \
+                falling back to staging the whole directory"
+        )
+        stage_all(path)
+
+
+def chunking_policy(directory: TrackedDirectory) -> Optional[ChunkingPolicy]:
+    """Chunking policy of a directory, None when it stores files whole"""
+    if directory.storage_mode != StorageMode.CHUNKED:
+        return None
+    storage = settings.storage
+    threshold = directory.chunk_threshold_bytes
+    if threshold is None:
+        threshold = storage.chunk_threshold_bytes
+    return ChunkingPolicy(
+        threshold=threshold,
+        min_size=storage.chunk_min_bytes,
+        avg_size=storage.chunk_avg_bytes,
+        max_size=storage.chunk_max_bytes,
+        fixed_above=storage.chunk_fixed_above_bytes,
+    )
+
+
+class _IngestingHasher:
+    """
+    Hasher for the manifest diff storing large files in the same pass,
+    so each is read once instead of once to hash and once to commit.
+    Files stored as chunks are left to the chunked write path.
+
+    A file keeping its saved size is often only touched or written again
+    unchanged, it is hashed first and stored only if the repository does
+    not have that content yet.
+    """
+
+    def __init__(
+        self,
+        backend: GitBackend,
+        chunking: Optional[ChunkingPolicy],
+        manifest: FileManifest,
+        root: str,
+    ):
+        self.backend = backend
+        self.chunking = chunking
+        self.manifest = manifest
+        self.root = root
+        # Source path -> mark or id of the blob stored for it
+        self.blobs: Dict[str, str] = dict()
+
+    def __call__(self, path: str, st: os.stat_result) -> bytes:
+        size = st.st_size
+        if (
+            not stat.S_ISREG(st.st_mode)
+            or size < settings.storage.stream_threshold_bytes
+            or (self.chunking is not None and self.chunking.applies_to(size))
+        ):
+            return hash_file(path, st)
+        recorded = self.manifest.get(os.path.relpath(path, self.root))
+        if recorded is not None and recorded.size == size:
+            digest = hash_file(path, st)
+            if digest == recorded.digest:
+                return digest
+            if self._stored(digest.hex()):
+                self.blobs[path] = digest.hex()
+                return digest
+        try:
+            mark, digest = self.backend.ingest(path, size)
+        except GitBackendError as ex:
+            logger.debug(f"Storing {path} while hashing failed: {ex}")
+            # The pipe may have been restarted, earlier marks are gone
+            self.blobs = {
+                source: blob
+                for source, blob in self.blobs.items()
+                if not blob.startswith(":")
+            }
+            return hash_file(path, st)
+        self.blobs[path] = mark
+        return digest
+
+    def _stored(self, oid: str) -> bool:
+        try:
+            return self.backend.exists(oid)
+        except GitBackendError as ex:
+            logger.debug(f"Checking for blob {oid} failed: {ex}")
+            return False
+
+
+def _commit_with_backend(
+    backend: GitBackend,
+    directory: TrackedDirectory,
+    message: str,
+    saved_at: datetime,
+    changed: List[str],
+    deleted: List[str],
+    blobs: Optional[Dict[str, str]] = None,
+    chunked: Optional[Dict[str, str]] = None,
+) -> Optional[str]:
+    """Commit through the persistent backend, None if it is unusable"""
+    path = str(directory.path)
+    try:
+        return backend.commit(
+            branch=settings.git.master_branch,
+            message=message,
+            author_name=settings.git.author_name,
+            author_email=settings.git.author_email,
+            when=saved_at,
+            files={
+                relative: os.path.join(path, relative) for relative in changed
+            },
+            deleted=deleted,
+            chunking=chunking_policy(directory),
+            blobs=blobs,
+            chunked=chunked,
+        )
+    except GitBackendError as ex:
+        logger.warning(
+            f"Persistent git backend failed, falling back to \
+                git subprocess calls. Detail: {ex}"
+        )
+        return None
+
+
+def _record_history(
+    history: SnapshotHistory,
+    backend: GitBackend,
+    job: SnapshotJob,
+    oid: str,
+    changed: Dict[str, ManifestEntry],
+    deleted: List[str],
+) -> None:
+    files = {relative: entry.size for relative, entry in changed.items()}
+    try:
+        history.record(backend, oid, files, deleted, job.reason)
+    except (GitBackendError, sqlite3.Error) as ex:
+        # The next history query catches up from git instead
+        logger.warning(
+            f"Failed indexing snapshot {oid[:12]} of {job.directory.name}: \
+{ex}"
+        )
+
+
+def take_snapshot(
+    job: SnapshotJob,
+    manifest: Optional[FileManifest] = None,
+    backend: Optional[GitBackend] = None,
+    history: Optional[SnapshotHistory] = None,
+) -> bool:
+    """
+    Stage and commit the changes of a job, True if a commit was made.
+    Commits made through the backend are recorded in the history index.
+    """
+    path = str(job.directory.path)
+    changes = job.changes
+
+    ensure_git_repository(
+        path,
+        master_branch=settings.git.master_branch,
+        object_store=settings.storage.shared_object_store,
+    )
+
+    name = job.directory.name
+    timer = PhaseTimer()
+    changed: Dict[str, ManifestEntry] = dict()
+    touched: Dict[str, ManifestEntry] = dict()
+    deleted: List[str] = []
+    hasher = None
+    if backend is not None and manifest is not None:
+        hasher = _IngestingHasher(
+            backend, chunking_policy(job.directory), manifest, path
+        )
+    if manifest is not None:
+        # An empty manifest means nothing is known yet, index everything
+        candidates = None
+        if not changes.full_rescan and len(manifest):
+            candidates = changes.paths()
+        started = time.perf_counter()
+        changed, deleted, touched = manifest.diff(
+            path, candidates, timer, hasher=hasher or hash_file
+        )
+        timer.add(
+            "scan",
+            time.perf_counter() - started - timer.durations.get("hash", 0),
+        )
+        if not (changed or deleted):
+            manifest.apply(touched, deleted=[])
+            observe_phases(name, timer)
+            SNAPSHOTS.inc(directory=name, result="unchanged")
+            logger.debug(f"No content changes in {name}")
+            return False
+
+    saved_at = datetime.now(timezone.utc)
+    message = f"Snapshot {saved_at.isoformat()} ({changes.event_count} events)"
+
+    oid = None
+    if manifest is not None and backend is not None:
+        # Relative path -> chunk manifest id, lets a restore tell whether
+        # a chunked file matches a snapshot without chunking it again
+        chunked: Dict[str, str] = dict()
+        with timer.phase("commit"):
+            oid = _commit_with_backend(
+                backend,
+                job.directory,
+                message,
+                saved_at,
+                list(changed),
+                deleted,
+                blobs=hasher.blobs,
+                chunked=chunked,
+            )
+        for relative, stored in chunked.items():
+            if relative in changed:
+                changed[relative].stored = stored
+    committed = oid is not None
+    if not committed:
+        if chunking_policy(job.directory) is not None:
+            # git add would store chunked files whole and stage_all would
+            # delete the chunk store, fail so the changes are retried
+            detail = "" if backend else ", which is disabled"
+            raise GitBackendError(
+                f"Chunked files of {name} can only be stored through the \
+persistent git backend{detail}"
+            )
+        with timer.phase("stage"):
+            rules = IgnoreRules.for_directory(job.directory)
+            if manifest is None:
+                _stage_change_set(path, changes, rules)
+            else:
+                # The backend does not maintain the index, resync it first
+                reset_index(path)
+                _stage(
+                    path, present=list(changed), deleted=deleted, rules=rules
+                )
+        with timer.phase("commit"):
+            committed = commit(
+                path,
+                message=message,
+                author_name=settings.git.author_name,
+                author_email=settings.git.author_email,
+            )
+
+    if committed:
+        job.directory.last_save_time = saved_at
+    if manifest is not None:
+        manifest.apply({**changed, **touched}, deleted=deleted)
+    if oid is not None and history is not None:
+        with timer.phase("index"):
+            _record_history(history, backend, job, oid, changed, deleted)
+    observe_phases(name, timer)
+    if committed:
+        SNAPSHOTS.inc(directory=name, result="committed")
+        FILES_STORED.inc(len(changed), directory=name)
+        BYTES_STORED.inc(
+            sum(entry.size for entry in changed.values()), directory=name
+        )
+        logger.info(f"Saved snapshot of {name} at {saved_at}")
+    else:
+        SNAPSHOTS.inc(directory=name, result="unchanged")
+        logger.debug(f"No changes to save in {name}")
+    return committed
@@ -0,0 +1,144 @@
+import heapq
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from src.core.snapshot import SnapshotJob
+from src.metrics import SNAPSHOT_WAIT_SECONDS
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+# (forced first, smaller first, older first, directory key)
+_Rank = Tuple[int, float, int, str]
+
+
+def _rank(job: SnapshotJob, sequence: int) -> _Rank:
+    size = float("inf") if job.changes.full_rescan else len(job.changes)
+    return (0 if job.forced else 1, size, sequence, str(job.directory.path))
+
+
+class SnapshotPool:
+    """
+    Fixed set of worker threads running snapshot jobs. Jobs of different
+    directories run concurrently, a directory never has more than one job
+    running: a job submitted while one is queued or running for the same
+    directory is merged into the queued one. Ready jobs are taken forced
+    saves first, then by number of changed paths, so a small save is not
+    stuck behind a full rescan of another game.
+
+    At most max_pending directories can wait at once. Further jobs are
+    refused and stay with their handler, which retries later.
+    """
+
+    def __init__(
+        self,
+        run: Callable[[SnapshotJob], None],
+        workers: int,
+        max_pending: int,
+    ):
+        self.run = run
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._queued: Dict[str, Tuple[SnapshotJob, int]] = dict()
+        self._ready: List[_Rank] = []
+        self._running: Set[str] = set()
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._started = False
+
+    def start(self) -> None:
+        with self._condition:
+            if self._started:
+                return
+            self._started = True
+            self._threads = [
+                threading.Thread(
+                    target=self._work, name=f"snapshot-{index}", daemon=True
+                )
+                for index in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self) -> None:
+        """Run the jobs already queued, then stop the workers"""
+        with self._condition:
+            self._started = False
+            self._condition.notify_all()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join()
+
+    @property
+    def pending(self) -> int:
+        """Number of directories waiting for a worker"""
+        with self._condition:
+            return len(self._queued)
+
+    def submit(self, job: SnapshotJob) -> bool:
+        """Queue a job, False if the pool is saturated"""
+        key = str(job.directory.path)
+        with self._condition:
+            queued = self._queued.get(key)
+            if queued is not None:
+                previous = queued[0]
+                previous.changes.merge(job.changes)
+                if job.forced and not previous.forced:
+                    previous.reason = job.reason
+                previous.forced = previous.forced or job.forced
+                job = previous
+            elif len(self._queued) >= self.max_pending:
+                return False
+            self._sequence += 1
+            self._queued[key] = (job, self._sequence)
+            if key not in self._running:
+                # A running directory is pushed once its job finishes
+                self._push(key)
+            return True
+
+    def _push(self, key: str) -> None:
+        job, sequence = self._queued[key]
+        heapq.heappush(self._ready, _rank(job, sequence))
+        self._condition.notify()
+
+    def _next(self) -> Optional[SnapshotJob]:
+        """Wait for the next ready job, None once stopped and drained"""
+        with self._condition:
+            while True:
+                while self._ready:
+                    _, _, sequence, key = heapq.heappop(self._ready)
+                    queued = self._queued.get(key)
+                    if queued is None or queued[1] != sequence:
+                        # Merged into a newer submission since
+                        continue
+                    if key in self._running:
+                        continue
+                    del self._queued[key]
+                    self._running.add(key)
+                    return queued[0]
+                if not self._started:
+                    return None
+                self._condition.wait()
+
+    def _work(self) -> None:
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            key = str(job.directory.path)
+            SNAPSHOT_WAIT_SECONDS.observe(
+                time.monotonic() - job.created_at,
+                directory=job.directory.name,
+            )
+            try:
+                self.run(job)
+            except Exception as ex:
+                logger.error(f"Snapshot job of {key} failed: {ex}")
+            finally:
+                with self._condition:
+                    self._running.discard(key)
+                    if key in self._queued:
+                        self._push(key)
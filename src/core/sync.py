@@ -0,0 +1,193 @@
+import hashlib
+import time
+from typing import Callable, Dict, Optional, Tuple
+from src.constraints import (
+    DEFAULT_SYNC_DEEPEN,
+    GIT_DIVERGED_REF_PREFIX,
+    GIT_REMOTE_REF_PREFIX,
+)
+from src.core.manifest import FileManifest
+from src.core.push import remote_branch
+from src.core.restore import DirectoryRestore, RestoreResult
+from src.core.snapshot import chunking_policy
+from src.git_backend import CommitRecord, GitBackend
+from src.git_utils import (
+    fetch_branch,
+    is_ancestor,
+    shallow_commits,
+    update_ref,
+)
+from src.models.remote import GitRemote
+from src.models.tracked_directory import TrackedDirectory
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+class SyncState:
+    NO_REMOTE = "no_remote"
+    UP_TO_DATE = "up_to_date"
+    AHEAD = "ahead"
+    BEHIND = "behind"
+    ADOPTED = "adopted"
+    DIVERGED = "diverged"
+    REPLACED = "replaced"
+
+
+class SyncResult:
+    """How a directory compared to a remote and what a sync changed"""
+
+    state: str
+    local: Optional[str]
+    remote: Optional[str]
+    backup: Optional[str]
+    applied: Optional[RestoreResult]
+
+    def __init__(self, local: Optional[str], remote: Optional[str]):
+        self.state = SyncState.UP_TO_DATE
+        self.local = local
+        self.remote = remote
+        self.backup = None
+        self.applied = None
+
+    def as_dict(self) -> Dict[str, object]:
+        result = {
+            "state": self.state,
+            "local": self.local,
+            "remote": self.remote,
+            "backup": self.backup,
+        }
+        if self.applied is not None:
+            applied = self.applied.as_dict()
+            del applied["commit"]
+            result.update(applied)
+        return result
+
+
+def remote_ref(url: str) -> str:
+    """Ref holding the last fetched head of a remote"""
+    key = hashlib.sha1(url.encode()).hexdigest()[:12]
+    return f"{GIT_REMOTE_REF_PREFIX}/{key}"
+
+
+def _tree(backend: GitBackend, commit: str) -> Optional[str]:
+    result = backend.read_object(commit)
+    if result is None:
+        return None
+    return CommitRecord(commit, result[1]).tree
+
+
+def _ancestry(
+    path: str, local: str, head: str, deepen: Callable[[], bool]
+) -> Tuple[bool, bool]:
+    """
+    Whether local contains head and whether head contains local. Commits
+    past the boundary of a shallow history are missing, so as long as
+    neither contains the other the history is deepened and checked again.
+    """
+    while True:
+        if is_ancestor(path, head, local):
+            return True, False
+        if is_ancestor(path, local, head):
+            return False, True
+        if not deepen():
+            return False, False
+
+
+def sync_directory(
+    directory: TrackedDirectory,
+    remote: GitRemote,
+    backend: GitBackend,
+    manifest: FileManifest,
+    branch: str,
+    prefer_remote: bool = False,
+    depth: Optional[int] = None,
+    deepen: int = DEFAULT_SYNC_DEEPEN,
+    staged: bool = False,
+    workers: int = 8,
+) -> SyncResult:
+    """
+    Bring a directory up to date with the snapshots another device pushed
+    to a remote. Only objects missing locally are fetched. When the
+    remote history contains the local one, the branch fast-forwards and
+    only the files differing between both heads are rewritten. A local
+    history the remote does not contain is left alone unless
+    prefer_remote, then it is kept under a backup ref and replaced. One
+    holding the same files as the remote head is kept under a backup ref
+    and replaced right away.
+
+    The directory must match its branch head, i.e. have just been saved,
+    and must not change while this runs.
+    """
+    path = str(directory.path)
+    ref = f"refs/heads/{branch}"
+    local = backend.resolve(ref)
+
+    def fetch(**options) -> Optional[str]:
+        return fetch_branch(
+            path,
+            str(remote.url),
+            remote_branch(directory.name),
+            remote_ref(str(remote.url)),
+            access_token=remote.access_token,
+            **options,
+        )
+
+    def deepen_history() -> bool:
+        # False once there is nothing more to fetch
+        boundary = shallow_commits(path)
+        if not boundary:
+            return False
+        fetch(deepen=deepen)
+        return shallow_commits(path) != boundary
+
+    # Shallow only for a first sync, later fetches extend the history
+    head = fetch(depth=depth if local is None else None)
+    result = SyncResult(local, head)
+    if head is None:
+        result.state = SyncState.NO_REMOTE
+        return result
+    if head == local:
+        return result
+
+    if local is not None:
+        ahead, behind = _ancestry(path, local, head, deepen_history)
+        if ahead:
+            result.state = SyncState.AHEAD
+            return result
+        if not behind:
+            if _tree(backend, local) == _tree(backend, head):
+                # Same files under another history, e.g. pruned remotely
+                result.backup = f"{GIT_DIVERGED_REF_PREFIX}/{int(time.time())}"
+                update_ref(path, result.backup, local, None)
+                update_ref(path, ref, head, local)
+                result.state = SyncState.ADOPTED
+                return result
+            if not prefer_remote:
+                result.state = SyncState.DIVERGED
+                return result
+            result.backup = f"{GIT_DIVERGED_REF_PREFIX}/{int(time.time())}"
+            update_ref(path, result.backup, local, None)
+
+    applied = DirectoryRestore(
+        path,
+        backend=backend,
+        manifest=manifest,
+        chunking=chunking_policy(directory),
+        workers=workers,
+        staged=staged,
+    ).run(head, base=local)
+    update_ref(path, ref, head, local)
+    # The rewritten files now match the new head, nothing to save
+    changed, deleted, touched = manifest.diff(path, applied.paths)
+    for relative, stored in applied.chunked.items():
+        if relative in changed:
+            changed[relative].stored = stored
+    manifest.apply({**changed, **touched}, deleted)
+
+    result.applied = applied
+    result.state = (
+        SyncState.BEHIND if result.backup is None else SyncState.REPLACED
+    )
+    return result
@@ -1,16 +1,34 @@
-class AvailablePortNotFoundError(BaseException):
+class ControlServerError(Exception):
     """
-    No available port was found to host the daemon process server
+    The daemon control server could not be started or reached
     """
 
 
-class ControllerCallError(BaseException):
+class ControllerCallError(Exception):
     """
     An invalid request was made to the Controller
     """
 
 
-class MetadataError(BaseException):
+class MetadataError(Exception):
     """
     Base class for errors during Metadata initialization/operations
     """
+
+
+class GitBackendError(Exception):
+    """
+    A long-lived git process failed or returned unexpected output
+    """
+
+
+class RegistryError(Exception):
+    """
+    An invalid add/remove was made to a directory registry
+    """
+
+
+class RestoreError(Exception):
+    """
+    A snapshot could not be restored into its tracked directory
+    """
@@ -0,0 +1,646 @@
+import hashlib
+import os
+import stat
+import subprocess
+import threading
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from src.core.chunking import (
+    ChunkedFile,
+    ChunkingPolicy,
+    blob_id,
+    build_chunk_manifest,
+    chunk_entry_path,
+    chunk_store_path,
+)
+from src.exceptions import GitBackendError
+from src.settings import settings
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+MODE_FILE = "100644"
+MODE_EXECUTABLE = "100755"
+MODE_SYMLINK = "120000"
+MODE_TREE = "40000"
+
+# Large files streamed at once across all repositories
+_LARGE_STREAMS = threading.BoundedSemaphore(
+    max(1, settings.storage.max_large_ingests)
+)
+
+
+class _StreamSlot:
+    """Holds a large-stream slot for files above the stream threshold"""
+
+    def __init__(self, size: int):
+        self.large = size >= settings.storage.stream_threshold_bytes
+
+    def __enter__(self) -> "_StreamSlot":
+        if self.large:
+            _LARGE_STREAMS.acquire()
+        return self
+
+    def __exit__(self, *args) -> None:
+        if self.large:
+            _LARGE_STREAMS.release()
+
+
+def _quote_path(path: str) -> str:
+    """Quote a path for the fast-import stream when required"""
+    path = path.replace(os.sep, "/")
+    if not any(char in path for char in '\n"\\') and not path.startswith('"'):
+        return path
+    escaped = (
+        path.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+    return f'"{escaped}"'
+
+
+def file_mode(st: os.stat_result) -> str:
+    if stat.S_ISLNK(st.st_mode):
+        return MODE_SYMLINK
+    if st.st_mode & stat.S_IXUSR:
+        return MODE_EXECUTABLE
+    return MODE_FILE
+
+
+def _parse_tree(data: bytes) -> List[Tuple[str, str, str]]:
+    entries = []
+    position = 0
+    while position < len(data):
+        space = data.index(b" ", position)
+        null = data.index(b"\0", space)
+        mode = data[position:space].decode()
+        name = os.fsdecode(data[space + 1 : null])
+        entries.append((mode, name, data[null + 1 : null + 21].hex()))
+        position = null + 21
+    return entries
+
+
+class CommitRecord:
+    """A commit as read from the object store"""
+
+    oid: str
+    tree: str
+    parent: Optional[str]
+    author: str
+    committer: str
+    message: bytes
+
+    def __init__(self, oid: str, data: bytes):
+        self.oid = oid
+        self.parent = None
+        self.author = ""
+        self.committer = ""
+        header, _, self.message = data.partition(b"\n\n")
+        for line in header.decode(errors="replace").split("\n"):
+            key, _, value = line.partition(" ")
+            if key == "tree":
+                self.tree = value
+            elif key == "parent" and self.parent is None:
+                # Only the first parent, snapshots form a linear history
+                self.parent = value
+            elif key == "author":
+                self.author = value
+            elif key == "committer":
+                self.committer = value
+
+    @property
+    def time(self) -> datetime:
+        """Commit time, from the committer line 'Name <email> ts tz'"""
+        timestamp = self.committer.rsplit(" ", 2)[-2]
+        return datetime.fromtimestamp(int(timestamp), tz=timezone.utc)
+
+
+class GitBackend:
+    """
+    Long-lived git processes for one repository: a `git cat-file --batch`
+    pipe for reading objects and a `git fast-import` pipe for writing
+    blobs, trees and commits. Both are started lazily and reused across
+    snapshots, so a save costs no process spawns. Commits are written
+    straight to the object store and the branch ref, the index of the
+    working tree is not maintained.
+    """
+
+    _instances: Dict[str, "GitBackend"] = dict()
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self._lock = threading.RLock()
+        self._cat_file: Optional[subprocess.Popen] = None
+        self._cat_check: Optional[subprocess.Popen] = None
+        self._fast_import: Optional[subprocess.Popen] = None
+        self._mark = 0
+        self._progress = 0
+
+    @classmethod
+    def for_repository(cls, path: str) -> "GitBackend":
+        """Shared backend of a repository, created on first use"""
+        path = os.path.abspath(path)
+        with cls._instances_lock:
+            backend = cls._instances.get(path)
+            if backend is None:
+                backend = cls(path)
+                cls._instances[path] = backend
+            return backend
+
+    @classmethod
+    def close_repository(cls, path: str) -> None:
+        with cls._instances_lock:
+            backend = cls._instances.pop(os.path.abspath(path), None)
+        if backend is not None:
+            backend.close()
+
+    def _spawn(self, args: List[str]) -> subprocess.Popen:
+        try:
+            return subprocess.Popen(
+                ["git", "-C", self.path] + args,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        except OSError as ex:
+            raise GitBackendError(f"Failed to start git {args[0]}: {ex}")
+
+    @staticmethod
+    def _alive(process: Optional[subprocess.Popen]) -> bool:
+        return process is not None and process.poll() is None
+
+    def _reader(self) -> subprocess.Popen:
+        if not self._alive(self._cat_file):
+            self._cat_file = self._spawn(["cat-file", "--batch"])
+        return self._cat_file
+
+    def _checker(self) -> subprocess.Popen:
+        if not self._alive(self._cat_check):
+            self._cat_check = self._spawn(["cat-file", "--batch-check"])
+        return self._cat_check
+
+    def _writer(self) -> subprocess.Popen:
+        if not self._alive(self._fast_import):
+            self._fast_import = self._spawn(
+                ["fast-import", "--quiet", "--done", "--cat-blob-fd=1"]
+            )
+        return self._fast_import
+
+    def _fail(self, message: str) -> None:
+        """Tear the pipes down so the next call starts from scratch"""
+        self.close()
+        raise GitBackendError(f"{message} in {self.path}")
+
+    def read_object(self, rev: str) -> Optional[Tuple[str, bytes]]:
+        """Type and content of an object, None if it does not exist"""
+        with self._lock:
+            process = self._reader()
+            try:
+                process.stdin.write(rev.encode() + b"\n")
+                process.stdin.flush()
+                header = process.stdout.readline()
+                if not header:
+                    self._fail("git cat-file exited")
+                if header.endswith(b" missing\n"):
+                    return None
+                _, kind, size = header.split()
+                data = process.stdout.read(int(size))
+                process.stdout.read(1)
+            except (OSError, ValueError) as ex:
+                self._fail(f"git cat-file failed: {ex}")
+            return kind.decode(), data
+
+    def exists(self, oid: str) -> bool:
+        """Whether an object is already in the repository"""
+        with self._lock:
+            process = self._checker()
+            try:
+                process.stdin.write(oid.encode() + b"\n")
+                process.stdin.flush()
+                header = process.stdout.readline()
+            except OSError as ex:
+                self._fail(f"git cat-file failed: {ex}")
+            if not header:
+                self._fail("git cat-file exited")
+            return not header.endswith(b" missing\n")
+
+    def object_size(self, oid: str) -> Optional[int]:
+        """Size of an object without reading it, None if it is missing"""
+        with self._lock:
+            process = self._checker()
+            try:
+                process.stdin.write(oid.encode() + b"\n")
+                process.stdin.flush()
+                header = process.stdout.readline()
+            except OSError as ex:
+                self._fail(f"git cat-file failed: {ex}")
+            if not header:
+                self._fail("git cat-file exited")
+            if header.endswith(b" missing\n"):
+                return None
+            return int(header.split()[2])
+
+    def copy_object(self, oid: str, out: BinaryIO) -> int:
+        """
+        Write the content of an object to out through a fixed-size buffer,
+        so large blobs are never held in memory. Returns bytes written.
+        """
+        with self._lock:
+            process = self._reader()
+            try:
+                process.stdin.write(oid.encode() + b"\n")
+                process.stdin.flush()
+                header = process.stdout.readline()
+                if not header:
+                    self._fail("git cat-file exited")
+                if header.endswith(b" missing\n"):
+                    raise GitBackendError(f"Missing object {oid}")
+                size = int(header.split()[2])
+                with _StreamSlot(size):
+                    remaining = size
+                    step = settings.storage.stream_buffer_bytes
+                    while remaining:
+                        data = process.stdout.read(min(step, remaining))
+                        if not data:
+                            self._fail("git cat-file exited")
+                        out.write(data)
+                        remaining -= len(data)
+                process.stdout.read(1)
+            except (OSError, ValueError) as ex:
+                self._fail(f"git cat-file failed: {ex}")
+            return size
+
+    def resolve(self, rev: str) -> Optional[str]:
+        """Commit id a revision points at, None if it does not exist"""
+        with self._lock:
+            process = self._reader()
+            try:
+                process.stdin.write(rev.encode() + b"^{commit}\n")
+                process.stdin.flush()
+                header = process.stdout.readline()
+                if not header:
+                    self._fail("git cat-file exited")
+                if header.endswith(b" missing\n"):
+                    return None
+                oid, _, size = header.split()
+                process.stdout.read(int(size) + 1)
+            except (OSError, ValueError) as ex:
+                self._fail(f"git cat-file failed: {ex}")
+            return oid.decode()
+
+    def read_tree(self, oid: str) -> List[Tuple[str, str, str]]:
+        """Entries (mode, name, oid) of a tree object"""
+        result = self.read_object(oid)
+        if result is None or result[0] != "tree":
+            raise GitBackendError(f"Not a tree object: {oid}")
+        return _parse_tree(result[1])
+
+    def list_files(self, rev: str) -> Dict[str, Tuple[str, str]]:
+        """Every blob of a revision as relative path -> (mode, oid)"""
+        result = self.read_object(f"{rev}^{{tree}}")
+        if result is None:
+            raise GitBackendError(f"Unknown revision: {rev}")
+        files = dict()
+        stack = [("", _parse_tree(result[1]))]
+        while stack:
+            prefix, entries = stack.pop()
+            for mode, name, oid in entries:
+                path = prefix + name
+                if mode == MODE_TREE:
+                    stack.append((path + os.sep, self.read_tree(oid)))
+                else:
+                    files[path] = (mode, oid)
+        return files
+
+    def history(self, rev: str) -> List[CommitRecord]:
+        """Commits reachable from a revision by first parents, newest first"""
+        commits = []
+        oid = self.resolve(rev)
+        while oid is not None:
+            result = self.read_object(oid)
+            if result is None or result[0] != "commit":
+                raise GitBackendError(f"Not a commit object: {oid}")
+            record = CommitRecord(oid, result[1])
+            commits.append(record)
+            oid = record.parent
+        return commits
+
+    def replay(
+        self,
+        ref: str,
+        commits: List[CommitRecord],
+        parent: Optional[str] = None,
+    ) -> str:
+        """
+        Recreate commits, oldest first, as a linear history on top of
+        parent (or as a new root). Trees, authors, committers and messages
+        are reused, only the parent links change. The ref is overwritten,
+        so it should be a scratch ref. Returns the new head commit id.
+        """
+        with self._lock:
+            process = self._writer()
+            self._write(process, f"reset {ref}\n".encode())
+            mark = None
+            previous = parent
+            for record in commits:
+                self._mark += 1
+                header = f"commit {ref}\nmark :{self._mark}\n"
+                if record.author:
+                    header += f"author {record.author}\n"
+                header += (
+                    f"committer {record.committer}\n"
+                    f"data {len(record.message)}\n"
+                )
+                self._write(process, header.encode() + record.message)
+                self._write(process, b"\n")
+                if previous is not None:
+                    self._write(process, f"from {previous}\n".encode())
+                self._write(process, b"deleteall\n")
+                for mode, name, oid in self.read_tree(record.tree):
+                    line = f"M {mode.zfill(6)} {oid} {_quote_path(name)}\n"
+                    self._write(process, line.encode())
+                self._write(process, b"\n")
+                mark = self._mark
+                previous = f":{mark}"
+            if mark is None:
+                raise GitBackendError("Nothing to replay")
+
+            self._write(process, f"get-mark :{mark}\n".encode())
+            try:
+                process.stdin.flush()
+                oid = process.stdout.readline().strip().decode()
+            except OSError as ex:
+                self._fail(f"git fast-import failed: {ex}")
+            if len(oid) != 40:
+                self._fail(f"Unexpected fast-import reply '{oid}'")
+
+            # Forget the scratch ref, or it is written again on close
+            self._write(process, f"reset {ref}\n".encode())
+            self._write(process, b"checkpoint\n")
+            self._sync(process)
+            return oid
+
+    def _write(self, process: subprocess.Popen, data: bytes) -> None:
+        try:
+            process.stdin.write(data)
+        except OSError as ex:
+            error = b""
+            if process.poll() is not None:
+                error = process.stderr.read()
+            self._fail(f"git fast-import failed: {ex} {error.decode()}")
+
+    def _sync(self, process: subprocess.Popen) -> None:
+        """Block until fast-import has processed everything sent so far"""
+        self._progress += 1
+        token = f"sync-{self._progress}".encode()
+        self._write(process, b"progress " + token + b"\n")
+        try:
+            process.stdin.flush()
+        except OSError as ex:
+            self._fail(f"git fast-import failed: {ex}")
+        while True:
+            line = process.stdout.readline()
+            if not line:
+                error = process.stderr.read().decode()
+                self._fail(f"git fast-import exited: {error}")
+            if line.strip() == b"progress " + token:
+                return
+
+    def commit(
+        self,
+        branch: str,
+        message: str,
+        author_name: str,
+        author_email: str,
+        when: datetime,
+        files: Dict[str, str],
+        deleted: List[str],
+        chunking: Optional[ChunkingPolicy] = None,
+        blobs: Optional[Dict[str, str]] = None,
+        chunked: Optional[Dict[str, str]] = None,
+    ) -> str:
+        """
+        Commit on top of the branch head. files maps relative paths to
+        absolute source paths, deleted lists relative paths (or
+        directories) to drop. With a chunking policy, large files are
+        committed as chunk manifests, whose ids are added to chunked.
+        Sources found in blobs are stored already, by ingest() or an
+        earlier commit, and are referenced by their mark or blob id
+        instead of being read again. Returns the new commit id.
+        """
+        blobs = blobs or dict()
+        ref = f"refs/heads/{branch}"
+        with self._lock:
+            parent = self.resolve(ref)
+            process = self._writer()
+            self._mark += 1
+            mark = self._mark
+
+            encoded = message.encode()
+            timestamp = f"{int(when.timestamp())} +0000"
+            header = (
+                f"commit {ref}\nmark :{mark}\n"
+                f"committer {author_name} <{author_email}> {timestamp}\n"
+                f"data {len(encoded)}\n"
+            ).encode()
+            self._write(process, header + encoded + b"\n")
+            if parent:
+                self._write(process, f"from {parent}\n".encode())
+
+            for relative in deleted:
+                self._write(process, f"D {_quote_path(relative)}\n".encode())
+                if chunking is not None:
+                    self._drop_chunks(process, relative)
+
+            for relative, source in files.items():
+                if chunking is not None:
+                    self._drop_chunks(process, relative)
+                if source in blobs:
+                    self._write_ingested(
+                        process, relative, source, blobs[source]
+                    )
+                else:
+                    manifest = self._write_file(
+                        process, relative, source, chunking
+                    )
+                    if manifest is not None and chunked is not None:
+                        chunked[relative] = manifest
+
+            self._write(process, b"\n")
+            self._write(process, f"get-mark :{mark}\n".encode())
+            try:
+                process.stdin.flush()
+                oid = process.stdout.readline().strip().decode()
+            except OSError as ex:
+                self._fail(f"git fast-import failed: {ex}")
+            if len(oid) != 40:
+                self._fail(f"Unexpected fast-import reply '{oid}'")
+
+            self._write(process, b"checkpoint\n")
+            self._sync(process)
+            return oid
+
+    def _drop_chunks(self, process: subprocess.Popen, relative: str) -> None:
+        path = _quote_path(chunk_store_path(relative))
+        self._write(process, f"D {path}\n".encode())
+
+    def _write_inline(
+        self, process: subprocess.Popen, mode: str, path: str, data: bytes
+    ) -> None:
+        self._write(
+            process,
+            f"M {mode} inline {_quote_path(path)}\n"
+            f"data {len(data)}\n".encode(),
+        )
+        self._write(process, data + b"\n")
+
+    def _stream(
+        self,
+        process: subprocess.Popen,
+        file: BinaryIO,
+        size: int,
+        digest=None,
+    ) -> None:
+        """Copy exactly size bytes of a file into fast-import"""
+        buffer = memoryview(bytearray(settings.storage.stream_buffer_bytes))
+        remaining = size
+        while remaining:
+            count = file.readinto(buffer[: min(len(buffer), remaining)])
+            if not count:
+                # The data length was announced already, the stream is lost
+                self._fail(f"{file.name} shrank while being stored")
+            if digest is not None:
+                digest.update(buffer[:count])
+            self._write(process, buffer[:count])
+            remaining -= count
+
+    def ingest(self, source: str, size: int) -> Tuple[str, bytes]:
+        """
+        Store a file as a blob, hashing it in the same pass. Returns the
+        mark to pass to commit() through blobs and the git blob id. Fails
+        without writing anything if the file is no longer size bytes.
+        """
+        with self._lock, open(source, "rb", buffering=0) as file:
+            if os.fstat(file.fileno()).st_size != size:
+                raise GitBackendError(f"{source} changed while being stored")
+            process = self._writer()
+            self._mark += 1
+            mark = f":{self._mark}"
+            digest = hashlib.sha1(b"blob %d\0" % size)
+            with _StreamSlot(size):
+                header = f"blob\nmark {mark}\ndata {size}\n"
+                self._write(process, header.encode())
+                self._stream(process, file, size, digest)
+                self._write(process, b"\n")
+            return mark, digest.digest()
+
+    def _write_ingested(
+        self, process: subprocess.Popen, relative: str, source: str, blob: str
+    ) -> None:
+        try:
+            mode = file_mode(os.lstat(source))
+        except FileNotFoundError:
+            self._write(process, f"D {_quote_path(relative)}\n".encode())
+            return
+        line = f"M {mode} {blob} {_quote_path(relative)}\n"
+        self._write(process, line.encode())
+
+    def _write_chunked(
+        self,
+        process: subprocess.Popen,
+        relative: str,
+        source: str,
+        mode: str,
+        chunking: ChunkingPolicy,
+    ) -> str:
+        """
+        Store a file as deduplicated chunks plus a chunk manifest, returns
+        the id of the manifest
+        """
+        chunks = []
+        with ChunkedFile(
+            source, *chunking.bounds(), fixed_above=chunking.fixed_above
+        ) as chunked:
+            for index, data in enumerate(chunked.chunks()):
+                oid = blob_id(data)
+                path = chunk_entry_path(relative, index)
+                if self.exists(oid):
+                    entry = f"M {MODE_FILE} {oid} {_quote_path(path)}\n"
+                    self._write(process, entry.encode())
+                else:
+                    self._write_inline(process, MODE_FILE, path, data)
+                chunks.append((oid, len(data)))
+            manifest = build_chunk_manifest(chunked.size, chunks)
+        self._write_inline(process, mode, relative, manifest)
+        return blob_id(manifest)
+
+    def _write_file(
+        self,
+        process: subprocess.Popen,
+        relative: str,
+        source: str,
+        chunking: Optional[ChunkingPolicy] = None,
+    ) -> Optional[str]:
+        """Store a file, the id of its chunk manifest if it was chunked"""
+        try:
+            st = os.lstat(source)
+            mode = file_mode(st)
+            if (
+                chunking is not None
+                and mode != MODE_SYMLINK
+                and chunking.applies_to(st.st_size)
+            ):
+                return self._write_chunked(
+                    process, relative, source, mode, chunking
+                )
+            if mode == MODE_SYMLINK:
+                data = os.fsencode(os.readlink(source))
+                self._write_inline(process, mode, relative, data)
+                return None
+            file = open(source, "rb", buffering=0)
+        except FileNotFoundError:
+            # Removed after the diff was computed
+            self._write(process, f"D {_quote_path(relative)}\n".encode())
+            return None
+        with file:
+            size = os.fstat(file.fileno()).st_size
+            with _StreamSlot(size):
+                self._write(
+                    process,
+                    f"M {mode} inline {_quote_path(relative)}\n"
+                    f"data {size}\n".encode(),
+                )
+                self._stream(process, file, size)
+                self._write(process, b"\n")
+        return None
+
+    def _close_process(
+        self,
+        process: Optional[subprocess.Popen],
+        farewell: Optional[bytes],
+    ) -> None:
+        if process is None:
+            return
+        try:
+            if farewell and process.poll() is None:
+                process.stdin.write(farewell)
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_process(self._fast_import, b"done\n")
+            self._close_process(self._cat_file, None)
+            self._close_process(self._cat_check, None)
+            self._fast_import = None
+            self._cat_file = None
+            self._cat_check = None
@@ -1,12 +1,19 @@
+import base64
+import hashlib
 import os
+import shutil
 import subprocess
 import platform
+from functools import lru_cache
+from typing import List, Optional, Set, Tuple
+from src.constraints import GIT_DIRECTORY_NAME, OBJECT_STORE_REF_PREFIX
 from src.logger import LoggerFactory
 
 
 logger = LoggerFactory.getLogger(__name__)
 
 
+@lru_cache(maxsize=None)
 def is_git_installed() -> bool:
     try:
         # Check if git is available
@@ -77,3 +84,382 @@ def create_master_branch(path: str, master_branch: str = "master") -> None:
         ["git", "-C", path, "checkout", "-b", master_branch], check=True
     )
     logger.info("Created a master branch from the current HEAD.")
+
+
+def ensure_git_repository(
+    path: str,
+    master_branch: str = "master",
+    object_store: Optional[str] = None,
+) -> None:
+    # Initialize a repository in a tracked directory on first use
+    if not os.path.isdir(os.path.join(path, GIT_DIRECTORY_NAME)):
+        create_git_repository(path)
+        subprocess.run(
+            [
+                "git",
+                "-C",
+                path,
+                "symbolic-ref",
+                "HEAD",
+                f"refs/heads/{master_branch}",
+            ],
+            check=True,
+        )
+    if object_store:
+        link_object_store(path, object_store)
+
+
+def _alternates_path(path: str) -> str:
+    return os.path.join(
+        path, GIT_DIRECTORY_NAME, "objects", "info", "alternates"
+    )
+
+
+def _store_objects(store: str) -> str:
+    return os.path.join(os.path.abspath(store), "objects")
+
+
+def _is_linked(path: str, store: str) -> bool:
+    try:
+        with open(_alternates_path(path), "r") as file:
+            return _store_objects(store) in file.read().splitlines()
+    except FileNotFoundError:
+        return False
+
+
+def object_store_key(path: str) -> str:
+    # Name of a repository inside the shared store, stable for its path
+    return hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+
+
+def link_object_store(path: str, store: str) -> None:
+    # Let a repository read objects from the shared store, so objects
+    # already stored there are not written again. The store is a bare
+    # repository created on first use
+    if _is_linked(path, store):
+        return
+    if not os.path.isdir(_store_objects(store)):
+        subprocess.run(
+            ["git", "init", "-q", "--bare", os.path.abspath(store)],
+            check=True,
+        )
+        logger.info(f"Created a shared object store at {store}.")
+    alternates = _alternates_path(path)
+    os.makedirs(os.path.dirname(alternates), exist_ok=True)
+    with open(alternates, "a") as file:
+        file.write(_store_objects(store) + "\n")
+
+
+def share_objects(path: str, store: str) -> None:
+    # Move the objects of a repository the store does not have yet into it.
+    # Local objects are packed without those found through alternates, the
+    # pack is moved over whole and the store refs of the repository are
+    # updated so its history stays reachable when the store is collected
+    if not _is_linked(path, store):
+        return
+    subprocess.run(
+        ["git", "-C", path, "repack", "-A", "-d", "-l", "-q"],
+        check=True,
+    )
+    local_packs = os.path.join(path, GIT_DIRECTORY_NAME, "objects", "pack")
+    store_packs = os.path.join(_store_objects(store), "pack")
+    names = sorted(
+        name for name in os.listdir(local_packs) if name.startswith("pack-")
+    )
+    # Git finds packs by their index, it is moved after everything else
+    names.sort(key=lambda name: name.endswith(".idx"))
+    for name in names:
+        shutil.move(
+            os.path.join(local_packs, name), os.path.join(store_packs, name)
+        )
+    key = object_store_key(path)
+    subprocess.run(
+        [
+            "git",
+            "-C",
+            store,
+            "fetch",
+            "-q",
+            "--prune",
+            "--no-write-fetch-head",
+            os.path.abspath(path),
+            f"+refs/heads/*:{OBJECT_STORE_REF_PREFIX}/{key}/*",
+        ],
+        check=True,
+        stdout=subprocess.PIPE,
+    )
+
+
+def dissociate_object_store(path: str, store: str) -> None:
+    # Copy every object a repository borrows from the store back into it
+    # and unlink it, so collecting the store cannot break its history
+    if not _is_linked(path, store):
+        return
+    subprocess.run(["git", "-C", path, "repack", "-a", "-d", "-q"], check=True)
+    alternates = _alternates_path(path)
+    with open(alternates, "r") as file:
+        kept = [
+            line
+            for line in file.read().splitlines()
+            if line != _store_objects(store)
+        ]
+    if kept:
+        with open(alternates, "w") as file:
+            file.write("".join(line + "\n" for line in kept))
+    else:
+        os.remove(alternates)
+    prefix = f"{OBJECT_STORE_REF_PREFIX}/{object_store_key(path)}/"
+    refs = subprocess.run(
+        ["git", "-C", store, "for-each-ref", "--format=%(refname)", prefix],
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout.decode()
+    commands = "".join(f"delete {ref}\n" for ref in refs.split())
+    if commands:
+        subprocess.run(
+            ["git", "-C", store, "update-ref", "--stdin"],
+            input=commands.encode(),
+            check=True,
+        )
+
+
+def stage_paths(path: str, paths: List[str], deleted: List[str]) -> None:
+    # Stage changed and removed paths, relative to the repository root
+    if deleted:
+        subprocess.run(
+            [
+                "git",
+                "--literal-pathspecs",
+                "-C",
+                path,
+                "rm",
+                "-r",
+                "-q",
+                "--cached",
+                "--ignore-unmatch",
+                "--pathspec-from-file=-",
+                "--pathspec-file-nul",
+            ],
+            input="\0".join(deleted).encode(),
+            check=True,
+            stdout=subprocess.PIPE,
+        )
+    if paths:
+        subprocess.run(
+            [
+                "git",
+                "--literal-pathspecs",
+                "-C",
+                path,
+                "add",
+                "-A",
+                "--pathspec-from-file=-",
+                "--pathspec-file-nul",
+            ],
+            input="\0".join(paths).encode(),
+            check=True,
+        )
+
+
+def reset_index(path: str) -> None:
+    # Bring the index back in line with HEAD, keeping the working tree
+    subprocess.run(["git", "-C", path, "reset", "-q"], check=True)
+
+
+def stage_all(path: str) -> None:
+    subprocess.run(["git", "-C", path, "add", "-A"], check=True)
+
+
+def list_files(path: str) -> Tuple[Set[str], Set[str]]:
+    # (tracked, untracked) relative paths of the files in a work tree,
+    # .gitignore files are not applied
+    def ls_files(*options: str) -> Set[str]:
+        output = subprocess.run(
+            ["git", "-C", path, "ls-files", "-z", *options],
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+        return {os.fsdecode(item) for item in output.split(b"\0") if item}
+
+    return ls_files("--cached"), ls_files("--others")
+
+
+def commit(
+    path: str, message: str, author_name: str, author_email: str
+) -> bool:
+    # Commit the index, returns False when there was nothing to commit
+    diff = subprocess.run(
+        ["git", "-C", path, "diff", "--cached", "--quiet"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if diff.returncode == 0:
+        return False
+    subprocess.run(
+        [
+            "git",
+            "-c",
+            f"user.name={author_name}",
+            "-c",
+            f"user.email={author_email}",
+            "-C",
+            path,
+            "commit",
+            "-q",
+            "--no-verify",
+            "-m",
+            message,
+        ],
+        check=True,
+    )
+    return True
+
+
+def _auth_environment(access_token: Optional[str]) -> Optional[dict]:
+    # The token is passed through the environment, not the command line
+    if not access_token:
+        return None
+    credentials = base64.b64encode(
+        f"x-access-token:{access_token}".encode()
+    ).decode()
+    return dict(
+        os.environ,
+        GIT_CONFIG_COUNT="1",
+        GIT_CONFIG_KEY_0="http.extraHeader",
+        GIT_CONFIG_VALUE_0=f"Authorization: Basic {credentials}",
+    )
+
+
+def push_branch(
+    path: str,
+    url: str,
+    branch: str,
+    remote_branch: Optional[str] = None,
+    access_token: Optional[str] = None,
+    force: bool = False,
+) -> None:
+    # Push a local branch to a remote given by url, no remote config needed
+    remote_branch = remote_branch or branch
+    refspec = f"refs/heads/{branch}:refs/heads/{remote_branch}"
+    subprocess.run(
+        [
+            "git",
+            "-C",
+            path,
+            "push",
+            "-q",
+            url,
+            f"+{refspec}" if force else refspec,
+        ],
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=_auth_environment(access_token),
+    )
+
+
+def fetch_branch(
+    path: str,
+    url: str,
+    remote_branch: str,
+    ref: str,
+    access_token: Optional[str] = None,
+    depth: Optional[int] = None,
+    deepen: Optional[int] = None,
+) -> Optional[str]:
+    # Fetch a branch of a remote into ref and return its commit, None when
+    # the remote has no such branch. Only objects missing locally are sent,
+    # with depth a repository without history gets just the last commits,
+    # with deepen a shallow one gets that many more below its boundary
+    args = ["git", "-C", path, "fetch", "-q", "--no-tags"]
+    args += ["--no-write-fetch-head", "--no-recurse-submodules"]
+    if depth:
+        args.append(f"--depth={depth}")
+    if deepen:
+        args.append(f"--deepen={deepen}")
+    args += [url, f"+refs/heads/{remote_branch}:{ref}"]
+    fetch = subprocess.run(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=_auth_environment(access_token),
+    )
+    if fetch.returncode != 0:
+        error = fetch.stderr.decode(errors="replace")
+        if "couldn't find remote ref" in error:
+            return None
+        raise subprocess.CalledProcessError(
+            fetch.returncode, args, fetch.stdout, fetch.stderr
+        )
+    return subprocess.run(
+        ["git", "-C", path, "rev-parse", "--verify", "-q", ref],
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout.decode().strip()
+
+
+def shallow_commits(path: str) -> Set[str]:
+    # Commits a shallow repository has no parents for, empty when the
+    # repository has its whole history
+    shallow = subprocess.run(
+        ["git", "-C", path, "rev-parse", "--git-path", "shallow"],
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout.decode().strip()
+    try:
+        with open(os.path.join(path, shallow)) as file:
+            return set(file.read().split())
+    except FileNotFoundError:
+        return set()
+
+
+def is_ancestor(path: str, ancestor: str, commit: str) -> bool:
+    # Whether commit contains ancestor in its history (or is ancestor)
+    check = subprocess.run(
+        ["git", "-C", path, "merge-base", "--is-ancestor", ancestor, commit],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if check.returncode > 1:
+        raise subprocess.CalledProcessError(
+            check.returncode, check.args, check.stdout, check.stderr
+        )
+    return check.returncode == 0
+
+
+def update_ref(path: str, ref: str, new: str, old: Optional[str]) -> None:
+    # Move a ref, failing if it no longer points at old
+    args = ["git", "-C", path, "update-ref", ref, new]
+    if old is not None:
+        args.append(old)
+    subprocess.run(args, check=True, stdout=subprocess.PIPE)
+
+
+def delete_ref(path: str, ref: str) -> None:
+    subprocess.run(
+        ["git", "-C", path, "update-ref", "-d", ref],
+        check=True,
+        stdout=subprocess.PIPE,
+    )
+
+
+def collect_garbage(path: str, prune_now: bool = False) -> None:
+    # Repack the repository. With prune_now, objects dropped from history
+    # are deleted right away instead of after the usual grace period
+    if prune_now:
+        subprocess.run(
+            [
+                "git",
+                "-C",
+                path,
+                "reflog",
+                "expire",
+                "--expire-unreachable=now",
+                "--all",
+            ],
+            check=True,
+        )
+        args = ["gc", "--quiet", "--prune=now"]
+    else:
+        args = ["gc", "--quiet", "--auto"]
+    subprocess.run(["git", "-C", path] + args, check=True)
@@ -1,12 +1,29 @@
+import atexit
 import logging
+import queue
 import sys
-from typing import Optional
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
 from src.settings import settings
 
 
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread untouched. The stock handler
+    formats every record in the logging thread, here that is left to the
+    listener so a log call only costs an enqueue.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
 class LoggerFactory:
     _configured = False
     _handler = None
+    _listener: Optional[QueueListener] = None
 
     @classmethod
     def _create_handler(cls) -> logging.Handler:
@@ -19,16 +36,26 @@ class LoggerFactory:
         handler.setFormatter(formatter)
         return handler
 
+    @classmethod
+    def _create_queue_handler(cls) -> logging.Handler:
+        """Queue in front of the standard handler, drained by one thread."""
+        records = queue.SimpleQueue()
+        cls._listener = QueueListener(records, cls._create_handler())
+        cls._listener.start()
+        atexit.register(cls.shutdown)
+        return _NonBlockingQueueHandler(records)
+
     @classmethod
     def _configure_logger(cls, logger: logging.Logger) -> None:
         """Configure a logger instance with the standard settings."""
         if cls._handler is None:
-            cls._handler = cls._create_handler()
+            cls._handler = cls._create_queue_handler()
 
         log_level = getattr(logging, settings.logging.log_level)
 
         logger.setLevel(log_level)
-        logger.addHandler(cls._handler)
+        if cls._handler not in logger.handlers:
+            logger.addHandler(cls._handler)
 
         # Prevent duplicate logs from propagating to root logger
         logger.propagate = False
@@ -39,3 +66,71 @@ class LoggerFactory:
         logger = logging.getLogger(name)
         cls._configure_logger(logger)
         return logger
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """Write out every queued record and stop the listener thread."""
+        listener, cls._listener = cls._listener, None
+        if listener is not None:
+            listener.stop()
+
+
+class EventLogAggregator:
+    """
+    Turns per-event debug logging into one summary line per directory
+    and interval, e.g. "412 modified, 3 created events in /saves/foo
+    over 2.0s". Recording an event is a counter increment, and nothing at
+    all unless the logger has DEBUG enabled. Summaries are written by a
+    background thread started on first use.
+    """
+
+    def __init__(self, logger: logging.Logger, interval: float):
+        self.logger = logger
+        self.interval = interval
+        self._lock = threading.Lock()
+        # directory -> (window start, event kind -> count)
+        self._windows: Dict[str, Tuple[float, Dict[str, int]]] = dict()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, directory: str, kind: str) -> None:
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        with self._lock:
+            window = self._windows.get(directory)
+            if window is None:
+                window = (time.monotonic(), dict())
+                self._windows[directory] = window
+            counts = window[1]
+            counts[kind] = counts.get(kind, 0) + 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="event-log", daemon=True
+                )
+                self._thread.start()
+
+    def flush(self) -> None:
+        """Write the summaries of every window that is over"""
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                (directory, started, counts)
+                for directory, (started, counts) in self._windows.items()
+                if now - started >= self.interval
+            ]
+            for directory, _, _ in due:
+                del self._windows[directory]
+        for directory, started, counts in due:
+            summary = ", ".join(
+                f"{count} {kind}"
+                for kind, count in sorted(
+                    counts.items(), key=lambda item: -item[1]
+                )
+            )
+            self.logger.debug(
+                f"{summary} events in {directory} over {now - started:.1f}s"
+            )
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.flush()
@@ -0,0 +1,410 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+from src.utils import atomic_write
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in labels.items()
+    )
+    return "{" + inner + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base of a labelled metric family"""
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series: Dict[LabelValues, Any] = dict()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise ValueError(
+                f"Metric {self.name} expects labels {self.labels}"
+            )
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _labels(self, key: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.labels, key))
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+    def remove(self, **labels: str) -> None:
+        """Forget every series matching the given (subset of) labels"""
+        with self._lock:
+            for key in list(self._series):
+                values = self._labels(key)
+                if all(values.get(k) == str(v) for k, v in labels.items()):
+                    del self._series[key]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        with self._lock:
+            return self._series.get(self._key(labels), 0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [
+                (self.name, self._labels(key), value)
+                for key, value in self._series.items()
+            ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # Bucket counts (the last one is +Inf) and [sum, count]
+            series = self._series.get(key)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0, 0])
+                self._series[key] = series
+            counts, totals = series
+            counts[index] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+        return int(series[1][1]) if series else 0
+
+    def samples(self) -> List[Sample]:
+        samples = []
+        with self._lock:
+            series = [
+                (key, list(counts), list(totals))
+                for key, (counts, totals) in self._series.items()
+            ]
+        for key, counts, totals in series:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(
+                    (
+                        f"{self.name}_bucket",
+                        dict(labels, le=_format_value(bound)),
+                        cumulative,
+                    )
+                )
+            samples.append((f"{self.name}_sum", labels, totals[0]))
+            samples.append((f"{self.name}_count", labels, totals[1]))
+        return samples
+
+
+class PhaseTimer:
+    """Accumulates wall time per named phase of a single operation"""
+
+    def __init__(self):
+        self.durations: Dict[str, float] = dict()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+
+class MetricsRegistry:
+    """
+    Process-wide set of metric families rendered in the Prometheus text
+    exposition format. Values that are cheaper to read on demand than to
+    keep up to date (queue depths, thread counts) come from collectors,
+    callables invoked at render time yielding gauge samples.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = dict()
+        self._collectors: Dict[str, Tuple[str, Callable[[], List]]] = dict()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(
+                        f"Metric {metric.name} already registered \
+as a {existing.kind}"
+                    )
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labels=()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels=()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(
+        self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def collector(
+        self,
+        name: str,
+        help: str,
+        collect: Callable[[], List[Tuple[Dict[str, str], float]]],
+    ) -> None:
+        """Register a gauge whose (labels, value) pairs are read lazily"""
+        with self._lock:
+            self._collectors[name] = (help, collect)
+
+    def remove_series(self, **labels: str) -> None:
+        """Drop the series carrying these label values in every metric"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            if set(labels) <= set(metric.labels):
+                metric.remove(**labels)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+            collectors = sorted(self._collectors.items())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(
+                    f"{name}{_format_labels(labels)} {_format_value(value)}"
+                )
+        for name, (help, collect) in collectors:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in collect():
+                lines.append(
+                    f"{name}{_format_labels(labels)} {_format_value(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+EVENTS_RECEIVED = registry.counter(
+    "gamesave_events_received_total",
+    "Filesystem events delivered to a directory handler",
+    labels=("directory",),
+)
+EVENTS_DROPPED = registry.counter(
+    "gamesave_events_dropped_total",
+    "Events not queued one by one (paused, excluded, ignored, rescan)",
+    labels=("directory", "reason"),
+)
+SNAPSHOTS = registry.counter(
+    "gamesave_snapshots_total",
+    "Snapshot attempts by outcome",
+    labels=("directory", "result"),
+)
+SNAPSHOT_SECONDS = registry.histogram(
+    "gamesave_snapshot_duration_seconds",
+    "Wall time of a snapshot",
+    labels=("directory",),
+)
+SNAPSHOT_WAIT_SECONDS = registry.histogram(
+    "gamesave_snapshot_wait_seconds",
+    "Time a snapshot job waited for a free worker",
+    labels=("directory",),
+)
+SNAPSHOT_PHASE_SECONDS = registry.histogram(
+    "gamesave_snapshot_phase_seconds",
+    "Wall time of each snapshot phase "
+    "(scan, hash, stage, commit, index)",
+    labels=("directory", "phase"),
+)
+FILES_STORED = registry.counter(
+    "gamesave_files_stored_total",
+    "Files written to the repository by snapshots",
+    labels=("directory",),
+)
+BYTES_STORED = registry.counter(
+    "gamesave_bytes_stored_total",
+    "Bytes of file content written to the repository by snapshots",
+    labels=("directory",),
+)
+SNAPSHOTS_PRUNED = registry.counter(
+    "gamesave_snapshots_pruned_total",
+    "Snapshots dropped from history by the retention policy",
+    labels=("directory",),
+)
+MAINTENANCE_SECONDS = registry.histogram(
+    "gamesave_maintenance_duration_seconds",
+    "Wall time of repository maintenance (pruning and garbage collection)",
+    labels=("directory",),
+)
+PUSHES = registry.counter(
+    "gamesave_pushes_total",
+    "Pushes of a directory to a remote by result",
+    labels=("directory", "result"),
+)
+PUSH_SECONDS = registry.histogram(
+    "gamesave_push_duration_seconds",
+    "Wall time of a push of one directory to one remote",
+    labels=("directory",),
+)
+SYNCS = registry.counter(
+    "gamesave_syncs_total",
+    "Syncs of a directory from a remote by outcome",
+    labels=("directory", "result"),
+)
+SYNC_SECONDS = registry.histogram(
+    "gamesave_sync_duration_seconds",
+    "Wall time of a sync, fetch and checkout included",
+    labels=("directory",),
+)
+
+
+class TextfileExporter:
+    """
+    Periodically writes the registry to a file, for scrapers that read
+    files (e.g. the node_exporter textfile collector) instead of polling
+    the daemon.
+    """
+
+    def __init__(self, metrics: MetricsRegistry, path: str, interval: float):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="metrics-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop exporting, writing the final values once more"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.write()
+
+    def write(self) -> None:
+        atomic_write(self.path, self.metrics.render().encode())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError as ex:
+                logger.warning(f"Failed writing metrics to {self.path}: {ex}")
+
+
+def observe_phases(directory: str, timer: PhaseTimer) -> None:
+    for phase, seconds in timer.durations.items():
+        SNAPSHOT_PHASE_SECONDS.observe(
+            seconds, directory=directory, phase=phase
+        )
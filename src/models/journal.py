@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Tuple
+from src.utils import fsync_directory
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+class MetadataJournal:
+    """
+    Append-only, fsynced log of metadata changes, one JSON record per
+    line. Replayed on top of the last metadata snapshot when loading and
+    truncated once the changes are compacted into a new snapshot. A write
+    torn by a crash is cut off on open, so later records are appended
+    after the last complete one instead of onto the garbage.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._records = self._recover()
+
+    def _recover(self) -> int:
+        """Truncate the journal to its readable records, their count"""
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return 0
+        length, records = _readable_prefix(data)
+        if length < len(data):
+            logger.warning(
+                f"Dropping {len(data) - length} unreadable trailing bytes \
+of the metadata journal {self.path}"
+            )
+            with open(self.path, "r+b") as file:
+                file.truncate(length)
+                os.fsync(file.fileno())
+        return len(records)
+
+    def __len__(self) -> int:
+        return self._records
+
+    def append(self, op: str, **payload: Any) -> None:
+        line = json.dumps({"op": op, **payload}, separators=(",", ":"))
+        with self._lock:
+            created = not os.path.exists(self.path)
+            with open(self.path, "ab") as file:
+                file.write(line.encode() + b"\n")
+                file.flush()
+                os.fsync(file.fileno())
+            if created:
+                fsync_directory(os.path.dirname(os.path.abspath(self.path)))
+            self._records += 1
+
+    def reset(self) -> None:
+        """Drop all records, called after they were compacted"""
+        with self._lock:
+            with open(self.path, "wb") as file:
+                os.fsync(file.fileno())
+            self._records = 0
+
+    @staticmethod
+    def read(path: str) -> List[Dict[str, Any]]:
+        """Records in order, stopping at a torn trailing write"""
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return []
+
+        length, records = _readable_prefix(data)
+        if length < len(data):
+            logger.warning(
+                f"Ignoring unreadable metadata journal record \
+                    {len(records) + 1} and everything after it in {path}"
+            )
+        return records
+
+
+def _readable_prefix(data: bytes) -> Tuple[int, List[Dict[str, Any]]]:
+    """Length and records of the complete, parseable leading lines"""
+    length = 0
+    records = []
+    while length < len(data):
+        end = data.find(b"\n", length)
+        if end < 0:
+            # Last line without its newline, the write did not finish
+            break
+        line = data[length:end]
+        if line:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+        length = end + 1
+    return length, records
+
+
+def replay(data: Dict[str, Any], records: List[Dict[str, Any]]) -> None:
+    """
+    Apply journal records to a metadata snapshot dict in place. Every
+    operation is idempotent: a crash between writing a snapshot and
+    resetting the journal replays records the snapshot already holds.
+    """
+    directories: List[Dict[str, Any]] = data.setdefault("directories", [])
+    remotes: List[Dict[str, Any]] = data.setdefault("remotes", [])
+
+    for record in records:
+        op = record.get("op")
+        if op == "add_directory":
+            directory = record["directory"]
+            directories[:] = [
+                item
+                for item in directories
+                if item["path"] != directory["path"]
+            ]
+            directories.append(directory)
+        elif op == "delete_directory":
+            directories[:] = [
+                item for item in directories if item["path"] != record["path"]
+            ]
+        elif op == "save_time":
+            for item in directories:
+                if item["path"] == record["path"]:
+                    item["last_save_time"] = record["time"]
+        elif op == "add_remote":
+            remote = record["remote"]
+            remotes[:] = [
+                item for item in remotes if item["url"] != remote["url"]
+            ]
+            remotes.append(remote)
+        elif op == "delete_remote":
+            remotes[:] = [
+                item for item in remotes if item["url"] != record["url"]
+            ]
+        else:
+            logger.warning(f"Unknown metadata journal operation: {op}")
@@ -1,13 +1,19 @@
 import json
 import os
-from pydantic import FilePath, DirectoryPath
-from typing import List, Dict, Any, Set, Optional
+import threading
+from datetime import datetime
+from pydantic import DirectoryPath, Field, PrivateAttr
+from typing import List, Dict, Any, Optional
 from pydantic_settings import BaseSettings
 from src.models.tracked_directory import TrackedDirectory
 from src.models.remote import GitRemote
 from src.models.version import Version
+from src.models.registry import DirectoryRegistry
+from src.models.journal import MetadataJournal, replay
+from src.settings import settings
+from src.utils import atomic_write
 from src.logger import LoggerFactory
-from src.constraints import APP_VERSION
+from src.constraints import APP_VERSION, METADATA_JOURNAL_SUFFIX
 from src.exceptions import MetadataError
 
 
@@ -19,11 +25,15 @@ CONFIG_FIELDS = {"version", "directories", "remotes"}
 
 class Metadata(BaseSettings):
     version: Version = APP_VERSION
-    directories: List[TrackedDirectory] = []
+    directories: DirectoryRegistry[TrackedDirectory] = Field(
+        default_factory=DirectoryRegistry
+    )
     remotes: List[GitRemote] = []
-    path: FilePath
-    directory_paths: Set[DirectoryPath] = set()
-    directory_names: Set[str] = set()
+    path: str
+    _journal: Optional[MetadataJournal] = PrivateAttr(default=None)
+    # Orders journal appends against compactions, a record appended
+    # between the dump and the journal reset would be lost
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
 
     def __new__(cls, *args, **kwargs):
         if not hasattr(cls, "_instance"):
@@ -53,34 +63,61 @@ class Metadata(BaseSettings):
             super().__init__(path=path)
 
     def model_post_init(self, context: Any, /) -> None:
-        self.directory_paths = set([dir.path for dir in self.directories])
-        self.directory_names = set([dir.name for dir in self.directories])
+        self._journal = MetadataJournal(Metadata.journal_path(self.path))
+
+    @staticmethod
+    def journal_path(path: str) -> str:
+        return f"{path}{METADATA_JOURNAL_SUFFIX}"
 
     @staticmethod
     def load_from_disk(path: str) -> Dict[str, Any]:
-        with open(path, "r") as file:
-            data = json.load(file)
+        """Last snapshot with the journaled changes replayed on top"""
+        records = MetadataJournal.read(Metadata.journal_path(path))
+        try:
+            with open(path, "r") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            if not records:
+                raise
+            data = dict()
+        # Files written by older versions hold a JSON encoded string
+        if isinstance(data, str):
+            data = json.loads(data)
+
+        replay(data, records)
         return data
 
     def save_to_disk(self) -> None:
-        with open(self.path, "w") as file:
-            json.dump(self.model_dump_json(include=CONFIG_FIELDS), file)
+        """Compact the journal into a new, atomically replaced snapshot"""
+        with self._lock:
+            data = self.model_dump_json(include=CONFIG_FIELDS).encode()
+            atomic_write(self.path, data)
+            if self._journal is not None:
+                self._journal.reset()
+
+    def _record(self, op: str, **payload: Any) -> None:
+        if self._journal is None:
+            return
+        with self._lock:
+            self._journal.append(op, **payload)
+            limit = settings.metadata.journal_compact_records
+            if len(self._journal) >= limit:
+                self.save_to_disk()
 
     def add_directory(self, dir: TrackedDirectory) -> None:
-        if dir.path in self.directory_paths:
+        if dir.path in self.directories:
             raise MetadataError(
                 f"Attempted to add an already present \
                            directory to Metadata: {dir.path}. Skipping."
             )
-        if dir.name in self.directory_names:
+        if self.directories.has_name(dir.name):
             raise MetadataError(
                 f"Attempted to add a directory with a duplicate \
                            name to Metadata: {dir.name}. Skipping."
             )
 
-        self.directories.append(dir)
-        self.directory_paths.add(dir.path)
-        self.directory_names.add(dir.name)
+        self.directories.add(dir)
+        self._record("add_directory", directory=dir.model_dump(mode="json"))
 
     def delete_directory(
         self, name: Optional[str], path: Optional[DirectoryPath]
@@ -97,23 +134,43 @@ class Metadata(BaseSettings):
                         Prioritizing name."
             )
 
-        if name and name not in self.directory_names:
+        if name and not self.directories.has_name(name):
             raise MetadataError("Tried to delete name not present in Metadata")
-        if not name and path not in self.directory_paths:
+        if not name and path not in self.directories:
             raise MetadataError("Tried to delete path not present in Metadata")
 
-        for idx, dir in enumerate(self.directories):
-            if name and dir.name == name:
-                self.directories.pop(idx)
-                self.directory_names.remove(name)
-                self.directory_paths.remove(dir.path)
-                return
-            if path and dir.path == path:
-                self.directories.pop(idx)
-                self.directory_names.remove(dir.name)
-                self.directory_paths.remove(path)
-                return
+        if name:
+            dir = self.directories.pop_by_name(name)
+        else:
+            dir = self.directories.pop(path)
+        self._record("delete_directory", path=str(dir.path))
 
-        raise MetadataError(
-            "Failed to delete a directory given valid args: ({name}, {path})"
+    def update_save_time(self, dir: TrackedDirectory) -> None:
+        """Journal the last_save_time of a directory after a snapshot"""
+        if dir.path not in self.directories:
+            raise MetadataError(
+                f"Tried to update save time of a directory \
+                    not present in Metadata: {dir.path}"
+            )
+        time: Optional[datetime] = dir.last_save_time
+        self._record(
+            "save_time",
+            path=str(dir.path),
+            time=time.isoformat() if time else None,
         )
+
+    def add_remote(self, remote: GitRemote) -> None:
+        if any(item.url == remote.url for item in self.remotes):
+            raise MetadataError(
+                f"Attempted to add an already present remote: {remote.url}"
+            )
+        self.remotes.append(remote)
+        self._record("add_remote", remote=remote.model_dump(mode="json"))
+
+    def delete_remote(self, url: str) -> None:
+        for idx, remote in enumerate(self.remotes):
+            if str(remote.url) == str(url):
+                self.remotes.pop(idx)
+                self._record("delete_remote", url=str(remote.url))
+                return
+        raise MetadataError(f"Tried to delete a remote not present: {url}")
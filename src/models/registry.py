@@ -0,0 +1,151 @@
+import os
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Optional,
+    TypeVar,
+)
+from pydantic import GetCoreSchemaHandler
+from pydantic_core import core_schema
+from src.models.tracked_directory import TrackedDirectory
+from src.exceptions import RegistryError
+
+
+T = TypeVar("T")
+
+
+def _key(path) -> str:
+    return os.path.abspath(os.fsdecode(path))
+
+
+class DirectoryRegistry(Generic[T]):
+    """
+    Insertion-ordered collection of items tied to a TrackedDirectory,
+    indexed by directory name and absolute path. Any path can be mapped
+    to the directories containing it by walking up its parents, so the
+    lookup costs O(depth) regardless of how many directories are tracked.
+    """
+
+    def __init__(
+        self,
+        items: Optional[List[T]] = None,
+        directory_of: Callable[[T], TrackedDirectory] = lambda item: item,
+    ):
+        self._directory_of = directory_of
+        self._by_path: Dict[str, T] = dict()
+        self._by_name: Dict[str, T] = dict()
+        for item in items or []:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self._by_path)
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(list(self._by_path.values()))
+
+    def __contains__(self, path) -> bool:
+        return _key(path) in self._by_path
+
+    def __getitem__(self, path) -> T:
+        item = self._by_path.get(_key(path))
+        if item is None:
+            raise KeyError(path)
+        return item
+
+    def __repr__(self) -> str:
+        return f"DirectoryRegistry({list(self._by_path.values())!r})"
+
+    def values(self) -> List[T]:
+        return list(self._by_path.values())
+
+    def paths(self) -> List[str]:
+        return list(self._by_path)
+
+    def names(self) -> List[str]:
+        return list(self._by_name)
+
+    def has_name(self, name: str) -> bool:
+        return name in self._by_name
+
+    def get(self, path) -> Optional[T]:
+        return self._by_path.get(_key(path))
+
+    def get_by_name(self, name: str) -> Optional[T]:
+        return self._by_name.get(name)
+
+    def add(self, item: T) -> None:
+        directory = self._directory_of(item)
+        path = _key(directory.path)
+        if path in self._by_path:
+            raise RegistryError(f"Directory already registered: {path}")
+        if directory.name in self._by_name:
+            raise RegistryError(
+                f"Directory name already registered: {directory.name}"
+            )
+        self._by_path[path] = item
+        self._by_name[directory.name] = item
+
+    def pop(self, path) -> T:
+        item = self._by_path.pop(_key(path), None)
+        if item is None:
+            raise RegistryError(f"Directory not registered: {path}")
+        del self._by_name[self._directory_of(item).name]
+        return item
+
+    def pop_by_name(self, name: str) -> T:
+        item = self._by_name.pop(name, None)
+        if item is None:
+            raise RegistryError(f"Directory name not registered: {name}")
+        del self._by_path[_key(self._directory_of(item).path)]
+        return item
+
+    def clear(self) -> None:
+        self._by_path.clear()
+        self._by_name.clear()
+
+    def owners_of(self, path) -> List[T]:
+        """Items of every registered directory containing a path"""
+        owners = []
+        current = _key(path)
+        while True:
+            item = self._by_path.get(current)
+            if item is not None:
+                owners.append(item)
+            parent = os.path.dirname(current)
+            if parent == current:
+                return owners
+            current = parent
+
+    def owner_of(self, path) -> Optional[T]:
+        """Item of the innermost registered directory containing a path"""
+        owners = self.owners_of(path)
+        return owners[0] if owners else None
+
+    # Allow Pydantic to validate from and serialize to a plain list
+    @classmethod
+    def __get_pydantic_core_schema__(
+        cls, source_type: Any, handler: GetCoreSchemaHandler
+    ) -> core_schema.CoreSchema:
+        list_schema = core_schema.list_schema(
+            handler.generate_schema(TrackedDirectory)
+        )
+        return core_schema.no_info_after_validator_function(
+            cls._validate,
+            core_schema.union_schema(
+                [core_schema.is_instance_schema(cls), list_schema]
+            ),
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                lambda registry: registry.values(),
+                return_schema=list_schema,
+            ),
+        )
+
+    @classmethod
+    def _validate(cls, value) -> "DirectoryRegistry":
+        if isinstance(value, cls):
+            return value
+        return cls(items=value)
@@ -1,6 +1,8 @@
-from pydantic import BaseModel, HttpUrl
+from typing import Optional, Union
+from pydantic import BaseModel, FileUrl, HttpUrl
 
 
 class GitRemote(BaseModel):
-    url: HttpUrl
-    access_token: str
\ No newline at end of file
+    # file:// urls point at local (bare) repositories, e.g. a mounted drive
+    url: Union[HttpUrl, FileUrl]
+    access_token: Optional[str] = None
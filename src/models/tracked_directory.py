@@ -1,23 +1,67 @@
 import os
+from enum import Enum
 from pydantic import BaseModel, DirectoryPath, field_validator
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from pathlib import Path
+from src.constraints import (
+    DEFAULT_RETENTION_KEEP_ALL_HOURS,
+    DEFAULT_RETENTION_HOURLY_HOURS,
+    DEFAULT_RETENTION_DAILY_DAYS,
+    DEFAULT_RETENTION_WEEKLY_WEEKS,
+    DEFAULT_RETENTION_MONTHLY_MONTHS,
+)
 from src.logger import LoggerFactory
 
 
 logger = LoggerFactory.getLogger(__name__)
 
 
+class StorageMode(Enum):
+    PLAIN = "plain"
+    CHUNKED = "chunked"
+
+
+class WatchMode(Enum):
+    NATIVE = "native"
+    POLLING = "polling"
+
+
+class RetentionPolicy(BaseModel):
+    """
+    Which snapshots of a directory to keep. Every snapshot of the last
+    keep_all_hours is kept, older ones thin out to the newest snapshot of
+    each hour, day, week and month within the respective window. A window
+    of 0 disables that tier, the newest snapshot is always kept.
+    """
+
+    keep_all_hours: int = DEFAULT_RETENTION_KEEP_ALL_HOURS
+    hourly_hours: int = DEFAULT_RETENTION_HOURLY_HOURS
+    daily_days: int = DEFAULT_RETENTION_DAILY_DAYS
+    weekly_weeks: int = DEFAULT_RETENTION_WEEKLY_WEEKS
+    monthly_months: int = DEFAULT_RETENTION_MONTHLY_MONTHS
+
+
 class TrackedDirectory(BaseModel):
     name: str
     path: DirectoryPath
     last_save_time: Optional[datetime] = None
+    storage_mode: StorageMode = StorageMode.PLAIN
+    chunk_threshold_bytes: Optional[int] = None
+    include: List[str] = []
+    # None falls back to the default exclude patterns from the settings
+    exclude: Optional[List[str]] = None
+    max_file_size_bytes: Optional[int] = None
+    watch_mode: WatchMode = WatchMode.NATIVE
+    # None falls back to save_cooldown_sec from the settings
+    save_cooldown_sec: Optional[int] = None
+    # None keeps every snapshot
+    retention: Optional[RetentionPolicy] = None
 
-    @field_validator("last_save_time_str", mode="after")
+    @field_validator("last_save_time", mode="after")
     @classmethod
     def verify_timezone(cls, value: datetime) -> Optional[datetime]:
-        if value.tzinfo is None:
+        if value is not None and value.tzinfo is None:
             logger.warning(
                 "Got a last_save_time without a timezone, \
                     setting value to None"
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import GetCoreSchemaHandler
+from pydantic_core import core_schema
 from typing import Any
 import re
 
@@ -74,10 +75,18 @@ class Version:
             return self.version_tuple >= other_version.version_tuple
         return NotImplemented
 
-    # Allow Pydantic to validate and parse this type
+    def __hash__(self) -> int:
+        return hash(self.version_tuple)
+
+    # Allow Pydantic to validate, parse and serialize this type
     @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+    def __get_pydantic_core_schema__(
+        cls, source_type: Any, handler: GetCoreSchemaHandler
+    ) -> core_schema.CoreSchema:
+        return core_schema.no_info_plain_validator_function(
+            cls.validate,
+            serialization=core_schema.to_string_ser_schema(),
+        )
 
     @classmethod
     def validate(cls, v):
@@ -1,36 +1,172 @@
-from pydantic import Field, model_validator, DirectoryPath
+from typing import List, Optional
+from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings
 from src.constraints import (
     DEFAULT_LOG_LEVEL,
+    DEFAULT_EVENT_LOG_INTERVAL_SEC,
     DEFAULT_LIMIT_SAVE_INTERVALS,
     DEFAULT_SAVE_COOLDOWN_SEC,
     DEFAULT_MASTER_BRANCH,
     METADATA_STORAGE_FILEPATH,
-    DAEMON_PORT_RANGE_MIN,
-    DAEMON_PORT_RANGE_MAX,
+    MANIFEST_DIRECTORY,
+    DEFAULT_JOURNAL_COMPACT_RECORDS,
+    DAEMON_SOCKET_FILEPATH,
+    DAEMON_DISCOVERY_FILEPATH,
+    DEFAULT_DAEMON_UNIX_SOCKET,
+    DEFAULT_DAEMON_REQUEST_TIMEOUT_SEC,
+    DEFAULT_EVENT_QUEUE_MAX_PATHS,
+    DEFAULT_EVENT_DEBOUNCE_SEC,
+    DEFAULT_SETTLE_SAVES,
+    DEFAULT_SETTLE_GRACE_SEC,
+    DEFAULT_SNAPSHOT_WORKERS,
+    DEFAULT_SNAPSHOT_QUEUE_MAX,
+    DEFAULT_SNAPSHOT_RETRY_SEC,
+    DEFAULT_GIT_AUTHOR_NAME,
+    DEFAULT_GIT_AUTHOR_EMAIL,
+    DEFAULT_GIT_PERSISTENT_BACKEND,
+    DEFAULT_CHUNK_THRESHOLD_BYTES,
+    DEFAULT_CHUNK_MIN_BYTES,
+    DEFAULT_CHUNK_AVG_BYTES,
+    DEFAULT_CHUNK_MAX_BYTES,
+    DEFAULT_CHUNK_FIXED_ABOVE_BYTES,
+    DEFAULT_STREAM_BUFFER_BYTES,
+    DEFAULT_STREAM_THRESHOLD_BYTES,
+    DEFAULT_MAX_LARGE_INGESTS,
+    DEFAULT_SHARED_OBSERVER,
+    DEFAULT_OBSERVER_POOL_SIZE,
+    DEFAULT_RECONCILE_ON_START,
+    DEFAULT_RECONCILE_WORKERS,
+    DEFAULT_EXCLUDE_PATTERNS,
+    DEFAULT_POLL_MIN_INTERVAL_SEC,
+    DEFAULT_POLL_MAX_INTERVAL_SEC,
+    DEFAULT_POLL_BACKOFF,
+    DEFAULT_METRICS_TEXTFILE_INTERVAL_SEC,
+    DEFAULT_RESTORE_WORKERS,
+    DEFAULT_RESTORE_STAGED,
+    DEFAULT_MAINTENANCE_ENABLED,
+    DEFAULT_MAINTENANCE_INTERVAL_SEC,
+    DEFAULT_MAINTENANCE_IDLE_SEC,
+    PUSH_OUTBOX_FILEPATH,
+    DEFAULT_PUSH_ENABLED,
+    DEFAULT_PUSH_BATCH_DELAY_SEC,
+    DEFAULT_PUSH_WORKERS,
+    DEFAULT_PUSH_REMOTE_CONCURRENCY,
+    DEFAULT_PUSH_RETRY_MIN_SEC,
+    DEFAULT_PUSH_RETRY_MAX_SEC,
+    DEFAULT_SYNC_STAGED,
+    DEFAULT_SYNC_DEEPEN,
+    DEFAULT_HISTORY_PAGE_SIZE,
 )
 
 
 class DaemonSettings(BaseSettings):
-    port_range_min: int = DAEMON_PORT_RANGE_MIN
-    port_range_max: int = DAEMON_PORT_RANGE_MAX
+    socket_filepath: str = DAEMON_SOCKET_FILEPATH
+    discovery_filepath: str = DAEMON_DISCOVERY_FILEPATH
+    unix_socket: bool = DEFAULT_DAEMON_UNIX_SOCKET
+    request_timeout_sec: float = DEFAULT_DAEMON_REQUEST_TIMEOUT_SEC
 
 
 class SaveStateSettings(BaseSettings):
     limit_save_intervals: bool = DEFAULT_LIMIT_SAVE_INTERVALS
     save_cooldown_sec: int = DEFAULT_SAVE_COOLDOWN_SEC
+    event_queue_max_paths: int = DEFAULT_EVENT_QUEUE_MAX_PATHS
+    event_debounce_sec: float = DEFAULT_EVENT_DEBOUNCE_SEC
+    settle_saves: bool = DEFAULT_SETTLE_SAVES
+    settle_grace_sec: float = DEFAULT_SETTLE_GRACE_SEC
+    snapshot_workers: int = DEFAULT_SNAPSHOT_WORKERS
+    snapshot_queue_max: int = DEFAULT_SNAPSHOT_QUEUE_MAX
+    snapshot_retry_sec: float = DEFAULT_SNAPSHOT_RETRY_SEC
+
+
+class StorageSettings(BaseSettings):
+    chunk_threshold_bytes: int = DEFAULT_CHUNK_THRESHOLD_BYTES
+    chunk_min_bytes: int = DEFAULT_CHUNK_MIN_BYTES
+    chunk_avg_bytes: int = DEFAULT_CHUNK_AVG_BYTES
+    chunk_max_bytes: int = DEFAULT_CHUNK_MAX_BYTES
+    # Larger files are split at fixed offsets, the content-defined
+    # boundary search would take minutes on them
+    chunk_fixed_above_bytes: Optional[int] = DEFAULT_CHUNK_FIXED_ABOVE_BYTES
+    # Files are read through a buffer of this size, never whole
+    stream_buffer_bytes: int = DEFAULT_STREAM_BUFFER_BYTES
+    # Files of at least this size are hashed while being stored
+    stream_threshold_bytes: int = DEFAULT_STREAM_THRESHOLD_BYTES
+    max_large_ingests: int = DEFAULT_MAX_LARGE_INGESTS
+    # Bare repository holding the objects of every tracked directory once
+    shared_object_store: Optional[str] = None
+
+
+class WatcherSettings(BaseSettings):
+    shared_observer: bool = DEFAULT_SHARED_OBSERVER
+    # Observers to spread watches over where inotify is not available
+    observer_pool_size: int = DEFAULT_OBSERVER_POOL_SIZE
+    reconcile_on_start: bool = DEFAULT_RECONCILE_ON_START
+    reconcile_workers: int = DEFAULT_RECONCILE_WORKERS
+    default_exclude: List[str] = DEFAULT_EXCLUDE_PATTERNS
+    poll_min_interval_sec: float = DEFAULT_POLL_MIN_INTERVAL_SEC
+    poll_max_interval_sec: float = DEFAULT_POLL_MAX_INTERVAL_SEC
+    poll_backoff: float = DEFAULT_POLL_BACKOFF
+
+
+class RestoreSettings(BaseSettings):
+    workers: int = DEFAULT_RESTORE_WORKERS
+    staged: bool = DEFAULT_RESTORE_STAGED
+
+
+class MaintenanceSettings(BaseSettings):
+    enabled: bool = DEFAULT_MAINTENANCE_ENABLED
+    interval_sec: float = DEFAULT_MAINTENANCE_INTERVAL_SEC
+    idle_sec: float = DEFAULT_MAINTENANCE_IDLE_SEC
+
+
+class PushSettings(BaseSettings):
+    # Every settings class reads unprefixed environment variables, ENABLED
+    # and WORKERS belong to the maintenance and restore settings
+    push_enabled: bool = DEFAULT_PUSH_ENABLED
+    outbox_filepath: str = PUSH_OUTBOX_FILEPATH
+    # Snapshots made within this window after the first go out in one push
+    batch_delay_sec: float = DEFAULT_PUSH_BATCH_DELAY_SEC
+    push_workers: int = DEFAULT_PUSH_WORKERS
+    remote_concurrency: int = DEFAULT_PUSH_REMOTE_CONCURRENCY
+    retry_min_sec: float = DEFAULT_PUSH_RETRY_MIN_SEC
+    retry_max_sec: float = DEFAULT_PUSH_RETRY_MAX_SEC
+
+
+class SyncSettings(BaseSettings):
+    # Commits fetched by the first sync of a directory, None for all
+    depth: Optional[int] = None
+    # Commits fetched at a time while a shallow history hides how the
+    # local and remote heads relate
+    deepen: int = DEFAULT_SYNC_DEEPEN
+    # STAGED belongs to the restore settings
+    sync_staged: bool = DEFAULT_SYNC_STAGED
+
+
+class HistorySettings(BaseSettings):
+    # Snapshots per history page when a request does not ask for a size
+    page_size: int = DEFAULT_HISTORY_PAGE_SIZE
 
 
 class MetadataSettings(BaseSettings):
-    storage_filepath: DirectoryPath = METADATA_STORAGE_FILEPATH
+    storage_filepath: str = METADATA_STORAGE_FILEPATH
+    manifest_directory: str = MANIFEST_DIRECTORY
+    journal_compact_records: int = DEFAULT_JOURNAL_COMPACT_RECORDS
 
 
 class GitSettings(BaseSettings):
     master_branch: str = DEFAULT_MASTER_BRANCH
+    author_name: str = DEFAULT_GIT_AUTHOR_NAME
+    author_email: str = DEFAULT_GIT_AUTHOR_EMAIL
+    persistent_backend: bool = DEFAULT_GIT_PERSISTENT_BACKEND
+
+
+class MetricsSettings(BaseSettings):
+    textfile_path: Optional[str] = None
+    textfile_interval_sec: float = DEFAULT_METRICS_TEXTFILE_INTERVAL_SEC
 
 
 class LoggingSettings(BaseSettings):
     log_level: str = Field(DEFAULT_LOG_LEVEL, env="LOG_LEVEL")
+    event_log_interval_sec: float = DEFAULT_EVENT_LOG_INTERVAL_SEC
 
     @model_validator(mode="after")
     def validate_log_level(self):
@@ -55,8 +191,16 @@ class LoggingSettings(BaseSettings):
 class Settings(BaseSettings):
     daemon: DaemonSettings = DaemonSettings()
     save_state: SaveStateSettings = SaveStateSettings()
+    watcher: WatcherSettings = WatcherSettings()
+    storage: StorageSettings = StorageSettings()
+    restore: RestoreSettings = RestoreSettings()
+    maintenance: MaintenanceSettings = MaintenanceSettings()
+    push: PushSettings = PushSettings()
+    sync: SyncSettings = SyncSettings()
+    history: HistorySettings = HistorySettings()
     metadata: MetadataSettings = MetadataSettings()
     git: GitSettings = GitSettings()
+    metrics: MetricsSettings = MetricsSettings()
     logging: LoggingSettings = LoggingSettings()
 
 
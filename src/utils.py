@@ -1,16 +1,30 @@
-import socket
-from src.exceptions import AvailablePortNotFoundError
+import os
+import tempfile
 
 
-def find_port(port: int, max_port: int = 49151) -> int:
-    """Find a port not in ues starting at given port"""
-    if port > max_port:
-        raise AvailablePortNotFoundError(
-            f"Failed to found an available port lesser than \
-                or equal to {max_port}"
-        )
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        if s.connect_ex(("localhost", port)) == 0:
-            return find_port(port=port + 1)
-        else:
-            return port
+def atomic_write(path: str, data: bytes) -> None:
+    """Replace a file so readers see either the old or the new content"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    fsync_directory(directory)
+
+
+def fsync_directory(path: str) -> None:
+    """Persist a rename/creation inside a directory where supported"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
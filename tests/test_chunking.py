@@ -0,0 +1,46 @@
+import random
+from src.core.chunking import ChunkedFile, chunk_boundaries
+
+MIN, AVG, MAX = 1024, 4096, 16384
+
+
+def _data(size: int, seed: int = 1) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def _chunks(data: bytes):
+    return [
+        data[offset : offset + length]
+        for offset, length in chunk_boundaries(data, MIN, AVG, MAX)
+    ]
+
+
+def test_chunks_cover_the_data_within_bounds():
+    data = _data(512 * 1024)
+    chunks = _chunks(data)
+    assert b"".join(chunks) == data
+    assert all(MIN < len(chunk) <= MAX for chunk in chunks[:-1])
+    average = len(data) / len(chunks)
+    assert AVG / 2 < average < AVG * 2
+
+
+def test_boundaries_survive_an_insertion():
+    data = _data(512 * 1024)
+    edited = data[:1000] + b"inserted" + data[1000:]
+    before, after = set(_chunks(data)), set(_chunks(edited))
+    assert len(before - after) <= 2
+
+
+def test_cuts_do_not_need_an_anchor_sequence():
+    data = _data(256 * 1024, seed=2).replace(b"\x8f\x5c", b"\x00\x00")
+    assert any(len(chunk) < MAX for chunk in _chunks(data)[:-1])
+
+
+def test_files_above_the_cap_are_cut_at_fixed_offsets(tmp_path):
+    path = tmp_path / "world.dat"
+    data = _data(10 * AVG + 100)
+    path.write_bytes(data)
+    with ChunkedFile(str(path), MIN, AVG, MAX, fixed_above=8 * AVG) as file:
+        chunks = list(file.chunks())
+    assert b"".join(chunks) == data
+    assert [len(chunk) for chunk in chunks] == [AVG] * 10 + [100]
@@ -0,0 +1,67 @@
+import os
+import pytest
+from src.core.event_queue import ChangeKind, ChangeSet, EventQueue
+
+CREATED, MODIFIED, DELETED = (
+    ChangeKind.CREATED,
+    ChangeKind.MODIFIED,
+    ChangeKind.DELETED,
+)
+
+
+@pytest.mark.parametrize(
+    "first, second, net",
+    [
+        (CREATED, MODIFIED, CREATED),
+        (CREATED, DELETED, None),
+        (MODIFIED, CREATED, MODIFIED),
+        (MODIFIED, DELETED, DELETED),
+        (DELETED, CREATED, MODIFIED),
+        (DELETED, MODIFIED, MODIFIED),
+        (DELETED, DELETED, DELETED),
+    ],
+)
+def test_changes_to_one_path_are_merged(tmp_path, first, second, net):
+    queue = EventQueue(str(tmp_path), max_paths=10)
+    queue.push(str(tmp_path / "slot1.sav"), first)
+    queue.push(str(tmp_path / "slot1.sav"), second)
+    changes = queue.drain()
+    assert changes.changes == ({} if net is None else {"slot1.sav": net})
+    assert changes.event_count == 2
+
+
+def test_paths_outside_the_directory_are_not_queued(tmp_path):
+    queue = EventQueue(str(tmp_path / "game"), max_paths=10)
+    assert not queue.push(str(tmp_path / "other"), MODIFIED)
+    assert not queue.push(str(tmp_path / "game" / ".git" / "index"), MODIFIED)
+    assert not queue
+
+
+def test_too_many_paths_degrade_to_a_full_rescan(tmp_path):
+    queue = EventQueue(str(tmp_path), max_paths=2)
+    for name in ("a", "b", "c"):
+        queue.push(str(tmp_path / name), MODIFIED)
+    assert queue.full_rescan
+    assert len(queue) == 0
+    assert queue.drain().full_rescan
+
+
+def test_restored_changes_are_older_than_queued_ones(tmp_path):
+    queue = EventQueue(str(tmp_path), max_paths=10)
+    queue.push(str(tmp_path / "slot1.sav"), CREATED)
+    queue.push(str(tmp_path / "slot2.sav"), MODIFIED)
+    failed = queue.drain()
+
+    queue.push(str(tmp_path / "slot1.sav"), DELETED)
+    queue.restore(failed)
+    changes = queue.drain()
+    assert changes.changes == {"slot2.sav": MODIFIED}
+    assert changes.event_count == 3
+
+
+def test_merging_a_full_rescan_drops_the_paths():
+    older = ChangeSet({os.path.join("a", "b"): MODIFIED}, event_count=1)
+    older.merge(ChangeSet(full_rescan=True, event_count=1))
+    assert older.full_rescan
+    assert older.changes == {}
+    assert older.event_count == 2
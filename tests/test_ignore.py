@@ -0,0 +1,24 @@
+from src.core.ignore import IgnoreRules
+
+
+def test_last_matching_exclude_decides():
+    rules = IgnoreRules(exclude=["!keep.log", "*.log"])
+    assert rules.excludes("keep.log")
+
+    rules = IgnoreRules(exclude=["*.log", "!keep.log"])
+    assert not rules.excludes("keep.log")
+    assert not rules.excludes("logs/keep.log")
+    assert rules.excludes("debug.log")
+
+
+def test_nothing_below_an_excluded_directory_is_reincluded():
+    rules = IgnoreRules(exclude=["logs/", "!keep.txt", "!logs/keep.txt"])
+    assert rules.excludes("logs", is_dir=True)
+    assert rules.excludes("logs/keep.txt")
+    assert not rules.excludes("keep.txt")
+
+
+def test_reincluded_directory_does_not_reinclude_its_files():
+    rules = IgnoreRules(exclude=["*.tmp", "!cache/"])
+    assert not rules.excludes("cache", is_dir=True)
+    assert rules.excludes("cache/shader.tmp")
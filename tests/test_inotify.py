@@ -0,0 +1,130 @@
+import os
+import queue
+import threading
+import pytest
+from src.core.inotify import InotifyWatcher, inotify_available
+from src.core.observer_pool import ObserverPool
+from src.models.tracked_directory import TrackedDirectory
+
+
+pytestmark = pytest.mark.skipif(
+    not inotify_available(), reason="inotify is Linux only"
+)
+
+
+class _Recorder:
+    def __init__(self, path):
+        self.tracked_directory = TrackedDirectory(
+            name=os.path.basename(path), path=str(path)
+        )
+        self.events = queue.Queue()
+
+    def dispatch(self, event):
+        self.events.put(event)
+
+    def wait_for(self, event_type, path, timeout=5):
+        seen = []
+        while True:
+            try:
+                event = self.events.get(timeout=timeout)
+            except queue.Empty:
+                raise AssertionError(f"No {event_type} {path} in {seen}")
+            seen.append(event)
+            if event.event_type == event_type and (
+                event.src_path == str(path) or event.dest_path == str(path)
+            ):
+                return event
+
+
+@pytest.fixture
+def watcher():
+    events = _Recorder("/")
+    watcher = InotifyWatcher(events.dispatch, lambda: None)
+    watcher.start()
+    yield watcher, events
+    watcher.stop()
+    watcher.join()
+
+
+def test_reports_changes_below_every_root(tmp_path, watcher):
+    watcher, events = watcher
+    for name in ("a", "b"):
+        (tmp_path / name / "saves").mkdir(parents=True)
+        watcher.add_root(str(tmp_path / name))
+
+    save = tmp_path / "b" / "saves" / "slot1"
+    save.write_bytes(b"data")
+    events.wait_for("created", save)
+    events.wait_for("closed", save)
+    save.unlink()
+    events.wait_for("deleted", save)
+
+
+def test_follows_new_and_renamed_directories(tmp_path, watcher):
+    watcher, events = watcher
+    watcher.add_root(str(tmp_path))
+
+    (tmp_path / "new").mkdir()
+    events.wait_for("created", tmp_path / "new")
+    (tmp_path / "new").rename(tmp_path / "renamed")
+    moved = events.wait_for("moved", tmp_path / "renamed")
+    assert moved.src_path == str(tmp_path / "new")
+
+    save = tmp_path / "renamed" / "slot1"
+    save.write_bytes(b"data")
+    events.wait_for("closed", save)
+
+
+def test_unpaired_move_is_a_deletion(tmp_path, watcher):
+    watcher, events = watcher
+    (tmp_path / "watched").mkdir()
+    save = tmp_path / "watched" / "slot1"
+    save.write_bytes(b"data")
+    watcher.add_root(str(tmp_path / "watched"))
+
+    save.rename(tmp_path / "elsewhere")
+    events.wait_for("deleted", save)
+
+
+def test_removed_root_is_no_longer_watched(tmp_path, watcher):
+    watcher, events = watcher
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        watcher.add_root(str(tmp_path / name))
+    watcher.remove_root(str(tmp_path / "a"))
+    assert watcher.watch_count == 1
+
+    (tmp_path / "a" / "ignored").write_bytes(b"")
+    (tmp_path / "b" / "seen").write_bytes(b"")
+    event = events.wait_for("created", tmp_path / "b" / "seen")
+    assert "ignored" not in event.src_path
+
+
+def _cost(tmp_path, count):
+    pool = ObserverPool(native=True)
+    pool.start()
+    try:
+        for index in range(count):
+            path = tmp_path / f"{count}-{index}"
+            path.mkdir()
+            pool.add(_Recorder(path))
+        return threading.active_count(), len(os.listdir("/proc/self/fd"))
+    finally:
+        pool.stop()
+
+
+def test_native_pool_cost_does_not_grow_with_directories(tmp_path):
+    assert _cost(tmp_path, 1) == _cost(tmp_path, 50)
+
+
+def test_move_out_is_reported_before_a_recreate(tmp_path, watcher):
+    watcher, events = watcher
+    (tmp_path / "watched").mkdir()
+    save = tmp_path / "watched" / "slot1"
+    save.write_bytes(b"old")
+    watcher.add_root(str(tmp_path / "watched"))
+
+    save.rename(tmp_path / "elsewhere")
+    save.write_bytes(b"new")
+    events.wait_for("deleted", save)
+    events.wait_for("created", save)
@@ -0,0 +1,73 @@
+import json
+from src.models.journal import MetadataJournal, replay
+
+
+def test_torn_tail_is_cut_before_appending(tmp_path):
+    path = str(tmp_path / "metadata.json.journal")
+    journal = MetadataJournal(path)
+    journal.append("delete_remote", url="file:///a.git")
+    # A crash in the middle of the next write
+    with open(path, "ab") as file:
+        file.write(b'{"op":"delete_rem')
+
+    journal = MetadataJournal(path)
+    assert len(journal) == 1
+    journal.append("delete_remote", url="file:///b.git")
+
+    records = MetadataJournal.read(path)
+    assert [record["url"] for record in records] == [
+        "file:///a.git",
+        "file:///b.git",
+    ]
+    with open(path, "rb") as file:
+        lines = file.read().splitlines()
+    assert all(json.loads(line) for line in lines)
+
+
+def test_unreadable_record_and_later_ones_are_dropped(tmp_path):
+    path = tmp_path / "metadata.json.journal"
+    path.write_bytes(
+        b'{"op":"delete_remote","url":"a"}\n'
+        b"garbage\n"
+        b'{"op":"delete_remote","url":"b"}\n'
+    )
+    journal = MetadataJournal(str(path))
+    assert len(journal) == 1
+    assert path.read_bytes() == b'{"op":"delete_remote","url":"a"}\n'
+
+
+def test_record_without_newline_is_not_replayed(tmp_path):
+    path = tmp_path / "metadata.json.journal"
+    path.write_bytes(b'{"op":"delete_remote","url":"a"}')
+    assert MetadataJournal.read(str(path)) == []
+    assert len(MetadataJournal(str(path))) == 0
+    assert path.read_bytes() == b""
+
+
+def test_replay_over_a_snapshot_that_holds_the_records():
+    remote = {"url": "file:///tmp/x.git", "access_token": None}
+    directory = {"name": "game", "path": "/saves/game"}
+    records = [
+        {"op": "add_directory", "directory": directory},
+        {"op": "add_remote", "remote": remote},
+        {"op": "save_time", "path": "/saves/game", "time": "2024-01-01"},
+    ]
+    data = {"directories": [dict(directory)], "remotes": [dict(remote)]}
+    replay(data, records)
+    assert data["remotes"] == [remote]
+    assert data["directories"] == [
+        dict(directory, last_save_time="2024-01-01")
+    ]
+
+
+def test_replay_deletes_and_re_adds():
+    data = {"directories": [], "remotes": []}
+    replay(
+        data,
+        [
+            {"op": "add_remote", "remote": {"url": "a"}},
+            {"op": "delete_remote", "url": "a"},
+            {"op": "add_remote", "remote": {"url": "a", "access_token": "t"}},
+        ],
+    )
+    assert data["remotes"] == [{"url": "a", "access_token": "t"}]
@@ -0,0 +1,102 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from src.core.maintenance import MaintenanceScheduler, select_snapshots
+from src.exceptions import GitBackendError
+from src.models.tracked_directory import RetentionPolicy
+
+
+NOW = datetime(2024, 6, 15, 12, 0, tzinfo=timezone.utc)
+
+
+def _hourly(hours: int):
+    """One snapshot every 10 minutes going back, newest first"""
+    return [
+        (f"c{index}", NOW - timedelta(minutes=10 * index))
+        for index in range(hours * 6)
+    ]
+
+
+def test_keeps_everything_inside_keep_all_window():
+    snapshots = _hourly(2)
+    policy = RetentionPolicy(
+        keep_all_hours=3,
+        hourly_hours=0,
+        daily_days=0,
+        weekly_weeks=0,
+        monthly_months=0,
+    )
+    assert select_snapshots(policy, snapshots, NOW) == {
+        oid for oid, _ in snapshots
+    }
+
+
+def test_thins_older_snapshots_to_newest_per_hour():
+    snapshots = _hourly(6)
+    policy = RetentionPolicy(
+        keep_all_hours=1,
+        hourly_hours=24,
+        daily_days=0,
+        weekly_weeks=0,
+        monthly_months=0,
+    )
+    kept = select_snapshots(policy, snapshots, NOW)
+    since = NOW - timedelta(hours=1)
+    recent = {oid for oid, when in snapshots if when >= since}
+    older = [(oid, when) for oid, when in snapshots if oid not in recent]
+    hours = {when.replace(minute=0) for _, when in older}
+    assert recent <= kept
+    # Newest snapshot of each older hour, nothing else
+    assert len(kept - recent) == len(hours)
+    for oid in kept - recent:
+        when = dict(snapshots)[oid]
+        assert all(
+            other <= when
+            for _, other in older
+            if other.replace(minute=0) == when.replace(minute=0)
+        )
+
+
+def test_newest_snapshot_is_always_kept():
+    snapshots = [("old", NOW - timedelta(days=400))]
+    policy = RetentionPolicy(
+        keep_all_hours=0,
+        hourly_hours=0,
+        daily_days=0,
+        weekly_weeks=0,
+        monthly_months=0,
+    )
+    assert select_snapshots(policy, snapshots, NOW) == {"old"}
+
+
+def test_drops_snapshots_outside_every_window():
+    snapshots = [
+        ("new", NOW - timedelta(hours=1)),
+        ("day", NOW - timedelta(days=3)),
+        ("ancient", NOW - timedelta(days=400)),
+    ]
+    policy = RetentionPolicy(
+        keep_all_hours=0,
+        hourly_hours=0,
+        daily_days=7,
+        weekly_weeks=0,
+        monthly_months=0,
+    )
+    assert select_snapshots(policy, snapshots, NOW) == {"new", "day"}
+
+
+def test_scheduler_survives_failing_pass():
+    calls = []
+    second = threading.Event()
+
+    def task() -> None:
+        calls.append(len(calls))
+        if len(calls) == 1:
+            raise GitBackendError("broken repository")
+        second.set()
+
+    scheduler = MaintenanceScheduler(interval=0.01, task=task)
+    scheduler.start()
+    try:
+        assert second.wait(5)
+    finally:
+        scheduler.stop()
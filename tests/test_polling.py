@@ -0,0 +1,24 @@
+import os
+from src.core.polling import PollingEngine
+from src.models.tracked_directory import TrackedDirectory
+
+
+class _Handler:
+    def __init__(self, path):
+        self.tracked_directory = TrackedDirectory(
+            name=os.path.basename(path), path=str(path)
+        )
+
+
+def test_readded_directory_is_polled_once(tmp_path):
+    engine = PollingEngine(min_interval=0, max_interval=1, backoff=2)
+    handler = _Handler(tmp_path)
+    engine.add(handler)
+    engine.remove(tmp_path)
+    engine.add(handler)
+    # _next only runs while the engine is started
+    engine._running = True
+
+    directory = engine._next()
+    assert directory is not None and directory.root == str(tmp_path)
+    assert engine._due == []
@@ -0,0 +1,119 @@
+import subprocess
+import threading
+import time
+import pytest
+from src.core import push
+from src.core.push import PushScheduler
+from src.models.remote import GitRemote
+from src.models.tracked_directory import TrackedDirectory
+
+URL = "file:///srv/saves.git"
+
+
+@pytest.fixture
+def pushes(tmp_path, monkeypatch):
+    attempts = []
+    finished = threading.Semaphore(0)
+    outcomes = []
+
+    def push_branch(path, url, branch, **options):
+        attempts.append(time.monotonic())
+        try:
+            outcome = outcomes.pop(0) if outcomes else None
+            if isinstance(outcome, threading.Event):
+                # Held until the test lets the push finish
+                outcome.wait(5)
+            elif outcome == "fail":
+                raise subprocess.CalledProcessError(
+                    1, "git push", stderr=b"remote unreachable"
+                )
+        finally:
+            finished.release()
+
+    monkeypatch.setattr(push, "push_branch", push_branch)
+
+    def scheduler() -> PushScheduler:
+        return PushScheduler(
+            remotes=lambda: [GitRemote(url=URL)],
+            outbox_path=str(tmp_path / "outbox.json"),
+            branch="master",
+            batch_delay=60,
+            workers=1,
+            remote_concurrency=1,
+            retry_min=10,
+            retry_max=25,
+        )
+
+    def wait_for_push(pusher: PushScheduler):
+        assert finished.acquire(timeout=5)
+        # The entry is updated right after the push returns
+        deadline = time.monotonic() + 5
+        while any(entry.pushing for entry in pusher._pending.values()):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+    directory = TrackedDirectory(name="game", path=str(tmp_path))
+    return scheduler, directory, outcomes, attempts, wait_for_push
+
+
+def test_failed_pushes_back_off_exponentially(pushes):
+    scheduler, directory, outcomes, attempts, wait_for_push = pushes
+    outcomes.extend(["fail"] * 3)
+    pusher = scheduler()
+    pusher.start()
+    try:
+        pusher.enqueue(directory)
+        (entry,) = pusher._pending.values()
+        delays = []
+        for attempt in range(1, 4):
+            entry.due = time.monotonic()
+            pusher._round(URL)
+            wait_for_push(pusher)
+            assert entry.attempts == attempt
+            delays.append(round(entry.due - attempts[-1]))
+        # retry_min doubling per attempt, capped at retry_max
+        assert delays == [10, 20, 25]
+
+        # Still backing off, a round leaves it alone
+        assert pusher._round(URL) == 0
+        assert len(attempts) == 3
+    finally:
+        pusher.stop()
+
+
+def test_outbox_survives_a_restart_until_pushed(pushes, tmp_path):
+    scheduler, directory, _, attempts, wait_for_push = pushes
+    pusher = scheduler()
+    pusher.enqueue(directory)
+    assert (tmp_path / "outbox.json").exists()
+
+    restarted = scheduler()
+    assert len(restarted) == 1
+    restarted.start()
+    try:
+        assert restarted.flush() == 1
+        wait_for_push(restarted)
+    finally:
+        restarted.stop()
+    assert len(attempts) == 1
+    assert len(restarted) == 0
+    assert len(scheduler()) == 0
+
+
+def test_snapshot_during_a_push_stays_pending(pushes):
+    scheduler, directory, outcomes, attempts, wait_for_push = pushes
+    release = threading.Event()
+    outcomes.append(release)
+    pusher = scheduler()
+    pusher.start()
+    try:
+        pusher.enqueue(directory)
+        assert pusher.flush() == 1
+        # A snapshot taken while the push runs is not covered by it
+        pusher.enqueue(directory)
+        release.set()
+        wait_for_push(pusher)
+    finally:
+        pusher.stop()
+    assert len(attempts) == 1
+    assert len(pusher) == 1
@@ -0,0 +1,108 @@
+import errno
+import os
+import pytest
+from src.core import restore
+from src.core.event_queue import ChangeSet
+from src.core.manifest import FileManifest
+from src.core.restore import DirectoryRestore
+from src.core.snapshot import SnapshotJob, chunking_policy, take_snapshot
+from src.git_backend import GitBackend
+from src.models.tracked_directory import StorageMode, TrackedDirectory
+from src.settings import settings
+
+
+@pytest.fixture
+def saved(tmp_path):
+    root = tmp_path / "game"
+    root.mkdir()
+    (root / "slot1.sav").write_bytes(b"first")
+    (root / "options.ini").write_bytes(b"volume=3")
+    directory = TrackedDirectory(name="game", path=str(root))
+    manifest = FileManifest(str(tmp_path / "state" / "manifest.db"))
+    backend = GitBackend.for_repository(str(root))
+    take_snapshot(
+        SnapshotJob(directory, ChangeSet(full_rescan=True)),
+        manifest=manifest,
+        backend=backend,
+    )
+    commit = backend.resolve(f"refs/heads/{settings.git.master_branch}")
+
+    (root / "slot1.sav").write_bytes(b"second")
+    (root / "slot2.sav").write_bytes(b"new")
+    yield root, backend, manifest, commit
+    manifest.close()
+    GitBackend.close_repository(str(root))
+
+
+def _assert_restored(root):
+    assert (root / "slot1.sav").read_bytes() == b"first"
+    assert (root / "options.ini").read_bytes() == b"volume=3"
+    assert not (root / "slot2.sav").exists()
+    assert (root / ".git").is_dir()
+    assert sorted(os.listdir(root.parent)) == ["game", "state"]
+
+
+def test_restore_swaps_in_a_staged_tree(saved):
+    root, backend, manifest, commit = saved
+    result = DirectoryRestore(str(root), backend, manifest).run(commit)
+    assert result.swapped
+    assert (result.written, result.removed) == (1, 1)
+    _assert_restored(root)
+
+
+def test_restore_falls_back_when_the_root_cannot_be_renamed(
+    saved, monkeypatch
+):
+    root, backend, manifest, commit = saved
+    rename = os.rename
+
+    def busy_root(source, destination):
+        if source == str(root):
+            raise OSError(errno.EBUSY, "Device or resource busy", source)
+        rename(source, destination)
+
+    monkeypatch.setattr(restore.os, "rename", busy_root)
+    result = DirectoryRestore(str(root), backend, manifest).run(commit)
+    assert not result.swapped
+    assert (result.written, result.removed) == (1, 1)
+    _assert_restored(root)
+
+
+def test_chunked_file_is_compared_by_its_recorded_manifest(
+    tmp_path, monkeypatch
+):
+    root = tmp_path / "game"
+    root.mkdir()
+    (root / "world.dat").write_bytes(b"x" * 4096)
+    (root / "slot1.sav").write_bytes(b"first")
+    directory = TrackedDirectory(
+        name="game",
+        path=str(root),
+        storage_mode=StorageMode.CHUNKED,
+        chunk_threshold_bytes=1024,
+    )
+    manifest = FileManifest(str(tmp_path / "state" / "manifest.db"))
+    backend = GitBackend.for_repository(str(root))
+    try:
+        take_snapshot(
+            SnapshotJob(directory, ChangeSet(full_rescan=True)),
+            manifest=manifest,
+            backend=backend,
+        )
+        commit = backend.resolve(f"refs/heads/{settings.git.master_branch}")
+        assert manifest.get("world.dat").stored is not None
+        (root / "slot1.sav").write_bytes(b"second")
+
+        def rechunked(*args):
+            raise AssertionError("world.dat was chunked again")
+
+        monkeypatch.setattr(restore, "_same_chunks", rechunked)
+        chunking = chunking_policy(directory)
+        result = DirectoryRestore(
+            str(root), backend, manifest, chunking=chunking
+        ).run(commit)
+        assert (result.written, result.unchanged) == (1, 1)
+        assert (root / "slot1.sav").read_bytes() == b"first"
+    finally:
+        manifest.close()
+        GitBackend.close_repository(str(root))
@@ -0,0 +1,68 @@
+import threading
+import time
+from src.core.scheduler import SaveScheduler
+
+
+def _scheduler():
+    fired = []
+    done = threading.Event()
+
+    def dispatch(key, callback):
+        fired.append(key)
+        callback()
+
+    scheduler = SaveScheduler(dispatch=dispatch)
+    scheduler.start()
+    return scheduler, fired, done
+
+
+def test_deadlines_fire_in_order():
+    scheduler, fired, done = _scheduler()
+    try:
+        scheduler.schedule("late", 0.2, done.set)
+        scheduler.schedule("early", 0.05, lambda: None)
+        assert done.wait(5)
+    finally:
+        scheduler.stop()
+    assert fired == ["early", "late"]
+    assert len(scheduler) == 0
+
+
+def test_rescheduling_replaces_the_deadline():
+    scheduler, fired, done = _scheduler()
+    try:
+        scheduler.schedule("game", 0.05, lambda: None)
+        scheduler.schedule("game", 0.2, done.set)
+        before = time.monotonic()
+        assert done.wait(5)
+        assert time.monotonic() - before >= 0.15
+    finally:
+        scheduler.stop()
+    assert fired == ["game"]
+
+
+def test_cancelled_deadlines_do_not_fire():
+    scheduler, fired, done = _scheduler()
+    try:
+        scheduler.schedule("cancelled", 0.05, lambda: None)
+        scheduler.schedule("kept", 0.1, done.set)
+        assert scheduler.cancel("cancelled")
+        assert not scheduler.cancel("cancelled")
+        assert done.wait(5)
+    finally:
+        scheduler.stop()
+    assert fired == ["kept"]
+
+
+def test_stopping_keeps_pending_deadlines():
+    scheduler, fired, done = _scheduler()
+    scheduler.stop()
+    scheduler.schedule("game", 0, done.set)
+    assert scheduler.deadline("game") is not None
+    assert not done.wait(0.1)
+    scheduler.start()
+    try:
+        assert done.wait(5)
+    finally:
+        scheduler.stop()
+    assert fired == ["game"]
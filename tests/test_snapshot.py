@@ -0,0 +1,108 @@
+import os
+import subprocess
+import pytest
+from src.core.event_queue import ChangeSet
+from src.core.manifest import FileManifest
+from src.core.snapshot import SnapshotJob, take_snapshot
+from src.exceptions import GitBackendError
+from src.git_backend import CommitRecord, GitBackend
+from src.models.tracked_directory import StorageMode, TrackedDirectory
+from src.settings import settings
+
+
+def test_chunked_directory_is_not_staged_whole(tmp_path):
+    (tmp_path / "save.dat").write_bytes(b"x" * 4096)
+    directory = TrackedDirectory(
+        name="chunked", path=str(tmp_path), storage_mode=StorageMode.CHUNKED
+    )
+    job = SnapshotJob(directory, ChangeSet(full_rescan=True))
+
+    with pytest.raises(GitBackendError):
+        take_snapshot(job)
+
+    head = subprocess.run(
+        ["git", "rev-parse", "--verify", "-q", "HEAD"],
+        cwd=tmp_path,
+        capture_output=True,
+    )
+    assert head.returncode != 0
+
+
+@pytest.fixture
+def streamed(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings.storage, "stream_threshold_bytes", 4)
+    root = tmp_path / "game"
+    root.mkdir()
+    directory = TrackedDirectory(name="game", path=str(root))
+    manifest = FileManifest(str(tmp_path / "state" / "manifest.db"))
+    backend = GitBackend.for_repository(str(root))
+    ingested = []
+    ingest = backend.ingest
+
+    def recording_ingest(source, size):
+        ingested.append(os.path.basename(source))
+        return ingest(source, size)
+
+    monkeypatch.setattr(backend, "ingest", recording_ingest)
+
+    def save() -> bool:
+        job = SnapshotJob(directory, ChangeSet(full_rescan=True))
+        return take_snapshot(job, manifest=manifest, backend=backend)
+
+    yield root, backend, save, ingested
+    manifest.close()
+    GitBackend.close_repository(str(root))
+
+
+def test_touched_large_file_is_not_stored_again(streamed):
+    root, _, save, ingested = streamed
+    (root / "slot1.sav").write_bytes(b"first save")
+    assert save()
+    assert ingested == ["slot1.sav"]
+
+    os.utime(root / "slot1.sav", ns=(0, 0))
+    assert not save()
+    assert ingested == ["slot1.sav"]
+
+
+def test_reverted_large_file_reuses_the_stored_blob(streamed):
+    root, backend, save, ingested = streamed
+    (root / "slot1.sav").write_bytes(b"first save")
+    assert save()
+    (root / "slot1.sav").write_bytes(b"later save")
+    assert save()
+    (root / "slot1.sav").write_bytes(b"first save")
+    assert save()
+    assert ingested == ["slot1.sav", "slot1.sav"]
+
+    head = backend.resolve(f"refs/heads/{settings.git.master_branch}")
+    commit = CommitRecord(head, backend.read_object(head)[1])
+    tree = backend.read_tree(commit.tree)
+    (oid,) = [entry for _, name, entry in tree if name == "slot1.sav"]
+    assert backend.read_object(oid)[1] == b"first save"
+
+
+def test_full_rescan_without_manifest_applies_the_rules(tmp_path):
+    (tmp_path / "logs").mkdir()
+    (tmp_path / "logs" / "keep.txt").write_bytes(b"log")
+    (tmp_path / "slot1.sav").write_bytes(b"save")
+    directory = TrackedDirectory(
+        name="game", path=str(tmp_path), exclude=["logs/", "!keep.txt"]
+    )
+    assert take_snapshot(SnapshotJob(directory, ChangeSet(full_rescan=True)))
+
+    files = subprocess.run(
+        ["git", "ls-files"], cwd=tmp_path, capture_output=True, check=True
+    )
+    assert files.stdout.decode().split() == ["slot1.sav"]
+
+
+def test_save_time_is_kept_when_nothing_was_committed(tmp_path):
+    (tmp_path / "slot1.sav").write_bytes(b"save")
+    directory = TrackedDirectory(name="game", path=str(tmp_path))
+    assert take_snapshot(SnapshotJob(directory, ChangeSet(full_rescan=True)))
+    saved_at = directory.last_save_time
+
+    job = SnapshotJob(directory, ChangeSet(full_rescan=True))
+    assert not take_snapshot(job)
+    assert directory.last_save_time == saved_at
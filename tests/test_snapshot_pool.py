@@ -0,0 +1,34 @@
+import threading
+from src.core.event_queue import ChangeSet
+from src.core.snapshot import SnapshotJob
+from src.core.snapshot_pool import SnapshotPool
+from src.exceptions import MetadataError
+from src.models.tracked_directory import TrackedDirectory
+
+
+def _job(path, name) -> SnapshotJob:
+    directory = TrackedDirectory(name=name, path=str(path))
+    return SnapshotJob(directory, ChangeSet(full_rescan=True))
+
+
+def test_worker_survives_project_errors(tmp_path):
+    done = threading.Event()
+    ran = []
+
+    def run(job: SnapshotJob) -> None:
+        ran.append(job.directory.name)
+        if job.directory.name == "removed":
+            raise MetadataError("directory was removed")
+        done.set()
+
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    pool = SnapshotPool(run=run, workers=1, max_pending=4)
+    pool.start()
+    try:
+        assert pool.submit(_job(tmp_path / "a", "removed"))
+        assert pool.submit(_job(tmp_path / "b", "kept"))
+        assert done.wait(5)
+    finally:
+        pool.stop()
+    assert ran == ["removed", "kept"]
@@ -0,0 +1,161 @@
+import subprocess
+import pytest
+from src.core.event_queue import ChangeSet
+from src.core.manifest import FileManifest
+from src.core.push import remote_branch
+from src.core.snapshot import SnapshotJob, take_snapshot
+from src.core.sync import SyncState, sync_directory
+from src.git_backend import GitBackend
+from src.git_utils import (
+    ensure_git_repository,
+    push_branch,
+    shallow_commits,
+)
+from src.models.remote import GitRemote
+from src.models.tracked_directory import TrackedDirectory
+from src.settings import settings
+
+
+class _Device:
+    """One copy of the tracked directory, syncing through a bare remote"""
+
+    def __init__(self, base, name: str, remote: GitRemote):
+        self.root = base / name / "game"
+        self.root.mkdir(parents=True)
+        ensure_git_repository(
+            str(self.root), master_branch=settings.git.master_branch
+        )
+        self.directory = TrackedDirectory(name="game", path=str(self.root))
+        self.manifest = FileManifest(str(base / name / "manifest.db"))
+        self.remote = remote
+
+    def save(self, content: bytes) -> None:
+        (self.root / "slot1.sav").write_bytes(content)
+        job = SnapshotJob(self.directory, ChangeSet(full_rescan=True))
+        backend = GitBackend.for_repository(str(self.root))
+        assert take_snapshot(job, manifest=self.manifest, backend=backend)
+        # fast-import writes its branch head back when it exits
+        GitBackend.close_repository(str(self.root))
+
+    def push(self, force: bool = False) -> None:
+        push_branch(
+            str(self.root),
+            str(self.remote.url),
+            settings.git.master_branch,
+            remote_branch("game"),
+            force=force,
+        )
+
+    def sync(self, **options):
+        backend = GitBackend(str(self.root))
+        try:
+            return sync_directory(
+                self.directory,
+                self.remote,
+                backend=backend,
+                manifest=self.manifest,
+                branch=settings.git.master_branch,
+                **options,
+            )
+        finally:
+            backend.close()
+
+    def content(self) -> bytes:
+        return (self.root / "slot1.sav").read_bytes()
+
+    def close(self) -> None:
+        self.manifest.close()
+        GitBackend.close_repository(str(self.root))
+
+
+@pytest.fixture
+def devices(tmp_path):
+    bare = tmp_path / "remote.git"
+    subprocess.run(["git", "init", "-q", "--bare", str(bare)], check=True)
+    remote = GitRemote(url=bare.as_uri())
+    first = _Device(tmp_path, "first", remote)
+    second = _Device(tmp_path, "second", remote)
+    yield first, second
+    first.close()
+    second.close()
+
+
+def test_sync_fast_forwards_to_the_remote(devices):
+    first, second = devices
+    first.save(b"one")
+    first.push()
+    assert second.sync().state == SyncState.BEHIND
+    assert second.content() == b"one"
+
+    first.save(b"two")
+    first.push()
+    result = second.sync()
+    assert result.state == SyncState.BEHIND
+    assert result.applied.paths == ["slot1.sav"]
+    assert second.content() == b"two"
+    assert second.sync().state == SyncState.UP_TO_DATE
+
+
+def test_unpushed_snapshots_are_ahead(devices):
+    first, second = devices
+    first.save(b"one")
+    first.push()
+    second.sync()
+    second.save(b"local")
+    assert second.sync().state == SyncState.AHEAD
+    assert second.content() == b"local"
+
+
+def test_diverged_history_is_kept_unless_the_remote_is_preferred(devices):
+    first, second = devices
+    first.save(b"one")
+    first.push()
+    second.sync()
+    first.save(b"remote")
+    first.push()
+    second.save(b"local")
+
+    assert second.sync().state == SyncState.DIVERGED
+    assert second.content() == b"local"
+
+    result = second.sync(prefer_remote=True)
+    assert result.state == SyncState.REPLACED
+    assert result.backup is not None
+    assert second.content() == b"remote"
+
+
+def test_adopted_history_keeps_a_backup(devices):
+    first, second = devices
+    first.save(b"one")
+    first.push()
+    second.save(b"one")
+    local = GitBackend(str(second.root))
+    try:
+        previous = local.resolve(f"refs/heads/{settings.git.master_branch}")
+    finally:
+        local.close()
+
+    result = second.sync()
+    assert result.state == SyncState.ADOPTED
+    backup = subprocess.run(
+        ["git", "rev-parse", result.backup],
+        cwd=second.root,
+        capture_output=True,
+        check=True,
+    )
+    assert backup.stdout.decode().strip() == previous
+
+
+def test_shallow_history_is_deepened_before_comparing(devices):
+    first, second = devices
+    for content in (b"one", b"two", b"three"):
+        first.save(content)
+    first.push()
+    second.sync(depth=1)
+    assert shallow_commits(str(second.root))
+
+    first.save(b"remote")
+    first.push()
+    second.save(b"local")
+    assert second.sync(deepen=1).state == SyncState.DIVERGED
+    assert not shallow_commits(str(second.root))